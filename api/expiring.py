@@ -0,0 +1,51 @@
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import json
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inventory_index
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        params = {name: values[-1] for name, values in parse_qs(urlparse(self.path).query).items()}
+        
+        # Expiry index is built once per data file version and reused while the instance is warm
+        parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        data_path = os.path.join(parent_dir, 'inventory_data.json')
+        
+        try:
+            index = inventory_index.load_index(data_path)
+            result = inventory_index.query_expiring(index, params)
+            status = 200
+            response = {'success': True, **result}
+        except FileNotFoundError:
+            status = 404
+            response = {'success': False, 'message': 'No inventory data'}
+        except KeyError as e:
+            status = 404
+            response = {'success': False, 'message': f'Sheet not found: {e.args[0]}'}
+        except ValueError as e:
+            status = 400
+            response = {'success': False, 'message': str(e)}
+        except Exception as e:
+            status = 500
+            response = {'success': False, 'message': f'Error: {str(e)}'}
+        
+        body = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
@@ -6,6 +6,8 @@ import sys
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import file_store
+
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         try:
@@ -32,42 +34,21 @@ class handler(BaseHTTPRequestHandler):
             parent_dir = os.path.dirname(current_dir)
             config_path = os.path.join(parent_dir, 'product_config.json')
             
-            # Load existing config
-            if os.path.exists(config_path):
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            else:
-                config = {
-                    "shelf_life_months": {
-                        "BAKING SODA": 36,
-                        "AZARINE": 36,
-                        "PIN FUJITSU": {}
-                    },
-                    "product_specific_shelf_life": {}
-                }
-            
             # Create unique key: LUÔN dùng format product_code_lot_number
             unique_key = f"{product_code}_{lot_number}"
             
-            # Update product-specific shelf life
-            if "product_specific_shelf_life" not in config:
-                config["product_specific_shelf_life"] = {}
-            
-            config["product_specific_shelf_life"][unique_key] = int(shelf_life_months)
-            
-            # Save config
-            with open(config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+            # Locked, write-ahead-logged, atomic update of the config file
+            file_store.update_product_shelf_life([(unique_key, int(shelf_life_months))], config_path)
             
-            # Run conversion
+            # Recalculate shelf life from the existing JSON (no Excel re-read)
             try:
-                import convert_to_json
+                import light_convert
                 
                 # Change to parent directory temporarily
                 old_cwd = os.getcwd()
                 os.chdir(parent_dir)
                 
-                convert_to_json.convert_excel_to_json()
+                light_convert.recalculate_shelf_life()
                 
                 os.chdir(old_cwd)
             except Exception as e:
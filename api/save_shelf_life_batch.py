@@ -0,0 +1,73 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import file_store
+
+class handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        try:
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data.decode('utf-8'))
+            
+            # Accept {"updates": [...]} or a bare list of {product_code, lot_number, shelf_life_months}
+            items = data.get('updates') if isinstance(data, dict) else data
+            try:
+                updates = file_store.shelf_life_updates(items)
+            except (ValueError, TypeError, AttributeError) as e:
+                self.send_response(400)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                response = json.dumps({'success': False, 'message': str(e)})
+                self.wfile.write(response.encode())
+                return
+            
+            # Get the directory of the current script
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            parent_dir = os.path.dirname(current_dir)
+            config_path = os.path.join(parent_dir, 'product_config.json')
+            
+            # One locked, atomic config write for the whole batch
+            file_store.update_product_shelf_life(updates, config_path)
+            
+            # One recalculation from the existing JSON for the whole batch
+            try:
+                import light_convert
+                
+                # Change to parent directory temporarily
+                old_cwd = os.getcwd()
+                os.chdir(parent_dir)
+                
+                light_convert.recalculate_shelf_life()
+                
+                os.chdir(old_cwd)
+            except Exception as e:
+                print(f"Conversion error: {e}")
+            
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            response = json.dumps({'success': True, 'message': 'Shelf lives saved successfully', 'saved': len(updates)})
+            self.wfile.write(response.encode())
+        
+        except Exception as e:
+            self.send_response(500)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            response = json.dumps({'success': False, 'message': f'Error: {str(e)}'})
+            self.wfile.write(response.encode())
+    
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
@@ -1,4 +1,5 @@
 from http.server import BaseHTTPRequestHandler
+import gzip
 import json
 import os
 import sys
@@ -8,148 +9,133 @@ from datetime import datetime
 # Add parent directory to path to import convert module
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import file_store
+from conversion_cache import ConversionCache
+from multipart_stream import get_boundary, parse_multipart
+
+# Conversion results keyed by workbook + config hash (kept in /tmp while the instance is warm)
+conversion_cache = ConversionCache(os.path.join(tempfile.gettempdir(), 'conversion_cache'))
+
+# Responses smaller than this are sent uncompressed (gzip overhead is not worth it)
+GZIP_MIN_BYTES = 1024
+
 class handler(BaseHTTPRequestHandler):
+    def send_json(self, status, payload):
+        """Serialize payload once and send it with Content-Length (gzip when the client accepts it)"""
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        accepted = file_store.accepted_encodings(self.headers.get('Accept-Encoding'))
+        encoding = None
+        if len(body) >= GZIP_MIN_BYTES and ('gzip' in accepted or '*' in accepted):
+            # Compressed per request, so favour speed over ratio
+            body = gzip.compress(body, compresslevel=6, mtime=0)
+            encoding = 'gzip'
+        
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+    
     def do_POST(self):
         try:
             # Get content length
             content_length = int(self.headers['Content-Length'])
-            
-            # Read the multipart data
-            content = self.rfile.read(content_length)
-            
-            # Parse multipart form data
             content_type = self.headers['Content-Type']
-            if 'boundary' not in content_type:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response = json.dumps({'success': False, 'message': 'No boundary in Content-Type'})
-                self.wfile.write(response.encode())
-                return
             
-            boundary = content_type.split('boundary=')[1].encode()
-            
-            # Split by boundary
-            parts = content.split(b'--' + boundary)
+            # Get the /tmp directory for Vercel
+            tmp_dir = tempfile.gettempdir()
             
-            file_data = None
-            filename = None
+            # Stream the multipart body in chunks, writing the file part straight into /tmp
+            try:
+                get_boundary(content_type)
+            except ValueError:
+                self.send_json(400, {'success': False, 'message': 'No boundary in Content-Type'})
+                return
             
-            for part in parts:
-                if b'Content-Disposition' in part and b'filename=' in part:
-                    # Extract filename
-                    disposition_line = part.split(b'\r\n')[1].decode()
-                    filename_start = disposition_line.find('filename="') + 10
-                    filename_end = disposition_line.find('"', filename_start)
-                    filename = disposition_line[filename_start:filename_end]
-                    
-                    # Extract file data
-                    file_start = part.find(b'\r\n\r\n') + 4
-                    file_end = part.rfind(b'\r\n')
-                    file_data = part[file_start:file_end]
-                    break
+            fields, files = parse_multipart(self.rfile, content_type, content_length, upload_dir=tmp_dir,
+                                          max_files=1)
+            uploaded = next(iter(files.values()), None)
             
-            if not file_data or not filename:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response = json.dumps({'success': False, 'message': 'No file uploaded'})
-                self.wfile.write(response.encode())
+            if uploaded is None or uploaded.size == 0 or not uploaded.filename:
+                if uploaded is not None:
+                    uploaded.discard()
+                self.send_json(400, {'success': False, 'message': 'No file uploaded'})
                 return
             
-            # Import conversion function
+            # Import conversion function (openpyxl engine: no pandas import on cold start, same output)
             try:
-                import convert_to_json
+                import light_convert
             except ImportError as e:
-                self.send_response(500)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response = json.dumps({'success': False, 'message': f'Import error: {str(e)}'})
-                self.wfile.write(response.encode())
+                self.send_json(500, {'success': False, 'message': f'Import error: {str(e)}'})
                 return
             
-            # Get the /tmp directory for Vercel
-            tmp_dir = tempfile.gettempdir()
-            
             # Add timestamp to filename to avoid conflicts
             timestamp = int(datetime.now().timestamp())
-            base_name, ext = os.path.splitext(filename)
+            base_name, ext = os.path.splitext(uploaded.filename)
             new_filename = f"{base_name}_{timestamp}{ext}"
             
-            # Save file to /tmp
             file_path = os.path.join(tmp_dir, new_filename)
-            with open(file_path, 'wb') as f:
-                f.write(file_data)
             
             # Run conversion directly
             try:
-                # Get parent directory and temp directory
+                # Get parent directory
                 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
                 
-                # On Vercel, we can only write to /tmp
-                # So we'll generate JSON and return it directly
-                output_path = os.path.join(tmp_dir, 'inventory_data.json')
+                # Locally the result is also saved as inventory_data.json next to the site;
+                # on Vercel only /tmp is writable and nothing reads a copy there, so it is only returned
+                output_path = os.path.join(parent_dir, 'inventory_data.json')
+                if not os.access(parent_dir, os.W_OK):
+                    output_path = None
                 
                 # Change to parent directory temporarily (for config file access)
                 current_dir = os.getcwd()
                 os.chdir(parent_dir)
-                
-                # Run conversion with the uploaded file path
-                result_data = convert_to_json.convert_excel_to_json(excel_file=file_path, output_file=output_path)
-                
-                os.chdir(current_dir)
-                
-                # Try to copy to parent directory (will work locally, fail on Vercel)
                 try:
-                    final_output = os.path.join(parent_dir, 'inventory_data.json')
-                    with open(output_path, 'r', encoding='utf-8') as src:
-                        with open(final_output, 'w', encoding='utf-8') as dst:
-                            dst.write(src.read())
-                except:
-                    pass  # Silently fail on Vercel
-                
-                # Read the generated JSON
-                with open(output_path, 'r', encoding='utf-8') as f:
-                    json_data = json.load(f)
-                # Read the generated JSON
-                with open(output_path, 'r', encoding='utf-8') as f:
-                    json_data = json.load(f)
+                    # Same workbook + same config -> reuse the cached result, skip the workbook parse
+                    cache_key = conversion_cache.make_key(uploaded.sha256, 'product_config.json')
+                    # No snapshot history or metrics log here: /tmp does not outlive the instance
+                    # (stage timings are still returned in metadata.metrics)
+                    result_data = light_convert.load_cached_conversion(conversion_cache, cache_key, output_path,
+                                                                       excel_file=uploaded.filename, history_dir=None,
+                                                                       metrics_file=None)
+                    
+                    if result_data is not None:
+                        uploaded.discard()
+                    else:
+                        # Keep the streamed file in /tmp under its final name
+                        uploaded.save_as(file_path)
+                        
+                        # Run conversion with the uploaded file path
+                        # metadata.source_file gets the uploaded name, as on the cached path
+                        result_data = light_convert.convert_excel_to_json(excel_file=file_path, output_file=output_path,
+                                                                          history_dir=None, metrics_file=None,
+                                                                          source_name=uploaded.filename)
+                        conversion_cache.put(cache_key, result_data)
+                finally:
+                    os.chdir(current_dir)
                 
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response = json.dumps({
+                # The in-memory result is serialized once, straight into the response
+                self.send_json(200, {
                     'success': True,
                     'message': 'File uploaded and converted successfully',
                     'filename': new_filename,
-                    'data': json_data
+                    'data': result_data
                 })
-                self.wfile.write(response.encode())
             except Exception as e:
-                self.send_response(500)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response = json.dumps({
+                self.send_json(500, {
                     'success': False,
                     'message': f'Conversion failed: {str(e)}'
                 })
-                self.wfile.write(response.encode())
                 
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = json.dumps({
+            self.send_json(500, {
                 'success': False,
                 'message': f'Error: {str(e)}'
             })
-            self.wfile.write(response.encode())
     
     def do_OPTIONS(self):
         self.send_response(200)
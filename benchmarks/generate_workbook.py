@@ -0,0 +1,104 @@
+"""
+Tạo file Excel tồn kho giả lập theo các mẫu file thật để đo hiệu năng chuyển đổi
+Các mẫu (layout):
+- coleman: sheet COLEMAN, header 1 dòng có cột "Mã"
+- grouped: sheet AZARINE và PIN FUJITSU, header 2 dòng (nhóm TỒN ĐẦU KỲ / CLOSING STOCK/ + Item Code, Q'TY/SL)
+- unlabeled: sheet UNLABELED, cột LOT và ĐVT không có tiêu đề (Column_X)
+
+Cách dùng:
+    python benchmarks/generate_workbook.py bench.xlsx --rows 10000 --layouts coleman grouped
+"""
+
+import argparse
+import random
+from datetime import datetime
+
+from openpyxl import Workbook
+
+LAYOUTS = ('coleman', 'grouped', 'unlabeled')
+
+# Các dạng LOT gặp trong file thật: YYMM, YYMMDD, YYYYMMDD, có tiền tố, số, ô trống...
+LOT_FORMATS = (
+    lambda r: f"{r.randint(24, 29)}{r.randint(1, 12):02d}",
+    lambda r: int(f"{r.randint(24, 29)}{r.randint(1, 12):02d}"),
+    lambda r: f"LOT{r.randint(24, 29)}{r.randint(1, 12):02d}{r.randint(1, 28):02d}",
+    lambda r: int(f"20{r.randint(24, 29)}{r.randint(1, 12):02d}{r.randint(1, 28):02d}"),
+    lambda r: f" {r.randint(24, 29)}{r.randint(1, 12):02d} ",
+    lambda r: None,
+    lambda r: '',
+)
+
+def random_lot(r):
+    return r.choice(LOT_FORMATS)(r)
+
+def add_coleman_sheet(workbook, rows, r):
+    """Header 1 dòng: Mã | Tên | ĐVT | Số lượng tồn, có dòng tiêu đề và dòng tổng"""
+    sheet = workbook.create_sheet('COLEMAN')
+    sheet.append(['BÁO CÁO TỒN KHO'])
+    sheet.append([])
+    sheet.append([None, f"Ngày {datetime.now():%d/%m}"])
+    sheet.append(['Mã', 'Tên', 'ĐVT', 'Số lượng tồn', None, 'Ghi chú'])
+    for i in range(rows):
+        code = str(1610000 + i) if i % 7 else 1610000 + i
+        name = r.choice(['COL_Áo ', 'Bình Coleman ', 'Mũ ']) + str(i) if i % 50 != 3 else None
+        quantity = r.choice([r.randint(0, 2000), r.randint(0, 100) + 0.5, None, ' 12 '])
+        sheet.append([code, name, r.choice(['Cái', 'Bộ']), quantity, None, r.choice([None, 'x'])])
+    sheet.append([])
+    sheet.append([None, None, None, 'Tổng'])
+
+def add_grouped_sheet(workbook, title, rows, r):
+    """Header 2 dòng: dòng nhóm (TỒN ĐẦU KỲ, CLOSING STOCK/...) + dòng chi tiết (Item Code, Q'TY/SL...)"""
+    sheet = workbook.create_sheet(title)
+    sheet.append(['CÔNG TY'])
+    sheet.append([])
+    sheet.append(['No.', 'THÔNG TIN KHÁCH HÀNG', None, None, 'LOT', 'TỒN ĐẦU KỲ', 'GOODS RECEIPT',
+                  'GOODS ISSUE', 'CLOSING STOCK/', 'EXPIRED DATE'])
+    sheet.append([None, 'Cus Code', 'Item Code', 'PRODUCTS', None, "Q'TY/SL", "Q'TY/SL", "Q'TY/SL",
+                  "Q'TY/SL", None])
+    for i in range(rows):
+        sheet.append([i + 1, 'C1', str(2310000 + i), f"Sản phẩm {title} {i}" if i % 17 else None,
+                      random_lot(r), r.randint(0, 20000), r.choice([0, None, 5]), r.choice([0, 2.25]),
+                      r.randint(0, 20000), datetime(2027, r.randint(1, 12), 1)])
+
+def add_unlabeled_sheet(workbook, rows, r):
+    """Cột LOT và ĐVT không có tiêu đề (được nhận diện theo nội dung)"""
+    sheet = workbook.create_sheet('UNLABELED')
+    sheet.append(['Item Code', 'Products', None, None, 'Closing stock'])
+    for i in range(rows):
+        sheet.append([str(6010000 + i), f"Pin Fujitsu loại dài tên {i}",
+                      r.choice([f"{r.randint(24, 29)}{r.randint(1, 12):02d}", f"LOT{r.randint(19, 29)}07"]),
+                      r.choice(['Chai', 'Hộp', 'Cái']), r.randint(0, 500)])
+
+def generate_workbook(path, rows_per_sheet=1000, layouts=LAYOUTS, seed=0):
+    """
+    Tạo workbook với rows_per_sheet dòng dữ liệu cho mỗi sheet của các layout đã chọn
+    Returns: danh sách tên sheet đã tạo
+    """
+    r = random.Random(seed)
+    # write_only: ghi thẳng từng dòng, không giữ cả sheet trong bộ nhớ
+    workbook = Workbook(write_only=True)
+    for layout in layouts:
+        if layout == 'coleman':
+            add_coleman_sheet(workbook, rows_per_sheet, r)
+        elif layout == 'grouped':
+            add_grouped_sheet(workbook, 'AZARINE', rows_per_sheet, r)
+            add_grouped_sheet(workbook, 'PIN FUJITSU', rows_per_sheet, r)
+        elif layout == 'unlabeled':
+            add_unlabeled_sheet(workbook, rows_per_sheet, r)
+        else:
+            raise ValueError(f"Layout không hợp lệ: {layout} (chọn trong {', '.join(LAYOUTS)})")
+    sheet_names = [sheet.title for sheet in workbook.worksheets]
+    workbook.save(path)
+    return sheet_names
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tạo file Excel tồn kho giả lập để đo hiệu năng")
+    parser.add_argument('output', help="Đường dẫn file .xlsx")
+    parser.add_argument('--rows', type=int, default=1000, help="Số dòng dữ liệu mỗi sheet (mặc định: 1000)")
+    parser.add_argument('--layouts', nargs='+', choices=LAYOUTS, default=list(LAYOUTS),
+                        help="Các mẫu sheet cần tạo (mặc định: tất cả)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sheets = generate_workbook(args.output, args.rows, args.layouts, args.seed)
+    print(f"✓ Đã tạo {args.output}: {len(sheets)} sheet ({', '.join(sheets)}), {args.rows} dòng/sheet")
@@ -0,0 +1,221 @@
+"""
+Đo thời gian từng bước của convert_excel_to_json trên các file Excel giả lập
+(đọc file, tìm dòng header, lọc cột, tạo dòng sản phẩm, tính hạn sử dụng, ghi JSON)
+Kết quả được in ra, so sánh với lần chạy trước cùng cấu hình và ghi thêm vào benchmarks/results.jsonl
+
+Cách dùng:
+    python benchmarks/run_benchmarks.py                      # 1k, 10k, 100k dòng/sheet
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 --repeat 3
+    python benchmarks/run_benchmarks.py --compact --layouts grouped
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import pandas as pd
+
+import convert_to_json
+import file_store
+from generate_workbook import LAYOUTS, generate_workbook
+
+WORKBOOK_DIR = os.path.join(BENCH_DIR, '.workbooks')
+RESULTS_FILE = os.path.join(BENCH_DIR, 'results.jsonl')
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+# Bước -> (module, tên hàm) được đo thời gian
+STAGES = (
+    ('read', convert_to_json, 'read_workbook_sheets'),
+    ('header_detection', convert_to_json, 'find_data_start_row'),
+    ('column_filtering', convert_to_json, 'detect_sheet_layout'),
+    ('row_materialization', convert_to_json, 'extract_sheet_data'),
+    ('shelf_life', convert_to_json, 'calculate_remaining_percentages'),
+    ('json_write', file_store, 'write_inventory'),
+)
+# Chậm hơn lần trước quá ngưỡng này thì đánh dấu
+REGRESSION_THRESHOLD = 0.10
+
+@contextlib.contextmanager
+def instrument_stages(timings):
+    """Bọc tạm các hàm của từng bước để cộng dồn thời gian chạy vào timings[bước]"""
+    originals = []
+
+    def timed(stage, func):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+        return wrapper
+
+    def timed_generator(stage, func):
+        # read_workbook_sheets là generator: đo thời gian của từng lần lấy sheet tiếp theo
+        def wrapper(*args, **kwargs):
+            generator = func(*args, **kwargs)
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+                finally:
+                    timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+                yield item
+        return wrapper
+
+    for stage, module, name in STAGES:
+        func = getattr(module, name)
+        originals.append((module, name, func))
+        wrap = timed_generator if name == 'read_workbook_sheets' else timed
+        setattr(module, name, wrap(stage, func))
+    try:
+        yield timings
+    finally:
+        for module, name, func in originals:
+            setattr(module, name, func)
+
+def workbook_path(rows, layouts, seed):
+    """File Excel giả lập (tạo 1 lần, dùng lại cho các lần chạy sau)"""
+    os.makedirs(WORKBOOK_DIR, exist_ok=True)
+    path = os.path.join(WORKBOOK_DIR, f"bench_{'-'.join(layouts)}_{rows}_s{seed}.xlsx")
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        generate_workbook(path, rows, layouts, seed)
+        print(f"  ✓ Đã tạo {os.path.basename(path)} ({time.perf_counter() - started:.1f}s)")
+    return path
+
+def run_once(excel_file, compact=False):
+    """
+    Chuyển đổi 1 lần trong thư mục tạm (cấu hình mặc định, không dùng cache bố cục / lịch sử)
+    Returns: (tổng thời gian, thời gian từng bước, số sản phẩm)
+    """
+    timings = {}
+    old_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='inventory_bench_') as work_dir:
+        os.chdir(work_dir)
+        try:
+            with instrument_stages(timings), contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                inventory_data = convert_to_json.convert_excel_to_json(
+                    excel_file, 'inventory_data.json', compact=compact,
+                    history_dir=None, layout_cache_file=None)
+                total = time.perf_counter() - started
+        finally:
+            os.chdir(old_cwd)
+    timings['other'] = max(total - sum(timings.values()), 0.0)
+    return total, timings, inventory_data['metadata']['total_products']
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_results():
+    results = []
+    try:
+        with open(RESULTS_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    results.append(json.loads(line))
+    except FileNotFoundError:
+        pass
+    return results
+
+def previous_result(results, record):
+    """Lần chạy gần nhất cùng cấu hình (số dòng, layout, compact)"""
+    for result in reversed(results):
+        if all(result.get(key) == record[key] for key in ('rows_per_sheet', 'layouts', 'compact')):
+            return result
+    return None
+
+def format_row(label, values):
+    return f"{label:<22}" + ''.join(f"{value:>12}" for value in values)
+
+def print_report(records, previous):
+    stage_names = [stage for stage, _, _ in STAGES] + ['other', 'total']
+    print()
+    print(format_row('Bước (ms)', [f"{record['rows_per_sheet']:,}" for record in records]))
+    for stage in stage_names:
+        cells = []
+        for record in records:
+            seconds = record['total'] if stage == 'total' else record['stages'].get(stage, 0.0)
+            cell = f"{seconds * 1000:.0f}"
+            before = previous.get(record['rows_per_sheet'])
+            if before:
+                old = before['total'] if stage == 'total' else before['stages'].get(stage, 0.0)
+                if old > 0 and seconds > old * (1 + REGRESSION_THRESHOLD) and seconds - old > 0.005:
+                    cell = f"⚠{cell}"
+            cells.append(cell)
+        print(format_row(stage, cells))
+    print(format_row('products', [f"{record['products']:,}" for record in records]))
+
+    for record in records:
+        before = previous.get(record['rows_per_sheet'])
+        if before:
+            change = (record['total'] - before['total']) / before['total'] * 100
+            print(f"  {record['rows_per_sheet']:,} dòng/sheet: {change:+.1f}% so với lần chạy "
+                  f"{before['timestamp']} ({before.get('git') or '?'})")
+    print(f"\n⚠ = chậm hơn lần chạy trước quá {REGRESSION_THRESHOLD:.0%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo hiệu năng chuyển đổi Excel -> JSON theo từng bước")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="Số dòng mỗi sheet (mặc định: 1000 10000 100000)")
+    parser.add_argument('--layouts', nargs='+', choices=LAYOUTS, default=list(LAYOUTS))
+    parser.add_argument('--repeat', type=int, default=1, help="Số lần chạy mỗi cỡ, lấy lần nhanh nhất")
+    parser.add_argument('--compact', action='store_true', help="Đo với output dạng cột gọn")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-save', action='store_true', help=f"Không ghi kết quả vào {RESULTS_FILE}")
+    args = parser.parse_args()
+
+    results = load_results()
+    records = []
+    previous = {}
+    revision = git_revision()
+    for rows in args.sizes:
+        print(f"📊 {rows:,} dòng/sheet ({', '.join(args.layouts)})")
+        excel_file = workbook_path(rows, args.layouts, args.seed)
+        runs = [run_once(excel_file, args.compact) for _ in range(max(args.repeat, 1))]
+        total, timings, products = min(runs, key=lambda run: run[0])
+        record = {
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'git': revision,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'rows_per_sheet': rows,
+            'layouts': args.layouts,
+            'compact': args.compact,
+            'repeat': len(runs),
+            'products': products,
+            'total': round(total, 4),
+            'stages': {stage: round(seconds, 4) for stage, seconds in timings.items()}
+        }
+        previous[rows] = previous_result(results, record)
+        records.append(record)
+
+    print_report(records, previous)
+
+    if not args.no_save:
+        with open(RESULTS_FILE, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print(f"✓ Đã ghi kết quả vào {os.path.relpath(RESULTS_FILE, ROOT_DIR)}")
+
+if __name__ == "__main__":
+    main()
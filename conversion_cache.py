@@ -0,0 +1,99 @@
+"""
+Cache kết quả chuyển đổi theo nội dung file Excel
+Key = hash nội dung workbook + hash product_config.json
+Upload lại cùng một file (cùng cấu hình) sẽ lấy ngay kết quả cũ, không cần đọc lại bằng pandas
+"""
+
+import hashlib
+import json
+import os
+
+CACHE_DIR = '.conversion_cache'
+MAX_CACHE_BYTES = 100 * 1024 * 1024  # 100 MB
+
+def hash_bytes(data):
+    """Hash SHA-256 của dữ liệu (bytes)"""
+    return hashlib.sha256(data).hexdigest()
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Hash SHA-256 của file, đọc từng phần để không giữ cả file trong bộ nhớ"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ConversionCache:
+    """
+    Lưu inventory_data đã chuyển đổi trong thư mục cache, mỗi key một file JSON
+    Khi tổng dung lượng vượt max_bytes, xóa các file lâu không dùng nhất (theo mtime)
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def make_key(self, workbook_hash, config_path='product_config.json', config=None):
+        """
+        Tạo key từ hash workbook và hash cấu hình thời hạn hiện tại
+        config: cấu hình đã load sẵn (khi cấu hình nằm trong database thay vì file)
+        """
+        if config is not None:
+            config_hash = hash_bytes(json.dumps(config, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        else:
+            try:
+                config_hash = hash_file(config_path)
+            except OSError:
+                config_hash = hash_bytes(b'')
+        return f"{workbook_hash[:32]}_{config_hash[:16]}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Lấy inventory_data đã cache, None nếu chưa có"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Đánh dấu vừa dùng để không bị xóa sớm
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, inventory_data):
+        """Lưu inventory_data vào cache rồi dọn bớt nếu vượt dung lượng"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(inventory_data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Xóa các file cache cũ nhất cho đến khi tổng dung lượng <= max_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_bytes -= size
+            except OSError:
+                pass
@@ -0,0 +1,226 @@
+"""
+Đo thời gian và bộ nhớ của từng bước chuyển đổi (đọc Excel, xác định bố cục, tạo dòng, tính hạn, ghi file...)
+- ConversionMetrics: đo 1 lần chuyển đổi, theo bước và theo sheet (kèm số dòng / số cột)
+- Bộ nhớ mặc định lấy theo RSS của process (rẻ, không làm chậm chuyển đổi);
+  trace_memory=True dùng tracemalloc để có đỉnh bộ nhớ chính xác của từng bước (chậm hơn nhiều lần)
+- record_metrics / load_recent_metrics: lưu các lần chuyển đổi gần đây vào conversion_metrics.jsonl
+- summarize_metrics: phân vị (p50, p90, p95, p99) thời gian từng bước trên các lần gần đây cho /metrics
+Module này không phụ thuộc pandas để dùng được từ server và các API nhẹ
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import file_store
+
+METRICS_FILE = 'conversion_metrics.jsonl'
+# Số lần chuyển đổi gần nhất được giữ trong file (file được cắt bớt khi dài gấp đôi)
+METRICS_KEEP = 500
+PERCENTILES = (50, 90, 95, 99)
+
+MB = 1024 * 1024
+
+def current_rss_mb():
+    """Bộ nhớ thực (RSS) hiện tại của process, None nếu hệ điều hành không hỗ trợ"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf('SC_PAGE_SIZE') / MB, 1)
+
+def peak_rss_mb():
+    """Đỉnh RSS của process từ lúc khởi động (ru_maxrss: KB trên Linux, byte trên macOS)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (MB if sys.platform == 'darwin' else 1024), 1)
+
+def merge_stage(stages, name, stats):
+    """Cộng dồn thời gian của bước (bước chạy cho nhiều sheet), bộ nhớ lấy giá trị lớn nhất"""
+    current = stages.get(name)
+    if current is None:
+        stages[name] = dict(stats)
+        return
+    current['seconds'] += stats['seconds']
+    for key, value in stats.items():
+        if key != 'seconds' and value is not None:
+            current[key] = value if current.get(key) is None else max(current[key], value)
+
+class ConversionMetrics:
+    """Số liệu của 1 lần chuyển đổi: thời gian, bộ nhớ theo bước và theo sheet"""
+    def __init__(self, trace_memory=False):
+        # Không bật lại tracemalloc nếu nơi khác đang dùng (để không dừng nhầm của họ)
+        self.trace_memory = trace_memory and not tracemalloc.is_tracing()
+        if self.trace_memory:
+            tracemalloc.start()
+        self.started = time.perf_counter()
+        self.rss_start_mb = current_rss_mb()
+        self.stages = {}
+        self.sheets = {}
+        self.total_seconds = None
+
+    def _begin(self):
+        traced = None
+        if self.trace_memory:
+            traced = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        return time.perf_counter(), traced
+
+    def _end(self, name, begun, sheet_name=None):
+        started, traced = begun
+        # Không ghi ru_maxrss theo bước: đó là đỉnh từ lúc process khởi động, không phải của bước này
+        stats = {
+            'seconds': time.perf_counter() - started,
+            'rss_mb': current_rss_mb()
+        }
+        if traced is not None:
+            # Bộ nhớ cấp phát thêm cao nhất trong bước (so với lúc bắt đầu bước)
+            stats['peak_mb'] = round((tracemalloc.get_traced_memory()[1] - traced) / MB, 1)
+        merge_stage(self.stages, name, stats)
+        if sheet_name is not None:
+            merge_stage(self.sheet(sheet_name)['stages'], name, stats)
+
+    @contextmanager
+    def stage(self, name, sheet_name=None):
+        """Đo 1 bước (sheet_name: ghi thêm vào số liệu của sheet đó)"""
+        begun = self._begin()
+        try:
+            yield
+        finally:
+            self._end(name, begun, sheet_name)
+
+    def iterate(self, name, iterable, sheet_of=None):
+        """
+        Đo thời gian lấy từng phần tử của iterable (ví dụ generator đọc từng sheet)
+        sheet_of(item): tên sheet của phần tử, để ghi thời gian vào sheet đó
+        """
+        iterator = iter(iterable)
+        while True:
+            begun = self._begin()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._end(name, begun)
+                return
+            except BaseException:
+                self._end(name, begun)
+                raise
+            self._end(name, begun, sheet_of(item) if sheet_of else None)
+            yield item
+
+    def sheet(self, sheet_name, **info):
+        """Số liệu của sheet (tạo mới nếu chưa có), info: số dòng, số cột..."""
+        entry = self.sheets.setdefault(sheet_name, {'sheet_name': sheet_name, 'stages': {}})
+        entry.update(info)
+        return entry
+
+    def finish(self):
+        """Kết thúc đo (dừng tracemalloc nếu đã bật); gọi lại được, lần sau cập nhật tổng thời gian"""
+        self.total_seconds = time.perf_counter() - self.started
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return self.to_dict()
+
+    def to_dict(self):
+        def rounded(stages):
+            return {name: {key: round(value, 4) if key == 'seconds' else value
+                           for key, value in stats.items()}
+                    for name, stats in stages.items()}
+        total = self.total_seconds if self.total_seconds is not None else time.perf_counter() - self.started
+        return {
+            'total_seconds': round(total, 4),
+            'rss_start_mb': self.rss_start_mb,
+            'peak_rss_mb': peak_rss_mb(),
+            'memory_traced': self.trace_memory,
+            'stages': rounded(self.stages),
+            'sheets': [dict(sheet, stages=rounded(sheet['stages'])) for sheet in self.sheets.values()]
+        }
+
+def record_metrics(metrics, metrics_file=METRICS_FILE, keep=METRICS_KEEP, **info):
+    """
+    Ghi thêm số liệu 1 lần chuyển đổi vào metrics_file (1 dòng JSON), info: file nguồn, cached, lỗi...
+    Chỉ giữ keep lần gần nhất: khi file dài gấp đôi thì ghi lại (nguyên tử) phần cuối
+    """
+    if not metrics_file:
+        return
+    entry = {'finished_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    entry.update(info)
+    entry.update(metrics)
+    line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+    try:
+        with file_store.file_lock(metrics_file):
+            with open(metrics_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+            with open(metrics_file, 'rb') as f:
+                lines = f.readlines()
+            if len(lines) > 2 * keep:
+                file_store.atomic_write_bytes(metrics_file, b''.join(lines[-keep:]))
+    except OSError as e:
+        # Không ghi được số liệu không được làm hỏng lần chuyển đổi
+        print(f"⚠ Không ghi được số liệu chuyển đổi: {e}")
+
+def load_recent_metrics(metrics_file=METRICS_FILE, limit=100):
+    """limit lần chuyển đổi gần nhất (cũ -> mới), bỏ qua dòng hỏng"""
+    try:
+        with open(metrics_file, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    records = []
+    for line in lines[-limit:] if limit else lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+def percentile(values, q):
+    """Phân vị q (0-100) theo nội suy tuyến tính giữa 2 giá trị gần nhất"""
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def distribution(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    summary = {f"p{q}": round(percentile(values, q), 4) for q in PERCENTILES}
+    summary['max'] = round(max(values), 4)
+    summary['count'] = len(values)
+    return summary
+
+def max_rss_mb(record):
+    """RSS cao nhất đo được trong các bước của 1 lần chuyển đổi"""
+    values = [stats['rss_mb'] for stats in record.get('stages', {}).values() if stats.get('rss_mb') is not None]
+    return max(values, default=None)
+
+def summarize_metrics(records):
+    """Phân vị tổng thời gian, thời gian từng bước và RSS cao nhất trên các lần chuyển đổi"""
+    stage_names = list(dict.fromkeys(name for record in records for name in record.get('stages', {})))
+    return {
+        'conversions': len(records),
+        'cached': sum(1 for record in records if record.get('cached')),
+        'errors': sum(1 for record in records if record.get('error')),
+        'total_seconds': distribution(record.get('total_seconds') for record in records),
+        'stages': {
+            name: distribution(record['stages'][name]['seconds']
+                               for record in records if name in record.get('stages', {}))
+            for name in stage_names
+        },
+        'rss_mb': distribution(max_rss_mb(record) for record in records)
+    }
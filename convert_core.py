@@ -0,0 +1,1043 @@
+"""
+Phần dùng chung của các engine chuyển đổi Excel -> JSON (không phụ thuộc pandas)
+- Luật nhận diện header, thống kê cột và chọn cột hiển thị
+- Tính hạn sử dụng theo LOT, cấu hình thời hạn, lưu kết quả / lịch sử / bố cục sheet
+- Quy trình chuyển đổi (convert_workbook) chạy trên 1 engine:
+  convert_to_json (pandas) hoặc light_convert (openpyxl, cho serverless)
+
+Engine là module cung cấp: read_workbook_sheets, find_data_start_row, detect_sheet_layout,
+layout_fingerprint, extract_sheet_data, calculate_remaining_percentages, format_dates
+Engine theo luồng (stream_convert) cung cấp thêm extract_sheet_chunks và store_products
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta
+
+import conversion_metrics
+import file_store
+import history_store
+import sqlite_store
+
+# Bố cục các sheet đã xác định (dòng header, cột được chọn), dùng lại khi header không đổi
+LAYOUT_CACHE_FILE = 'layout_cache.json'
+
+# Số giá trị mẫu đầu tiên của mỗi cột mà các heuristic dò cột xem xét
+PROFILE_SAMPLE_SIZE = 20
+
+class ConversionError(Exception):
+    """
+    Lỗi khi chuyển đổi Excel sang JSON, kèm thông tin file/sheet đang xử lý
+    Lỗi gốc được giữ trong __cause__
+    """
+    def __init__(self, message, excel_file=None, sheet_name=None):
+        super().__init__(message)
+        self.excel_file = excel_file
+        self.sheet_name = sheet_name
+
+    def to_dict(self):
+        """Thông tin lỗi dạng dict để trả về qua API"""
+        cause = self.__cause__
+        return {
+            'error_type': type(cause).__name__ if cause else type(self).__name__,
+            'message': str(self),
+            'excel_file': self.excel_file,
+            'sheet_name': self.sheet_name
+        }
+
+def find_excel_file():
+    """Tự động tìm file Excel trong thư mục hiện tại"""
+    excel_files = glob.glob("*.xlsx") + glob.glob("*.xls")
+
+    # Loại bỏ file tạm (bắt đầu với ~$)
+    excel_files = [f for f in excel_files if not os.path.basename(f).startswith('~$')]
+
+    if not excel_files:
+        raise FileNotFoundError("Không tìm thấy file Excel nào trong thư mục!")
+
+    # Sắp xếp theo thời gian sửa đổi, lấy file mới nhất
+    excel_files.sort(key=os.path.getmtime, reverse=True)
+    return excel_files[0]
+
+def is_missing(value):
+    """Ô trống: None hoặc NaN / NaT (giống pd.isna cho 1 giá trị)"""
+    if value is None:
+        return True
+    try:
+        return bool(value != value)
+    except TypeError:
+        # pd.NA: so sánh trả về NA, không có giá trị đúng / sai
+        return True
+
+class HeaderMatcher:
+    """
+    Nhận diện dòng header theo các luật (từ khóa A, [từ khóa B...]): dòng là header
+    nếu chứa A và ít nhất 1 từ khóa B (không phân biệt hoa thường)
+    Các luật được biên dịch sẵn thành regex, dùng cho 1 chuỗi hoặc cả Series chuỗi
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        # Mọi luật gộp thành 1 regex: mỗi luật là 2 lookahead (có A, có 1 trong các B)
+        self.pattern = re.compile('|'.join(
+            f"^(?=.*{re.escape(first)})(?=.*(?:{'|'.join(re.escape(keyword) for keyword in others)}))"
+            for first, others in rules), re.DOTALL)
+
+    def matches(self, text):
+        """Chuỗi (1 ô hoặc cả dòng đã ghép) có khớp luật nào không"""
+        return self.pattern.search(str(text).lower()) is not None
+
+    def match_rows(self, texts):
+        """Series chuỗi -> mảng bool (vectorized, 1 lần str.contains cho mọi luật)"""
+        return texts.str.lower().str.contains(self.pattern).to_numpy(dtype=bool)
+
+# Luật nhận diện header: 'mã' + 'tên'/'sản phẩm', 'item code' + 'products', 'no.' + 'lot'
+HEADER_RULES = (
+    ('mã', ('tên', 'sản phẩm')),
+    ('item code', ('products',)),
+    ('no.', ('lot',)),
+)
+HEADER_MATCHER = HeaderMatcher(HEADER_RULES)
+
+# Số dòng đầu sheet được dò tìm header
+HEADER_SCAN_ROWS = 100
+
+def clean_column_name(col_name):
+    """
+    Làm sạch tên cột, loại bỏ các ký tự không cần thiết
+    """
+    if is_missing(col_name) or str(col_name).strip() == '':
+        return None
+
+    col_name = str(col_name).strip()
+    # Loại bỏ các tên cột dạng "Column_X"
+    if col_name.startswith('Column_'):
+        return None
+
+    return col_name
+
+class ColumnProfile:
+    """
+    Thống kê của 1 cột mà các heuristic dò cột cần, tính sẵn 1 lần:
+    số ô có dữ liệu và các giá trị mẫu đầu tiên (dạng chuỗi) kèm đặc điểm của từng mẫu
+    """
+    def __init__(self, non_null, samples):
+        self.non_null = int(non_null)
+        self.texts = [str(value) for value in samples]
+        self.lengths = [len(text) for text in self.texts]
+        self.non_blank = [bool(text.strip()) for text in self.texts]
+        self.digit_first = [text[:1].isdigit() for text in self.texts]
+        self.has_dash = ['-' in text for text in self.texts]
+        self.has_digit = [any(c.isdigit() for c in text) for text in self.texts]
+
+    def sample_size(self, n):
+        """Số mẫu trong n giá trị đầu (tương đương len(df[col].dropna().head(n)))"""
+        return min(n, len(self.texts))
+
+    def avg_length(self, n):
+        size = self.sample_size(n)
+        return sum(self.lengths[:size]) / size if size else 0
+
+    def code_like(self, n=10):
+        """Phần lớn mẫu bắt đầu bằng chữ số (cột mã không có tiêu đề)"""
+        size = self.sample_size(n)
+        matches = sum(1 for i in range(size) if self.non_blank[i] and self.digit_first[i])
+        return size > 0 and matches > size * 0.3
+
+    def product_like(self, n=20, min_samples=5):
+        """Dạng '123-Tên sản phẩm': bắt đầu bằng số và có dấu gạch"""
+        size = self.sample_size(n)
+        matches = sum(1 for i in range(size) if self.non_blank[i] and self.has_dash[i] and self.digit_first[i])
+        return size >= min_samples and matches > size * 0.5
+
+    def lot_like(self, n=20):
+        """Giá trị ngắn (<= 10 ký tự) có chứa chữ số"""
+        size = self.sample_size(n)
+        matches = sum(1 for i in range(size) if self.non_blank[i] and self.lengths[i] <= 10 and self.has_digit[i])
+        return matches > size * 0.5
+
+    def unit_like(self, n=20):
+        """Chữ ngắn như "Chai", "Hộp", "Cái" (không mẫu nào bắt đầu bằng số)"""
+        size = self.sample_size(n)
+        return self.avg_length(n) < 10 and all(not self.digit_first[i] for i in range(size) if self.non_blank[i])
+
+def merge_header_rows(first_header, second_row):
+    """
+    Tên cột từ dòng header (và dòng kế tiếp nếu đó mới là header chi tiết)
+    Returns: (headers, header_rows) - header_rows: số dòng header (1 hoặc 2)
+    """
+    # Nếu dòng tiếp theo có "Item Code" hoặc "Products", nghĩa là đây mới là header thực
+    has_real_header_next = any(str(val).lower() in ['item code', 'products', 'cus code']
+                                for val in second_row if not is_missing(val))
+
+    if not has_real_header_next:
+        # Header  bình thường
+        headers = [clean_column_name(h) if clean_column_name(h) else f"Column_{i}"
+                   for i, h in enumerate(first_header)]
+        return headers, 1
+
+    # Có 2 dòng header: dòng 1 là nhóm (TỒN ĐẦU KỲ, CLOSING STOCK/, ...), dòng 2 là chi tiết
+    # Nhưng các cột "Q'TY/SL" ở dòng 2 cần được map với nhóm ở dòng 1
+
+    # Tạo map vị trí cột -> tên nhóm
+    group_map = {}
+    current_group = None
+    for i, val in enumerate(first_header):
+        if not is_missing(val) and str(val).strip():
+            current_group = str(val).strip()
+        if current_group:
+            group_map[i] = current_group
+
+    # Merge header
+    headers = []
+    for i, h2 in enumerate(second_row):
+        if not is_missing(h2) and str(h2).strip():
+            h2_str = str(h2).strip()
+            # Nếu là "Q'TY/SL" và có group, dùng tên group
+            if h2_str.lower() in ["q'ty/sl", "qty/sl"] and i in group_map:
+                headers.append(group_map[i])
+            else:
+                headers.append(h2_str)
+        elif i < len(first_header) and not is_missing(first_header[i]) and str(first_header[i]).strip():
+            headers.append(str(first_header[i]).strip())
+        else:
+            headers.append(f"Column_{i}")
+
+    # Dữ liệu bắt đầu từ dòng start_row + 2
+    return headers, 2
+
+def find_product_column(headers, raw_profiles):
+    """
+    Cột "Tên sản phẩm" / "Products": theo tên cột, nếu không có thì tìm cột Column_X
+    có nội dung giống tên sản phẩm (dạng '123-Tên')
+    raw_profiles(): thống kê các cột trước khi lọc dòng (chỉ tính khi cần)
+    """
+    for col in headers:
+        if not col:
+            continue
+        col_lower = str(col).lower()
+        # Tìm theo tên cột rõ ràng
+        if 'product' in col_lower or 'tên' in col_lower:
+            return col
+
+    for col, profile in zip(headers, raw_profiles()):
+        if col and col.startswith('Column_'):
+            # Kiểm tra pattern: số ở đầu, theo sau là dấu gạch và text
+            if profile.product_like(20, min_samples=5):
+                return col
+    return None
+
+def name_unlabeled_columns(headers, column_profiles):
+    """Tự động đặt tên cho cột LOT và Units nếu thiếu tiêu đề (Column_X)"""
+    renamed_headers = []
+    for i, col in enumerate(headers):
+        if col.startswith('Column_'):
+            # Kiểm tra nội dung để xác định loại cột
+            profile = column_profiles[i]
+            if profile.sample_size(20) > 0:
+                # Kiểm tra xem có phải LOT không (có pattern số + chữ)
+                has_lot_pattern = profile.lot_like(20)
+
+                # Kiểm tra xem có phải Units không (text ngắn như "Chai", "Hộp", "Cái")
+                avg_length = profile.avg_length(20)
+                has_unit_pattern = profile.unit_like(20)
+
+                if has_lot_pattern and avg_length < 15:
+                    renamed_headers.append('LOT')
+                elif has_unit_pattern and avg_length < 10:
+                    renamed_headers.append('ĐVT')
+                else:
+                    renamed_headers.append(col)
+            else:
+                renamed_headers.append(col)
+        else:
+            renamed_headers.append(col)
+    return renamed_headers
+
+def select_columns(headers, profiles, sheet_name=None):
+    """
+    Lọc các cột theo logic: Mã/Item Code, Tên/Products, Lot, Tồn đầu kỳ, Tồn cuối kỳ/CLOSING STOCK/Số lượng tồn
+    Sheet COLEMAN: Dùng cột A (Mã)
+    Các sheet khác: Ưu tiên cột E (Item Code)
+    profiles: tên cột -> ColumnProfile
+    Returns: [(tên hiển thị, tên cột gốc)]
+    """
+    # 1. Tìm cột Mã
+    ma_col = None
+
+    # Nếu KHÔNG phải sheet COLEMAN, ưu tiên cột "Item Code"
+    if sheet_name and sheet_name.upper() != 'COLEMAN':
+        # Tìm cột có tên chứa "Item Code"
+        for i, col in enumerate(headers):
+            if col:
+                col_lower = str(col).lower()
+                # Tìm cột có tên chính xác là "Item Code"
+                if col_lower == 'item code' or ('item' in col_lower and 'code' in col_lower):
+                    if profiles[col].non_null > 0:
+                        ma_col = col
+                        print(f"  ✓ Tìm thấy cột Mã (Item Code) tại index {i}: {col}")
+                        break
+
+    # Nếu không tìm thấy Item Code hoặc là sheet COLEMAN, tìm theo cách cũ
+    if not ma_col:
+        for col in headers:
+            if col:
+                col_lower = col.lower()
+                # Kiểm tra tên cột
+                if ('mã' in col_lower or 'item code' in col_lower or col_lower == 'ad' or col_lower == 'no.') and \
+                   not any(x in col_lower for x in ['cus', 'customer', 'warehouse', 'thông tin']):
+                    if profiles[col].non_null > 0:
+                        ma_col = col
+                        print(f"  ✓ Tìm thấy cột Mã: {col}")
+                        break
+                # Kiểm tra nội dung cột - nếu nhiều giá trị có dạng số-chữ (mã sản phẩm)
+                elif col.startswith('Column_'):
+                    # Kiểm tra xem có phải cột chứa mã không (có số ở đầu)
+                    if profiles[col].code_like(10):
+                        ma_col = col
+                        break
+
+    # 2. Tìm cột Tên / Products (cho phép cả Column_X nếu chứa tên dài)
+    ten_col = None
+    for col in headers:
+        if col and col != ma_col:
+            col_lower = col.lower()
+            # Kiểm tra tên cột
+            if 'tên' in col_lower or 'products' in col_lower or 'product' in col_lower:
+                if profiles[col].non_null > 0:
+                    ten_col = col
+                    break
+            # Kiểm tra nội dung - nếu có text dài (tên sản phẩm thường dài)
+            elif col.startswith('Column_'):
+                # Tên sản phẩm thường dài hơn 15 ký tự
+                if profiles[col].sample_size(10) > 0 and profiles[col].avg_length(10) > 15:
+                    ten_col = col
+                    break
+
+    # 3. Tìm cột LOT / Lô
+    lot_col = None
+    for col in headers:
+        if col:
+            col_lower = col.lower()
+            if 'lot' in col_lower or col_lower == 'lô':
+                if profiles[col].non_null > 0:
+                    lot_col = col
+                    break
+
+    # 4. Tìm cột Tồn đầu kỳ
+    ton_dau_col = None
+    for col in headers:
+        if col:
+            col_lower = col.lower()
+            if 'tồn đầu' in col_lower or 'đầu kỳ' in col_lower or 'opening' in col_lower or col_lower == 'tồn đầu kỳ':
+                if profiles[col].non_null > 0:
+                    ton_dau_col = col
+                    break
+
+    # 5. Tìm cột Tồn cuối kỳ / CLOSING STOCK / Số lượng tồn
+    ton_cuoi_col = None
+    for col in headers:
+        if col:
+            col_lower = col.lower()
+            if any(keyword in col_lower for keyword in ['closing stock', 'tồn cuối', 'cuối kỳ', 'số lượng tồn', 'closing']):
+                if profiles[col].non_null > 0:
+                    ton_cuoi_col = col
+                    break
+
+    # Bỏ cột EXPIRED DATE vì đã có cột "Ngày hết hạn" tính từ LOT
+
+    # Sắp xếp các cột theo thứ tự logic và đặt tên đẹp hơn
+    renamed_cols = []
+    if ma_col:
+        # Đổi tên cột mã cho đẹp - LUÔN dùng "Mã" để thống nhất
+        if ma_col == 'No.' or ma_col == 'AD' or ma_col == 'Item Code':
+            renamed_cols.append(('Mã', ma_col))
+        else:
+            renamed_cols.append((ma_col, ma_col))
+    if ten_col:
+        # Đổi tên cột tên cho đẹp
+        if ten_col.startswith('Column_'):
+            renamed_cols.append(('Tên sản phẩm', ten_col))
+        else:
+            renamed_cols.append((ten_col, ten_col))
+    if lot_col:
+        renamed_cols.append((lot_col, lot_col))
+    if ton_dau_col:
+        renamed_cols.append((ton_dau_col, ton_dau_col))
+    if ton_cuoi_col:
+        renamed_cols.append((ton_cuoi_col, ton_cuoi_col))
+
+    return renamed_cols
+
+def build_layout(start_row, header_rows, product_position, headers, positions, column_profiles, sheet_name=None):
+    """
+    Chọn cột hiển thị và tạo bố cục sheet
+    headers / column_profiles: các cột còn dữ liệu sau khi lọc dòng, positions: vị trí gốc của chúng trong sheet
+    Returns: dict bố cục dùng cho extract_sheet_data (vị trí cột tính theo lưới thô của sheet)
+    """
+    # Tên cột trùng nhau: dùng cột đầu tiên (giống vị trí cột được chọn bên dưới)
+    profiles = {}
+    for col, profile in zip(headers, column_profiles):
+        profiles.setdefault(col, profile)
+    column_mapping = select_columns(headers, profiles, sheet_name)
+
+    if not column_mapping:
+        # Fallback: giữ tất cả cột có dữ liệu
+        column_mapping = [(col, col) for col in headers if profiles[col].non_null > 0]
+
+    return {
+        'start_row': int(start_row),
+        'header_rows': header_rows,
+        'product_column': product_position,
+        # [tên hiển thị, tên cột gốc, vị trí cột trong sheet]
+        'columns': [[new_name, old_name, positions[headers.index(old_name)]]
+                    for new_name, old_name in column_mapping]
+    }
+
+# Dòng chỉ được giữ nếu ít nhất 1 trong các cột này có dữ liệu
+IMPORTANT_COLUMNS = ('Mã', 'Tên sản phẩm', 'Tên', 'LOT', 'Số lượng tồn', 'CLOSING STOCK/')
+
+def is_lot_column(name):
+    """Cột số lô (LOT / Lô): thêm "Ngày SX từ Lô" ngay sau cột này"""
+    return bool(name) and ('lot' in name.lower() or 'lô' in name.lower())
+
+def assemble_products(columns, display_columns, keep, lot_dates, lot_positions):
+    """
+    Ghép các cột đã chuẩn hóa thành list dict (1 lượt qua các dòng)
+    keep: dòng được giữ, lot_dates / lot_positions: "Ngày SX từ Lô" của dòng và vị trí cột LOT tương ứng
+    """
+    keys_with_lot_date = {}
+    products = []
+    for row, lot_date, position, kept in zip(zip(*columns), lot_dates, lot_positions, keep):
+        if not kept:
+            continue
+        if lot_date is None:
+            products.append(dict(zip(display_columns, row)))
+            continue
+        if position not in keys_with_lot_date:
+            keys_with_lot_date[position] = display_columns[:position + 1] + ['Ngày SX từ Lô'] + display_columns[position + 1:]
+        values = row[:position + 1] + (lot_date,) + row[position + 1:]
+        products.append(dict(zip(keys_with_lot_date[position], values)))
+
+    return products
+
+def load_product_config(db_path=None):
+    """
+    Load cấu hình thời hạn sử dụng từ product_config.json (kể cả thay đổi còn trong WAL)
+    hoặc từ database SQLite nếu có db_path
+    """
+    if db_path:
+        return sqlite_store.InventoryDB(db_path).load_product_config()
+    return file_store.load_product_config()
+
+def save_product_config(config, db_path=None):
+    """
+    Lưu cấu hình thời hạn sử dụng vào product_config.json (có khóa, ghi nguyên tử)
+    hoặc vào database SQLite nếu có db_path
+    """
+    if db_path:
+        sqlite_store.InventoryDB(db_path).save_product_config(config)
+    else:
+        file_store.save_product_config(config)
+
+def shelf_life_key(product):
+    """
+    Tạo unique key tra thời hạn riêng: LUÔN dùng format product_code_lot_number
+    """
+    product_code = str(product.get('Mã', '')).strip()  # Chuyển sang string và trim
+
+    # Xử lý lot_number: None -> rỗng
+    lot_value = product.get('LOT')
+    lot_number = str(lot_value).strip() if lot_value not in [None, '', 'None', 'nan'] else ''
+
+    return f"{product_code}_{lot_number}"
+
+def parse_lot_to_date(lot_value):
+    """
+    Parse LOT thành ngày hết hạn (ngày cuối cùng của tháng)
+    LOT format: YYMM (ví dụ: 2805 = tháng 05 năm 2028 -> ngày hết hạn = 31/05/2028)
+    """
+    if is_missing(lot_value):
+        return None
+
+    lot_str = str(lot_value).strip().upper().replace('LOT', '').replace('/', '').replace('-', '').replace('.', '')
+
+    # Loại bỏ chữ cái, chỉ giữ số
+    lot_str = ''.join(c for c in lot_str if c.isdigit())
+
+    if not lot_str:
+        return None
+
+    try:
+        # Format YYYYMMDD (8 chữ số) - ngày cụ thể
+        if len(lot_str) == 8:
+            year = int(lot_str[0:4])
+            month = int(lot_str[4:6])
+            day = int(lot_str[6:8])
+            return datetime(year, month, day)
+
+        # Format YYMMDD (6 chữ số) - ngày cụ thể
+        elif len(lot_str) == 6:
+            year = int(lot_str[0:2])
+            year = 2000 + year if year < 50 else 1900 + year
+            month = int(lot_str[2:4])
+            day = int(lot_str[4:6])
+            return datetime(year, month, day)
+
+        # Format YYMM (4 chữ số) - ngày cuối cùng của tháng (NGÀY HẾT HẠN)
+        elif len(lot_str) == 4:
+            year = int(lot_str[0:2])
+            month = int(lot_str[2:4])
+            year = 2000 + year if year < 50 else 1900 + year
+
+            # Tìm ngày cuối cùng của tháng
+            if month == 12:
+                next_month = datetime(year + 1, 1, 1)
+            else:
+                next_month = datetime(year, month + 1, 1)
+            last_day = next_month - timedelta(days=1)
+            return last_day
+    except:
+        pass
+
+    return None
+
+def calculate_remaining_percentage(lot_value, shelf_life_months):
+    """
+    Tính phần trăm hạn sử dụng còn lại
+    lot_value: Số LOT (ví dụ: "2805" = ngày hết hạn 31/05/2028)
+    shelf_life_months: Thời hạn sử dụng (tháng)
+
+    Logic:
+    - LOT = ngày hết hạn
+    - Ngày sản xuất = ngày hết hạn - shelf_life_months
+    - % còn lại = (ngày hết hạn - hôm nay) / (ngày hết hạn - ngày sản xuất) * 100
+
+    Returns: (remaining_percentage, expiry_date_str)
+    """
+    if not shelf_life_months or is_missing(lot_value):
+        return None, None
+
+    # Parse LOT -> ngày hết hạn
+    expiry_date = parse_lot_to_date(lot_value)
+    if not expiry_date:
+        return None, None
+
+    # Tính ngày sản xuất = EDATE(ngày hết hạn, -shelf_life_months)
+    production_date = expiry_date - timedelta(days=shelf_life_months * 30.44)
+
+    # Ngày hiện tại
+    today = datetime.now()
+
+    # Tính tổng số ngày thời hạn sử dụng
+    total_days = (expiry_date - production_date).days
+
+    # Tính số ngày còn lại
+    days_remaining = (expiry_date - today).days
+
+    # Tính phần trăm
+    if days_remaining <= 0:
+        percentage = 0
+    elif total_days > 0:
+        percentage = (days_remaining / total_days) * 100
+    else:
+        percentage = 0
+
+    expiry_str = expiry_date.strftime("%d/%m/%Y")
+
+    return round(percentage, 1), expiry_str
+
+def extract_date_from_lot(lot_value):
+    """
+    Trích xuất ngày sản xuất từ số lô nếu có format ngày
+    Ví dụ: "LOT240512" -> "12/05/2024"
+    """
+    if is_missing(lot_value):
+        return None
+
+    lot_str = str(lot_value).upper()
+
+    # Thử pattern YYMMDD (6 số)
+    match = re.search(r'(\d{6})', lot_str)
+    if match:
+        date_str = match.group(1)
+        try:
+            year = int('20' + date_str[0:2])
+            month = int(date_str[2:4])
+            day = int(date_str[4:6])
+            if 1 <= month <= 12 and 1 <= day <= 31:
+                return f"{day:02d}/{month:02d}/{year}"
+        except:
+            pass
+
+    # Thử pattern YYYYMMDD (8 số)
+    match = re.search(r'(\d{8})', lot_str)
+    if match:
+        date_str = match.group(1)
+        try:
+            year = int(date_str[0:4])
+            month = int(date_str[4:6])
+            day = int(date_str[6:8])
+            if 1 <= month <= 12 and 1 <= day <= 31:
+                return f"{day:02d}/{month:02d}/{year}"
+        except:
+            pass
+
+    return None
+
+def fingerprint_rows(sheet_name, start_row, cells):
+    """
+    Dấu vân tay bố cục: tên sheet + các ô header thô (cells: các dòng header đã đổi sang chuỗi)
+    Ô trống ở cuối mỗi dòng được bỏ qua
+    """
+    cells = [list(row) for row in cells]
+    for values in cells:
+        while values and not values[-1]:
+            values.pop()
+    raw = json.dumps([sheet_name, start_row, cells], ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def resolve_sheet_layout(engine, df, sheet_name, layouts, layout_changes):
+    """
+    Bố cục của sheet: dùng lại bố cục đã lưu nếu header thô y hệt lần trước,
+    nếu không thì chạy heuristic và lưu lại vào layouts
+    Sheet đã có bố cục lưu nhưng header khác đi được thêm vào layout_changes (nhà cung cấp đổi mẫu file)
+    """
+    cached = layouts.get(sheet_name)
+    if cached and layout_fits(cached, df.shape[1]) and \
+            engine.layout_fingerprint(df, sheet_name, cached['start_row'],
+                                      cached['header_rows']) == cached['fingerprint']:
+        print(f"     - Dòng bắt đầu dữ liệu: {cached['start_row'] + 1} (bố cục đã lưu)")
+        return cached
+
+    if cached:
+        print(f"     ⚠ Bố cục sheet {sheet_name} khác lần trước (mẫu file đã thay đổi?), xác định lại cột")
+        layout_changes.append(sheet_name)
+
+    # Tìm dòng bắt đầu có "mã" và "tên sản phẩm"
+    start_row = engine.find_data_start_row(df)
+    print(f"     - Dòng bắt đầu dữ liệu: {start_row + 1}")
+
+    layout = engine.detect_sheet_layout(df, start_row, sheet_name)
+    layout['fingerprint'] = engine.layout_fingerprint(df, sheet_name, layout['start_row'], layout['header_rows'])
+    layouts[sheet_name] = layout
+    return layout
+
+def layout_fits(layout, width):
+    """
+    Mọi vị trí cột của bố cục đều nằm trong sheet rộng width cột
+    (fingerprint bỏ qua ô header trống ở cuối: cột không tên tự nhận diện có thể không còn trong file mới)
+    """
+    positions = [position for _, _, position in layout.get('columns', [])]
+    if layout.get('product_column') is not None:
+        positions.append(layout['product_column'])
+    return all(position < width for position in positions)
+
+def load_layout_cache(layout_cache_file):
+    """Bố cục các sheet đã xác định ở lần chuyển đổi trước (tên sheet -> bố cục)"""
+    if not layout_cache_file:
+        return {}
+    layouts = file_store.read_json(layout_cache_file, default={})
+    return layouts if isinstance(layouts, dict) else {}
+
+def save_layout_cache(layouts, layout_cache_file):
+    """Lưu bố cục (lỗi chỉ được in ra: không ghi được thì lần sau chạy lại heuristic)"""
+    if not layout_cache_file:
+        return
+    try:
+        with file_store.file_lock(layout_cache_file):
+            file_store.atomic_write_json(layout_cache_file, layouts)
+    except OSError as e:
+        print(f"⚠ Không lưu được bố cục sheet: {e}")
+
+def inventory_date_from_filename(excel_file):
+    """
+    Ngày tồn kho theo tên file: 22.12.xlsx (hoặc 22.12_1700000000.xlsx khi upload) -> 22/12/<năm nay>
+    Tên file không có ngày -> hôm nay
+    """
+    date_match = re.match(r'(\d{1,2})\.(\d{1,2})(?:\D|$)', os.path.basename(os.path.splitext(excel_file)[0]))
+    if date_match:
+        day, month = date_match.groups()
+        return f"{day.zfill(2)}/{month.zfill(2)}/{datetime.now().year}"
+    return datetime.now().strftime("%d/%m/%Y")
+
+def save_history_snapshot(inventory_data, history_dir=history_store.HISTORY_DIR):
+    """Lưu snapshot vào lịch sử (history_dir=None -> bỏ qua); lỗi chỉ được in ra, không làm hỏng lần chuyển đổi"""
+    if not history_dir:
+        return
+    try:
+        history_store.HistoryStore(history_dir).save_snapshot(inventory_data)
+    except Exception as e:
+        print(f"⚠ Không lưu được lịch sử: {e}")
+
+def save_inventory(inventory_data, output_file='inventory_data.json', compact=False, db_path=None, split=None):
+    """
+    Lưu kết quả chuyển đổi: vào database (1 transaction, bulk insert) nếu có db_path,
+    và ra file JSON nếu có output_file (ghi nguyên tử, khóa để không chồng với lần tính lại)
+    split: ghi kèm bản tách theo sheet (xem file_store.write_inventory)
+    """
+    if db_path:
+        with file_store.file_lock(db_path):
+            sqlite_store.InventoryDB(db_path).save_inventory(inventory_data)
+    if output_file:
+        with file_store.file_lock(output_file):
+            file_store.write_inventory(output_file, inventory_data, compact=compact, split=split)
+
+def extract_sheet_chunks(engine, df, layout):
+    """
+    Sản phẩm của sheet theo từng lô: engine theo luồng (có extract_sheet_chunks) trả về generator các lô,
+    các engine khác trả cả sheet thành 1 lô
+    Returns: (iterable các list sản phẩm, display_columns)
+    """
+    if hasattr(engine, 'extract_sheet_chunks'):
+        return engine.extract_sheet_chunks(df, layout)
+    products, display_columns = engine.extract_sheet_data(df, layout)
+    return [products], display_columns
+
+def store_products(engine, chunks):
+    """Gom các lô sản phẩm: engine theo luồng lưu tạm ra đĩa (engine.store_products), còn lại là list"""
+    if hasattr(engine, 'store_products'):
+        return engine.store_products(chunks)
+    return [product for chunk in chunks for product in chunk]
+
+def add_shelf_life(engine, chunks, selected_columns, sheet_name, config, today, metrics):
+    """
+    Thêm Thời hạn (tháng), % Còn lại và Ngày hết hạn cho từng lô sản phẩm của sheet có hạn (generator)
+    Cột mới được chèn vào selected_columns khi gặp lô có sản phẩm đầu tiên
+    """
+    # Lấy thời hạn mặc định cho sheet
+    default_shelf_life = config['shelf_life_months'].get(sheet_name)
+    for products in chunks:
+        if not products:
+            yield products
+            continue
+        with metrics.stage('shelf_life', sheet_name):
+            # Nếu là dict (PIN FUJITSU), xử lý riêng
+            if isinstance(default_shelf_life, dict):
+                # Thêm cột "Thời hạn (tháng)" để người dùng có thể chọn
+                if 'Thời hạn (tháng)' not in selected_columns:
+                    selected_columns.insert(3, 'Thời hạn (tháng)')  # Chèn sau LOT
+                if '% Còn lại' not in selected_columns:
+                    selected_columns.insert(4, '% Còn lại')
+                if 'Ngày hết hạn' not in selected_columns:
+                    selected_columns.insert(5, 'Ngày hết hạn')
+
+                shelf_lives = []
+                for product in products:
+                    # Lấy thời hạn đã lưu hoặc mặc định 36 tháng
+                    shelf_life = config['product_specific_shelf_life'].get(shelf_life_key(product), 36)
+                    product['Thời hạn (tháng)'] = shelf_life
+                    shelf_lives.append(shelf_life)
+            else:
+                # Sheet khác (BAKING SODA, AZARINE): thời hạn cố định
+                if '% Còn lại' not in selected_columns:
+                    selected_columns.insert(3, '% Còn lại')  # Chèn sau LOT
+                if 'Ngày hết hạn' not in selected_columns:
+                    selected_columns.insert(4, 'Ngày hết hạn')
+                shelf_lives = default_shelf_life
+
+            # Tính % còn lại và ngày hết hạn cho cả lô một lần
+            percentages, expiry_dates, _ = engine.calculate_remaining_percentages(
+                [product.get('LOT') for product in products], shelf_lives, today)
+            for product, percentage, expiry_date in zip(products, percentages, engine.format_dates(expiry_dates)):
+                product['% Còn lại'] = percentage
+                product['Ngày hết hạn'] = expiry_date
+        yield products
+
+def convert_workbook(engine, excel_file=None, output_file='inventory_data.json', compact=False,
+                     history_dir=history_store.HISTORY_DIR, db_path=None,
+                     layout_cache_file=LAYOUT_CACHE_FILE,
+                     metrics_file=conversion_metrics.METRICS_FILE, trace_memory=False, split=None,
+                     source_name=None):
+    """
+    Chuyển đổi file Excel sang JSON (tất cả các sheet) bằng engine đã chọn
+
+    Parameters:
+    - excel_file: Tên file Excel (nếu None, sẽ tự động tìm file mới nhất)
+    - output_file: Tên file JSON output (None -> không ghi JSON, chỉ lưu vào database)
+    - compact: Lưu dạng cột gọn (không indent) kèm bản nén .gz/.br
+    - history_dir: Thư mục lưu lịch sử snapshot (None -> không lưu)
+    - db_path: Database SQLite (sqlite_store) - lưu dữ liệu và đọc cấu hình thời hạn từ đây
+    - layout_cache_file: File lưu bố cục các sheet (None -> luôn xác định lại bằng heuristic)
+    - metrics_file: File ghi số liệu thời gian / bộ nhớ từng bước của các lần chuyển đổi (None -> không ghi)
+    - trace_memory: Đo đỉnh bộ nhớ từng bước bằng tracemalloc (chính xác nhưng chậm hơn nhiều lần)
+    - split: True -> ghi thêm manifest + 1 file mỗi sheet (inventory_data/) cho website,
+      False -> xóa bản tách, None -> giữ như đang có
+    - source_name: tên file gốc ghi vào metadata.source_file và dùng để lấy ngày tồn kho
+      (file upload được lưu với tên khác trên đĩa), None -> tên của excel_file
+
+    Số liệu từng bước nằm trong metadata.metrics; file JSON chỉ có các bước trước khi ghi file,
+    bản đầy đủ (kèm ghi file, lưu lịch sử) có trong kết quả trả về và metrics_file
+    """
+
+    sheet_name = None
+    metrics = conversion_metrics.ConversionMetrics(trace_memory=trace_memory)
+    try:
+        # Load cấu hình thời hạn sử dụng
+        config = load_product_config(db_path)
+
+        # Tự động tìm file Excel nếu không được chỉ định
+        if excel_file is None:
+            excel_file = find_excel_file()
+            print(f"Đã tìm thấy file: {excel_file}")
+        source_name = source_name or excel_file
+
+        # Lấy ngày từ tên file (ví dụ: 22.12.xlsx -> 22/12/2025)
+        date_ton_kho = inventory_date_from_filename(source_name)
+
+        # Đọc workbook một lần, lấy từng sheet dạng lưới thô để tự xử lý
+        print(f"\nĐang đọc file Excel...")
+
+        sheets_data = []
+        total_products = 0
+        parse_times = {}
+
+        # Bố cục sheet đã xác định ở các lần trước (bỏ qua heuristic nếu header không đổi)
+        layouts = load_layout_cache(layout_cache_file)
+        cached_layouts = json.dumps(layouts, sort_keys=True)
+        layout_changes = []
+
+        # Ngày tham chiếu dùng chung khi tính % còn lại cho mọi sheet
+        today = datetime.now()
+
+        sheets = metrics.iterate('read', engine.read_workbook_sheets(excel_file), sheet_of=lambda item: item[0])
+        for sheet_name, df, parse_seconds in sheets:
+            print(f"\n  📄 Đang xử lý sheet: {sheet_name}")
+            print(f"     - Thời gian đọc sheet: {parse_seconds:.2f}s")
+            parse_times[sheet_name] = parse_seconds
+            metrics.sheet(sheet_name, rows=int(df.shape[0]), columns=int(df.shape[1]))
+
+            # Xác định bố cục (dùng lại bố cục đã lưu nếu header không đổi)
+            with metrics.stage('layout', sheet_name):
+                layout = resolve_sheet_layout(engine, df, sheet_name, layouts, layout_changes)
+
+            # Xử lý dữ liệu từ sheet (engine theo luồng trả sản phẩm theo từng lô)
+            with metrics.stage('extract', sheet_name):
+                chunks, selected_columns = extract_sheet_chunks(engine, df, layout)
+            chunks = metrics.iterate('extract', chunks, sheet_of=lambda chunk: sheet_name)
+
+            # Thêm cột % Còn lại và Hạn sử dụng cho các sheet có hạn
+            if sheet_name in config['shelf_life_months']:
+                chunks = add_shelf_life(engine, chunks, selected_columns, sheet_name, config, today, metrics)
+            products = store_products(engine, chunks)
+
+            # Ghi lại thời hạn cố định đã dùng để chế độ tính lại biết khi nào cần cập nhật
+            sheet_shelf_life = config['shelf_life_months'].get(sheet_name)
+            if not products or isinstance(sheet_shelf_life, dict):
+                sheet_shelf_life = None
+
+            metrics.sheet(sheet_name, products=len(products), output_columns=len(selected_columns))
+            if products:
+                sheet_entry = {
+                    "sheet_name": sheet_name,
+                    "products": products,
+                    "total_products": len(products),
+                    "columns": selected_columns
+                }
+                if sheet_shelf_life is not None:
+                    sheet_entry["shelf_life_months"] = sheet_shelf_life
+                sheets_data.append(sheet_entry)
+                total_products += len(products)
+                print(f"     - Số sản phẩm: {len(products)}")
+                print(f"     - Các cột hiển thị: {', '.join(selected_columns[:5])}{'...' if len(selected_columns) > 5 else ''}")
+            else:
+                print(f"     ⚠ Không có dữ liệu")
+
+        sheet_name = None  # Đã xử lý xong các sheet
+
+        if json.dumps(layouts, sort_keys=True) != cached_layouts:
+            save_layout_cache(layouts, layout_cache_file)
+
+        # Tạo cấu trúc JSON với metadata
+        inventory_data = {
+            "metadata": {
+                "date_ton_kho": date_ton_kho,
+                "source_file": source_name,
+                "last_updated": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+                "total_sheets": len(sheets_data),
+                "total_products": total_products
+            },
+            "sheets": sheets_data
+        }
+        if layout_changes:
+            inventory_data["metadata"]["layout_changes"] = layout_changes
+        inventory_data["metadata"]["metrics"] = metrics.to_dict()
+
+        with metrics.stage('write'):
+            save_inventory(inventory_data, output_file, compact=compact, db_path=db_path, split=split)
+
+        # Giữ lại snapshot để so sánh giữa các ngày
+        with metrics.stage('history'):
+            save_history_snapshot(inventory_data, history_dir)
+
+        inventory_data["metadata"]["metrics"] = metrics.finish()
+        conversion_metrics.record_metrics(inventory_data["metadata"]["metrics"], metrics_file,
+                                          source_file=source_name, cached=False,
+                                          total_products=total_products)
+
+        print(f"\n✓ Đã chuyển đổi thành công!")
+        print(f"  - File nguồn: {source_name}")
+        print(f"  - File đích: {output_file or db_path}")
+        print(f"  - Ngày tồn kho: {date_ton_kho}")
+        print(f"  - Tổng số sheet: {len(sheets_data)}")
+        print(f"  - Tổng số sản phẩm: {total_products}")
+        print(f"  - Thời gian đọc Excel: {sum(parse_times.values()):.2f}s ({len(parse_times)} sheet)")
+        print(f"  - Thời gian từng bước: " + ', '.join(
+            f"{name} {stats['seconds']:.2f}s" for name, stats in metrics.stages.items()))
+
+        return inventory_data
+
+    except Exception as e:
+        print(f"✗ Lỗi khi chuyển đổi: {str(e)}")
+        conversion_metrics.record_metrics(metrics.finish(), metrics_file, source_file=excel_file,
+                                          cached=False, error=str(e), sheet_name=sheet_name)
+        raise ConversionError(str(e), excel_file=excel_file, sheet_name=sheet_name) from e
+
+def recalculate_inventory(engine, inventory_data, config, today=None):
+    """
+    Tính lại Thời hạn (tháng), % Còn lại và Ngày hết hạn trực tiếp trên dữ liệu JSON đã có
+    Chỉ cập nhật các dòng có thời hạn thay đổi (theo key product_code_lot_number),
+    hoặc toàn bộ nếu đã sang ngày mới so với lần tính trước
+
+    Returns: số dòng đã được tính lại
+    """
+    if today is None:
+        today = datetime.now()
+
+    metadata = inventory_data.setdefault('metadata', {})
+    last_date = str(metadata.get('last_updated', '')).split(' ')[0]
+    date_changed = last_date != today.strftime("%d/%m/%Y")
+
+    updated_rows = 0
+    for sheet in inventory_data.get('sheets', []):
+        sheet_name = sheet.get('sheet_name')
+        if sheet_name not in config['shelf_life_months']:
+            continue
+
+        products = sheet.get('products', [])
+        default_shelf_life = config['shelf_life_months'][sheet_name]
+
+        if isinstance(default_shelf_life, dict):
+            # PIN FUJITSU: thời hạn riêng theo từng mã + LOT
+            shelf_lives = [config['product_specific_shelf_life'].get(shelf_life_key(product), 36)
+                           for product in products]
+            changed = [i for i, (product, shelf_life) in enumerate(zip(products, shelf_lives))
+                       if date_changed or product.get('Thời hạn (tháng)') != shelf_life]
+            for i in changed:
+                products[i]['Thời hạn (tháng)'] = shelf_lives[i]
+            shelf_lives = [shelf_lives[i] for i in changed]
+        else:
+            # BAKING SODA, AZARINE: thời hạn cố định cho cả sheet
+            if date_changed or sheet.get('shelf_life_months') != default_shelf_life:
+                changed = list(range(len(products)))
+            else:
+                changed = []
+            sheet['shelf_life_months'] = default_shelf_life
+            shelf_lives = default_shelf_life
+
+        if not changed:
+            continue
+
+        percentages, expiry_dates, _ = engine.calculate_remaining_percentages(
+            [products[i].get('LOT') for i in changed], shelf_lives, today)
+        for i, percentage, expiry_date in zip(changed, percentages, engine.format_dates(expiry_dates)):
+            products[i]['% Còn lại'] = percentage
+            products[i]['Ngày hết hạn'] = expiry_date
+        updated_rows += len(changed)
+
+    metadata['last_updated'] = today.strftime("%d/%m/%Y %H:%M:%S")
+    return updated_rows
+
+def recalculate_shelf_life(engine, data_file='inventory_data.json', db_path=None):
+    """
+    Chế độ tính lại nhanh: đọc inventory_data.json + product_config.json hiện có
+    và chỉ tính lại phần hạn sử dụng, không đọc lại file Excel
+    Nếu chưa có file JSON thì chạy chuyển đổi đầy đủ
+    File được ghi lại đúng định dạng đang có (dạng dòng hoặc dạng cột)
+    Có db_path: đọc / ghi dữ liệu và cấu hình trong database, data_file (nếu có) là bản xuất ra
+    """
+    if db_path:
+        return recalculate_shelf_life_db(engine, db_path, data_file)
+
+    if not os.path.exists(data_file):
+        print(f"Chưa có {data_file}, chạy chuyển đổi đầy đủ...")
+        return convert_workbook(engine, output_file=data_file)
+
+    started = time.perf_counter()
+
+    # Giữ khóa suốt đọc - tính - ghi để không mất thay đổi của request khác
+    with file_store.file_lock(data_file):
+        inventory_data, compact = file_store.read_inventory(data_file)
+
+        updated_rows = recalculate_inventory(engine, inventory_data, load_product_config())
+
+        file_store.write_inventory(data_file, inventory_data, compact=compact)
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"✓ Đã tính lại % còn lại cho {updated_rows} dòng ({elapsed_ms:.0f} ms)")
+
+    return inventory_data
+
+def recalculate_shelf_life_db(engine, db_path, data_file=None):
+    """Tính lại hạn sử dụng cho dữ liệu trong database, chỉ UPDATE các dòng thay đổi"""
+    started = time.perf_counter()
+    db = sqlite_store.InventoryDB(db_path)
+
+    with file_store.file_lock(db_path):
+        try:
+            inventory_data = db.load_inventory()
+        except FileNotFoundError:
+            print(f"Chưa có dữ liệu trong {db_path}, chạy chuyển đổi đầy đủ...")
+            return convert_workbook(engine, output_file=data_file, db_path=db_path)
+
+        updated_rows = recalculate_inventory(engine, inventory_data, db.load_product_config())
+        db.update_inventory(inventory_data)
+
+    if data_file:
+        compact = os.path.exists(data_file) and file_store.read_inventory(data_file)[1]
+        save_inventory(inventory_data, data_file, compact=compact)
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"✓ Đã tính lại % còn lại cho {updated_rows} dòng ({elapsed_ms:.0f} ms)")
+
+    return inventory_data
+
+def load_cached_conversion(engine, cache, key, output_file='inventory_data.json', compact=False,
+                           excel_file=None, history_dir=history_store.HISTORY_DIR, db_path=None,
+                           metrics_file=conversion_metrics.METRICS_FILE, split=None):
+    """
+    Lấy kết quả chuyển đổi từ cache (ConversionCache) và ghi ra output_file
+    % còn lại được tính lại nếu kết quả cache được tạo từ ngày trước
+    excel_file: tên file vừa upload - cùng nội dung nhưng có thể là ngày tồn kho khác
+
+    Returns: inventory_data, hoặc None nếu cache chưa có key này
+    """
+    inventory_data = cache.get(key)
+    if inventory_data is None:
+        return None
+
+    metrics = conversion_metrics.ConversionMetrics()
+    if excel_file:
+        inventory_data['metadata']['source_file'] = excel_file
+        inventory_data['metadata']['date_ton_kho'] = inventory_date_from_filename(excel_file)
+    with metrics.stage('shelf_life'):
+        recalculate_inventory(engine, inventory_data, load_product_config(db_path))
+    # Số liệu của lần chuyển đổi gốc không còn đúng cho lần dùng cache này
+    inventory_data['metadata']['metrics'] = metrics.to_dict()
+
+    with metrics.stage('write'):
+        save_inventory(inventory_data, output_file, compact=compact, db_path=db_path, split=split)
+
+    with metrics.stage('history'):
+        save_history_snapshot(inventory_data, history_dir)
+
+    inventory_data['metadata']['metrics'] = metrics.finish()
+    conversion_metrics.record_metrics(inventory_data['metadata']['metrics'], metrics_file,
+                                      source_file=inventory_data['metadata'].get('source_file'),
+                                      cached=True, total_products=inventory_data['metadata'].get('total_products'))
+
+    print(f"✓ Dùng kết quả đã cache cho file: {inventory_data['metadata'].get('source_file')}")
+    return inventory_data
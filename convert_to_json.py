@@ -1,56 +1,89 @@
 """
 Script chuyển đổi file Excel sang JSON để quản lý tồn kho
 Hỗ trợ cập nhật thường xuyên bằng cách thay đổi tên file Excel
+Engine pandas: đọc cả sheet vào DataFrame, các bước xử lý theo cột (vectorized)
+Luật nhận diện header / chọn cột và quy trình chuyển đổi dùng chung nằm ở convert_core
 """
 
 import pandas as pd
-import json
+import numpy as np
+import sys
 from datetime import datetime, timedelta
-import os
-import glob
-import re
+import time
+import argparse
 
-def find_excel_file():
-    """Tự động tìm file Excel trong thư mục hiện tại"""
-    excel_files = glob.glob("*.xlsx") + glob.glob("*.xls")
-    
-    # Loại bỏ file tạm (bắt đầu với ~$)
-    excel_files = [f for f in excel_files if not os.path.basename(f).startswith('~$')]
-    
-    if not excel_files:
-        raise FileNotFoundError("Không tìm thấy file Excel nào trong thư mục!")
+import conversion_metrics
+import history_store
+import sqlite_store
+from convert_core import (
+    LAYOUT_CACHE_FILE, PROFILE_SAMPLE_SIZE, HEADER_RULES, HEADER_MATCHER, HEADER_SCAN_ROWS, IMPORTANT_COLUMNS,
+    ConversionError, HeaderMatcher, ColumnProfile,
+    find_excel_file, clean_column_name, merge_header_rows, find_product_column, name_unlabeled_columns,
+    select_columns, build_layout, is_lot_column, assemble_products, fingerprint_rows,
+    load_product_config, save_product_config, shelf_life_key, parse_lot_to_date,
+    calculate_remaining_percentage, extract_date_from_lot, load_layout_cache, save_layout_cache,
+    inventory_date_from_filename, save_history_snapshot, save_inventory
+)
+import convert_core
+
+# Module này là engine cho quy trình dùng chung của convert_core
+# (hàm được tra theo tên lúc chạy nên vẫn bọc / thay được, ví dụ khi đo benchmark)
+ENGINE = sys.modules[__name__]
+
+def read_workbook_sheets(excel_file):
+    """
+    Đọc workbook MỘT lần duy nhất và lần lượt trả về từng sheet dưới dạng lưới thô (header=None)
+    Tránh việc gọi pd.read_excel cho từng sheet (mỗi lần lại giải nén và parse toàn bộ file .xlsx)
     
-    # Sắp xếp theo thời gian sửa đổi, lấy file mới nhất
-    excel_files.sort(key=os.path.getmtime, reverse=True)
-    return excel_files[0]
+    Yields: (sheet_name, df, parse_seconds)
+    """
+    with pd.ExcelFile(excel_file) as excel_file_obj:
+        for sheet_name in excel_file_obj.sheet_names:
+            started = time.perf_counter()
+            df = excel_file_obj.parse(sheet_name, header=None)
+            yield sheet_name, df, time.perf_counter() - started
+
+def join_row_cells(df):
+    """Ghép các ô có dữ liệu của mỗi dòng thành 1 chuỗi cách nhau bởi dấu cách"""
+    cells = df.to_numpy(dtype=object)
+    not_null = pd.notna(cells)
+    return pd.Series([' '.join(str(value) for value in row[mask]) for row, mask in zip(cells, not_null)],
+                     index=df.index, dtype=object)
 
-def find_data_start_row(df):
+def find_data_start_row(df, max_rows=HEADER_SCAN_ROWS, matcher=HEADER_MATCHER):
     """
     Tìm dòng bắt đầu có 'mã' và 'tên sản phẩm' hoặc 'Item Code' và 'Products'
+    Chỉ dò trong max_rows dòng đầu (None -> cả sheet); không tìm thấy -> 0
     """
-    for idx, row in df.iterrows():
-        row_str = ' '.join([str(val).lower() for val in row if pd.notna(val)])
-        if ('mã' in row_str and ('tên' in row_str or 'sản phẩm' in row_str)) or \
-           ('item code' in row_str and 'products' in row_str) or \
-           ('no.' in row_str and 'lot' in row_str):
-            return idx
-    return 0
+    window = df if max_rows is None else df.iloc[:max_rows]
+    if window.empty:
+        return 0
+    found = np.flatnonzero(matcher.match_rows(join_row_cells(window)))
+    return window.index[found[0]] if len(found) else 0
 
-def clean_column_name(col_name):
+def profile_columns(df, sample_size=PROFILE_SAMPLE_SIZE):
     """
-    Làm sạch tên cột, loại bỏ các ký tự không cần thiết
+    Thống kê mọi cột của df trong 1 lượt (vectorized): số ô có dữ liệu
+    và sample_size giá trị không null đầu tiên của mỗi cột
+    Returns: list ColumnProfile theo thứ tự cột
     """
-    if pd.isna(col_name) or str(col_name).strip() == '':
-        return None
-    
-    col_name = str(col_name).strip()
-    # Loại bỏ các tên cột dạng "Column_X"
-    if col_name.startswith('Column_'):
-        return None
-    
-    return col_name
+    not_null = df.notna().to_numpy(dtype=bool)
+    non_null_counts = not_null.sum(axis=0)
+    
+    # Ô thuộc sample_size ô có dữ liệu đầu tiên của cột
+    first_cells = not_null & (np.cumsum(not_null, axis=0) <= sample_size)
+    rows, cols = np.nonzero(first_cells)
+    samples = [[] for _ in range(df.shape[1])]
+    if len(rows):
+        # Chỉ lấy giá trị của các dòng chứa mẫu (vài chục dòng), không chuyển cả sheet sang object
+        sample_rows, row_positions = np.unique(rows, return_inverse=True)
+        values = df.iloc[sample_rows].to_numpy(dtype=object)
+        for position, col in zip(row_positions, cols):
+            samples[col].append(values[position, col])
+    
+    return [ColumnProfile(count, values) for count, values in zip(non_null_counts, samples)]
 
-def analyze_column_importance(df, col):
+def analyze_column_importance(df, col, profile=None):
     """
     Phân tích độ quan trọng của cột dựa trên:
     - Tỷ lệ giá trị không null
@@ -71,363 +104,276 @@ def analyze_column_importance(df, col):
     name_score = sum(1 for keyword in important_keywords if keyword in col_lower) * 100
     
     # Tính tỷ lệ dữ liệu không null
-    non_null_ratio = df[col].notna().sum() / len(df) * 100
+    non_null = profile.non_null if profile is not None else df[col].notna().sum()
+    non_null_ratio = non_null / len(df) * 100
     
     return name_score + non_null_ratio
 
-def smart_filter_columns(df, headers, sheet_name=None):
+def smart_filter_columns(df, headers, sheet_name=None, profiles=None):
     """
     Lọc các cột theo logic: Mã/Item Code, Tên/Products, Lot, Tồn đầu kỳ, Tồn cuối kỳ/CLOSING STOCK/Số lượng tồn
-    Sheet COLEMAN: Dùng cột A (Mã)
-    Các sheet khác: Ưu tiên cột E (Item Code)
-    """
-    selected_cols = []
-    
-    # 1. Tìm cột Mã
-    ma_col = None
-    
-    # Nếu KHÔNG phải sheet COLEMAN, ưu tiên cột "Item Code"
-    if sheet_name and sheet_name.upper() != 'COLEMAN':
-        # Tìm cột có tên chứa "Item Code"
-        for i, col in enumerate(headers):
-            if col:
-                col_lower = str(col).lower()
-                # Tìm cột có tên chính xác là "Item Code"
-                if col_lower == 'item code' or ('item' in col_lower and 'code' in col_lower):
-                    if df[col].notna().sum() > 0:
-                        ma_col = col
-                        print(f"  ✓ Tìm thấy cột Mã (Item Code) tại index {i}: {col}")
-                        break
-    
-    # Nếu không tìm thấy Item Code hoặc là sheet COLEMAN, tìm theo cách cũ
-    if not ma_col:
-        for col in headers:
-            if col:
-                col_lower = col.lower()
-                # Kiểm tra tên cột
-                if ('mã' in col_lower or 'item code' in col_lower or col_lower == 'ad' or col_lower == 'no.') and \
-                   not any(x in col_lower for x in ['cus', 'customer', 'warehouse', 'thông tin']):
-                    if df[col].notna().sum() > 0:
-                        ma_col = col
-                        print(f"  ✓ Tìm thấy cột Mã: {col}")
-                        break
-                # Kiểm tra nội dung cột - nếu nhiều giá trị có dạng số-chữ (mã sản phẩm)
-                elif col.startswith('Column_'):
-                    sample_values = df[col].dropna().head(10)
-                    if len(sample_values) > 0:
-                        # Kiểm tra xem có phải cột chứa mã không (có số ở đầu)
-                        has_code_pattern = sum(1 for v in sample_values if str(v).strip() and str(v)[0].isdigit()) > len(sample_values) * 0.3
-                        if has_code_pattern:
-                            ma_col = col
-                            break
-    
-    # 2. Tìm cột Tên / Products (cho phép cả Column_X nếu chứa tên dài)
-    ten_col = None
-    for col in headers:
-        if col and col != ma_col:
-            col_lower = col.lower()
-            # Kiểm tra tên cột
-            if 'tên' in col_lower or 'products' in col_lower or 'product' in col_lower:
-                if df[col].notna().sum() > 0:
-                    ten_col = col
-                    break
-            # Kiểm tra nội dung - nếu có text dài (tên sản phẩm thường dài)
-            elif col.startswith('Column_'):
-                sample_values = df[col].dropna().head(10)
-                if len(sample_values) > 0:
-                    avg_length = sum(len(str(v)) for v in sample_values) / len(sample_values)
-                    # Tên sản phẩm thường dài hơn 15 ký tự
-                    if avg_length > 15:
-                        ten_col = col
-                        break
-    
-    # 3. Tìm cột LOT / Lô
-    lot_col = None
-    for col in headers:
-        if col:
-            col_lower = col.lower()
-            if 'lot' in col_lower or col_lower == 'lô':
-                if df[col].notna().sum() > 0:
-                    lot_col = col
-                    break
-    
-    # 4. Tìm cột Tồn đầu kỳ
-    ton_dau_col = None
-    for col in headers:
-        if col:
-            col_lower = col.lower()
-            if 'tồn đầu' in col_lower or 'đầu kỳ' in col_lower or 'opening' in col_lower or col_lower == 'tồn đầu kỳ':
-                if df[col].notna().sum() > 0:
-                    ton_dau_col = col
-                    break
-    
-    # 5. Tìm cột Tồn cuối kỳ / CLOSING STOCK / Số lượng tồn
-    ton_cuoi_col = None
-    for col in headers:
-        if col:
-            col_lower = col.lower()
-            if any(keyword in col_lower for keyword in ['closing stock', 'tồn cuối', 'cuối kỳ', 'số lượng tồn', 'closing']):
-                if df[col].notna().sum() > 0:
-                    ton_cuoi_col = col
-                    break
-    
-    # Bỏ cột EXPIRED DATE vì đã có cột "Ngày hết hạn" tính từ LOT
-    
-    # Sắp xếp các cột theo thứ tự logic và đặt tên đẹp hơn
-    renamed_cols = []
-    if ma_col:
-        # Đổi tên cột mã cho đẹp - LUÔN dùng "Mã" để thống nhất
-        if ma_col == 'No.' or ma_col == 'AD' or ma_col == 'Item Code':
-            renamed_cols.append(('Mã', ma_col))
-        else:
-            renamed_cols.append((ma_col, ma_col))
-    if ten_col:
-        # Đổi tên cột tên cho đẹp
-        if ten_col.startswith('Column_'):
-            renamed_cols.append(('Tên sản phẩm', ten_col))
-        else:
-            renamed_cols.append((ten_col, ten_col))
-    if lot_col:
-        renamed_cols.append((lot_col, lot_col))
-    if ton_dau_col:
-        renamed_cols.append((ton_dau_col, ton_dau_col))
-    if ton_cuoi_col:
-        renamed_cols.append((ton_cuoi_col, ton_cuoi_col))
-    
-    return renamed_cols
+    (xem convert_core.select_columns)
+    profiles: tên cột -> ColumnProfile (nếu None sẽ tự thống kê df)
+    """
+    if profiles is None:
+        profiles = {}
+        for col, profile in zip(headers, profile_columns(df)):
+            profiles.setdefault(col, profile)
+    return select_columns(headers, profiles, sheet_name)
+
+def lot_digits(lot_values):
+    """Lấy phần chữ số của cả cột LOT (giống bước làm sạch trong parse_lot_to_date)"""
+    lots = pd.Series(list(lot_values), dtype=object)
+    digits = pd.Series([''] * len(lots), dtype=object)
+    not_null = lots.notna()
+    digits[not_null] = lots[not_null].astype(str).str.replace(r'\D', '', regex=True).to_numpy(dtype=object)
+    return digits
 
-def load_product_config():
-    """
-    Load cấu hình thời hạn sử dụng từ product_config.json
-    """
-    try:
-        with open('product_config.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        return {
-            "shelf_life_months": {
-                "BAKING SODA": 36,
-                "AZARINE": 36,
-                "PIN FUJITSU": {}
-            },
-            "product_specific_shelf_life": {}
-        }
+def month_starts(years, months):
+    """Ngày đầu tháng (datetime64[D]) cho mảng năm/tháng (tháng 1-12, cho phép tháng 13 = tháng 1 năm sau)"""
+    return ((years - 1970) * 12 + (months - 1)).astype('datetime64[M]').astype('datetime64[D]')
 
-def save_product_config(config):
+def parse_lots_to_dates(lot_values):
     """
-    Lưu cấu hình thời hạn sử dụng vào product_config.json
+    Phiên bản theo lô của parse_lot_to_date: decode cả cột LOT bằng NumPy
+    Hỗ trợ YYYYMMDD, YYMMDD (ngày cụ thể) và YYMM (ngày cuối tháng)
+    Returns: mảng datetime64[D], NaT nếu không parse được
     """
-    with open('product_config.json', 'w', encoding='utf-8') as f:
-        json.dump(config, f, ensure_ascii=False, indent=2)
+    digits = lot_digits(lot_values)
+    lengths = digits.str.len().to_numpy()
+    result = np.full(len(digits), np.datetime64('NaT'), dtype='datetime64[D]')
+    
+    def numbers(mask, start, end):
+        return digits[mask].str[start:end].astype(np.int64).to_numpy()
+    
+    def set_exact_dates(mask, years, months, days):
+        # Ngày phải hợp lệ (giống datetime(year, month, day))
+        valid = (years >= 1) & (years <= 9999) & (months >= 1) & (months <= 12) & (days >= 1)
+        safe_months = np.where(valid, months, 1)
+        first_day = month_starts(years, safe_months)
+        days_in_month = (month_starts(years, safe_months + 1) - first_day).astype(np.int64)
+        valid &= days <= days_in_month
+        positions = np.flatnonzero(mask)[valid]
+        result[positions] = first_day[valid] + (days[valid] - 1).astype('timedelta64[D]')
+    
+    # Format YYYYMMDD (8 chữ số)
+    mask = lengths == 8
+    if mask.any():
+        set_exact_dates(mask, numbers(mask, 0, 4), numbers(mask, 4, 6), numbers(mask, 6, 8))
+    
+    # Format YYMMDD (6 chữ số)
+    mask = lengths == 6
+    if mask.any():
+        years = numbers(mask, 0, 2)
+        years = np.where(years < 50, 2000 + years, 1900 + years)
+        set_exact_dates(mask, years, numbers(mask, 2, 4), numbers(mask, 4, 6))
+    
+    # Format YYMM (4 chữ số) - ngày cuối cùng của tháng
+    mask = lengths == 4
+    if mask.any():
+        years = numbers(mask, 0, 2)
+        years = np.where(years < 50, 2000 + years, 1900 + years)
+        months = numbers(mask, 2, 4)
+        # Tháng 00 -> ngày cuối năm trước (giống datetime(year, 1, 1) - 1 ngày)
+        valid = months <= 12
+        positions = np.flatnonzero(mask)[valid]
+        result[positions] = month_starts(years[valid], months[valid] + 1) - np.timedelta64(1, 'D')
+    
+    return result
 
-def parse_lot_to_date(lot_value):
+def format_dates(dates):
+    """Định dạng mảng datetime64 thành chuỗi "DD/MM/YYYY" (None nếu NaT)"""
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    formatted = np.full(len(dates), None, dtype=object)
+    valid = ~np.isnat(dates)
+    if valid.any():
+        unique_dates, inverse = np.unique(dates[valid], return_inverse=True)
+        labels = np.array([d.astype(datetime).strftime("%d/%m/%Y") for d in unique_dates], dtype=object)
+        formatted[valid] = labels[inverse]
+    return formatted
+
+def calculate_remaining_percentages(lot_values, shelf_life_months, today=None):
     """
-    Parse LOT thành ngày hết hạn (ngày cuối cùng của tháng)
-    LOT format: YYMM (ví dụ: 2805 = tháng 05 năm 2028 -> ngày hết hạn = 31/05/2028)
+    Phiên bản theo lô của calculate_remaining_percentage cho cả cột LOT
+    lot_values: Danh sách số LOT
+    shelf_life_months: Thời hạn sử dụng (tháng) - một số chung hoặc danh sách theo từng dòng
+    today: Ngày tham chiếu dùng chung cho cả lô (mặc định: datetime.now())
+    
+    Returns: (percentages, expiry_dates, production_dates)
+    - percentages: mảng object, None nếu không tính được
+    - expiry_dates: datetime64[D] (NaT nếu không tính được)
+    - production_dates: datetime64[us] (NaT nếu không tính được)
     """
-    if pd.isna(lot_value):
-        return None
-    
-    lot_str = str(lot_value).strip().upper().replace('LOT', '').replace('/', '').replace('-', '').replace('.', '')
-    
-    # Loại bỏ chữ cái, chỉ giữ số
-    lot_str = ''.join(c for c in lot_str if c.isdigit())
-    
-    if not lot_str:
-        return None
-    
-    try:
-        # Format YYYYMMDD (8 chữ số) - ngày cụ thể
-        if len(lot_str) == 8:
-            year = int(lot_str[0:4])
-            month = int(lot_str[4:6])
-            day = int(lot_str[6:8])
-            return datetime(year, month, day)
-        
-        # Format YYMMDD (6 chữ số) - ngày cụ thể
-        elif len(lot_str) == 6:
-            year = int(lot_str[0:2])
-            year = 2000 + year if year < 50 else 1900 + year
-            month = int(lot_str[2:4])
-            day = int(lot_str[4:6])
-            return datetime(year, month, day)
-        
-        # Format YYMM (4 chữ số) - ngày cuối cùng của tháng (NGÀY HẾT HẠN)
-        elif len(lot_str) == 4:
-            year = int(lot_str[0:2])
-            month = int(lot_str[2:4])
-            year = 2000 + year if year < 50 else 1900 + year
-            
-            # Tìm ngày cuối cùng của tháng
-            if month == 12:
-                next_month = datetime(year + 1, 1, 1)
-            else:
-                next_month = datetime(year, month + 1, 1)
-            last_day = next_month - timedelta(days=1)
-            return last_day
-    except:
-        pass
-    
-    return None
+    if today is None:
+        today = datetime.now()
+    
+    expiry_dates = parse_lots_to_dates(lot_values)
+    count = len(expiry_dates)
+    shelf_life = pd.Series(np.broadcast_to(np.asarray(shelf_life_months, dtype=object), (count,)))
+    shelf_life = pd.to_numeric(shelf_life, errors='coerce').fillna(0).to_numpy(dtype=float)
+    
+    # Không có thời hạn hoặc không parse được LOT -> không tính
+    valid = (shelf_life != 0) & ~np.isnat(expiry_dates)
+    expiry_dates[~valid] = np.datetime64('NaT')
+    
+    # Thời hạn theo ngày: mỗi giá trị thời hạn khác nhau chỉ tính một lần
+    unique_shelf_life, inverse = np.unique(shelf_life, return_inverse=True)
+    shelf_deltas = np.array([timedelta(days=months * 30.44) for months in unique_shelf_life],
+                            dtype='timedelta64[us]')[inverse]
+    production_dates = expiry_dates.astype('datetime64[us]') - shelf_deltas
+    total_days = shelf_deltas // np.timedelta64(1, 'D')
+    with np.errstate(invalid='ignore'):
+        days_remaining = (expiry_dates.astype('datetime64[us]') - np.datetime64(today, 'us')) // np.timedelta64(1, 'D')
+    
+    percentages = np.full(count, None, dtype=object)
+    expired = valid & ((days_remaining <= 0) | (total_days <= 0))
+    percentages[expired] = 0
+    active = valid & ~expired
+    if active.any():
+        # Làm tròn giống round(x, 1) của Python trên từng giá trị khác nhau
+        raw = days_remaining[active] / total_days[active] * 100
+        unique_raw, inverse = np.unique(raw, return_inverse=True)
+        percentages[active] = np.array([round(float(p), 1) for p in unique_raw], dtype=object)[inverse]
+    
+    return percentages, expiry_dates, production_dates
 
-def calculate_remaining_percentage(lot_value, shelf_life_months):
+def extract_dates_from_lots(lot_series):
     """
-    Tính phần trăm hạn sử dụng còn lại
-    lot_value: Số LOT (ví dụ: "2805" = ngày hết hạn 31/05/2028)
-    shelf_life_months: Thời hạn sử dụng (tháng)
-    
-    Logic:
-    - LOT = ngày hết hạn
-    - Ngày sản xuất = ngày hết hạn - shelf_life_months
-    - % còn lại = (ngày hết hạn - hôm nay) / (ngày hết hạn - ngày sản xuất) * 100
-    
-    Returns: (remaining_percentage, expiry_date_str)
+    Phiên bản theo cột của extract_date_from_lot: xử lý cả cột LOT một lần bằng regex vector hóa
+    Trả về Series chuỗi "DD/MM/YYYY" (None nếu không trích xuất được), cùng index với đầu vào
     """
-    if not shelf_life_months or pd.isna(lot_value):
-        return None, None
-    
-    # Parse LOT -> ngày hết hạn
-    expiry_date = parse_lot_to_date(lot_value)
-    if not expiry_date:
-        return None, None
-    
-    # Tính ngày sản xuất = EDATE(ngày hết hạn, -shelf_life_months)
-    production_date = expiry_date - timedelta(days=shelf_life_months * 30.44)
-    
-    # Ngày hiện tại
-    today = datetime.now()
-    
-    # Tính tổng số ngày thời hạn sử dụng
-    total_days = (expiry_date - production_date).days
-    
-    # Tính số ngày còn lại
-    days_remaining = (expiry_date - today).days
-    
-    # Tính phần trăm
-    if days_remaining <= 0:
-        percentage = 0
-    elif total_days > 0:
-        percentage = (days_remaining / total_days) * 100
+    result = pd.Series([None] * len(lot_series), index=lot_series.index, dtype=object)
+    text = lot_series[lot_series.notna()].astype(str)
+    if text.empty:
+        return result
+    
+    # Pattern YYMMDD (6 số đầu tiên)
+    yymmdd = text.str.extract(r'(\d{6})', expand=False).dropna()
+    month = pd.to_numeric(yymmdd.str[2:4])
+    day = pd.to_numeric(yymmdd.str[4:6])
+    valid = yymmdd[month.between(1, 12) & day.between(1, 31)]
+    result[valid.index] = valid.str[4:6] + '/' + valid.str[2:4] + '/20' + valid.str[0:2]
+    
+    # Pattern YYYYMMDD (8 số) cho các LOT chưa khớp pattern 6 số
+    remaining = text[result[text.index].isna()]
+    yyyymmdd = remaining.str.extract(r'(\d{8})', expand=False).dropna()
+    month = pd.to_numeric(yyyymmdd.str[4:6])
+    day = pd.to_numeric(yyyymmdd.str[6:8])
+    valid = yyyymmdd[month.between(1, 12) & day.between(1, 31)]
+    year = pd.to_numeric(valid.str[0:4]).astype(str)
+    result[valid.index] = valid.str[6:8] + '/' + valid.str[4:6] + '/' + year
+    
+    return result
+
+def normalize_numbers(values):
+    """
+    Chuẩn hóa mảng số: số nguyên -> int, số lẻ -> float (giống float(v) if v % 1 else int(v))
+    """
+    values = np.asarray(values, dtype=float)
+    normalized = values.astype(object)
+    with np.errstate(invalid='ignore'):
+        is_whole = np.mod(values, 1) == 0
+    in_range = is_whole & (np.abs(values) < 2 ** 63)
+    normalized[in_range] = values[in_range].astype(np.int64).tolist()
+    # Số nguyên quá lớn cho int64 (hiếm gặp)
+    for i in np.flatnonzero(is_whole & ~in_range):
+        normalized[i] = int(values[i])
+    return normalized
+
+def strip_text(values):
+    """Strip cả mảng chuỗi, chuỗi rỗng -> None"""
+    stripped = values.astype(str).str.strip().to_numpy(dtype=object)
+    stripped[stripped == ''] = None
+    return stripped
+
+def materialize_column(series):
+    """
+    Chuẩn hóa kiểu dữ liệu cho cả cột một lần:
+    - Ngày tháng -> "DD/MM/YYYY"
+    - Số -> int hoặc float
+    - Chuỗi -> strip, chuỗi rỗng -> None
+    - Ô trống -> None
+    Returns: list giá trị Python theo thứ tự dòng
+    """
+    result = np.full(len(series), None, dtype=object)
+    not_null = series.notna().to_numpy()
+    values = series[not_null]
+    if values.empty:
+        return result.tolist()
+    
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        result[not_null] = values.dt.strftime("%d/%m/%Y").to_numpy(dtype=object)
+        return result.tolist()
+    if pd.api.types.is_bool_dtype(values.dtype) or pd.api.types.is_numeric_dtype(values.dtype):
+        result[not_null] = normalize_numbers(values.to_numpy())
+        return result.tolist()
+    
+    kind = pd.api.types.infer_dtype(values, skipna=False)
+    if kind in ('integer', 'floating', 'mixed-integer-float'):
+        result[not_null] = normalize_numbers(values.to_numpy())
+    elif kind == 'string':
+        result[not_null] = strip_text(values)
     else:
-        percentage = 0
-    
-    expiry_str = expiry_date.strftime("%d/%m/%Y")
+        # Cột trộn nhiều kiểu: phân nhóm theo kiểu rồi xử lý từng nhóm
+        positions = np.flatnonzero(not_null)
+        is_date = values.map(lambda v: isinstance(v, (pd.Timestamp, datetime))).to_numpy(dtype=bool)
+        is_number = values.map(lambda v: isinstance(v, (int, float))).to_numpy(dtype=bool) & ~is_date
+        is_text = ~(is_date | is_number)
+        
+        result[positions[is_date]] = [v.strftime("%d/%m/%Y") for v in values[is_date]]
+        result[positions[is_number]] = normalize_numbers(values[is_number].to_numpy())
+        result[positions[is_text]] = strip_text(values[is_text])
     
-    return round(percentage, 1), expiry_str
+    return result.tolist()
 
-def extract_date_from_lot(lot_value):
+def build_product_records(data_df, selected_columns, display_columns):
     """
-    Trích xuất ngày sản xuất từ số lô nếu có format ngày
-    Ví dụ: "LOT240512" -> "12/05/2024"
+    Chuyển các cột đã chọn thành list of dictionaries (tên cột mới)
+    Mỗi cột được chuẩn hóa kiểu một lần, sau đó ghép các dòng trong một lượt duy nhất
+    Thêm "Ngày SX từ Lô" ngay sau cột LOT/Lô nếu số lô có dạng ngày
     """
-    if pd.isna(lot_value):
-        return None
-    
-    lot_str = str(lot_value).upper()
-    
-    # Thử pattern YYMMDD (6 số)
-    match = re.search(r'(\d{6})', lot_str)
-    if match:
-        date_str = match.group(1)
-        try:
-            year = int('20' + date_str[0:2])
-            month = int(date_str[2:4])
-            day = int(date_str[4:6])
-            if 1 <= month <= 12 and 1 <= day <= 31:
-                return f"{day:02d}/{month:02d}/{year}"
-        except:
-            pass
-    
-    # Thử pattern YYYYMMDD (8 số)
-    match = re.search(r'(\d{8})', lot_str)
-    if match:
-        date_str = match.group(1)
-        try:
-            year = int(date_str[0:4])
-            month = int(date_str[4:6])
-            day = int(date_str[6:8])
-            if 1 <= month <= 12 and 1 <= day <= 31:
-                return f"{day:02d}/{month:02d}/{year}"
-        except:
-            pass
-    
-    return None
+    columns = [materialize_column(data_df[old_col]) for old_col in selected_columns]
+    
+    # Chỉ giữ dòng có ít nhất 1 cột quan trọng không null
+    keep = np.zeros(len(data_df), dtype=bool)
+    for new_col, values in zip(display_columns, columns):
+        if new_col in IMPORTANT_COLUMNS:
+            keep |= np.array([v is not None for v in values], dtype=bool)
+    
+    # Ngày SX từ Lô: lấy từ cột LOT/Lô đầu tiên trích xuất được ngày
+    lot_dates = [None] * len(data_df)
+    lot_positions = [None] * len(data_df)
+    for position, (old_col, new_col) in enumerate(zip(selected_columns, display_columns)):
+        if is_lot_column(new_col):
+            extracted = extract_dates_from_lots(data_df[old_col].reset_index(drop=True))
+            for i in np.flatnonzero(extracted.notna().to_numpy()):
+                if lot_dates[i] is None:
+                    lot_dates[i] = extracted.iat[i]
+                    lot_positions[i] = position
+    
+    return assemble_products(columns, display_columns, keep, lot_dates, lot_positions)
 
-def process_sheet_data(df, start_row, sheet_name=None):
+def detect_sheet_layout(df, start_row, sheet_name=None):
     """
-    Xử lý dữ liệu từ một sheet, bắt đầu từ dòng chỉ định
+    Xác định bố cục của sheet bằng các heuristic (header nhiều dòng, cột tên sản phẩm,
+    cột Column_X là LOT / ĐVT, chọn cột hiển thị)
     Mô phỏng quy trình: Copy > Paste Value > Xóa hàng trống > Xóa cột trống
+    
+    Returns: dict bố cục dùng cho extract_sheet_data (vị trí cột tính theo lưới thô của sheet)
     """
     # Kiểm tra xem có phải header nhiều dòng không
     first_header = df.iloc[start_row].tolist()
     second_row = df.iloc[start_row + 1].tolist() if start_row + 1 < len(df) else []
-    third_row = df.iloc[start_row + 2].tolist() if start_row + 2 < len(df) else []
-    
-    # Nếu dòng tiếp theo có "Item Code" hoặc "Products", nghĩa là đây mới là header thực
-    has_real_header_next = any(str(val).lower() in ['item code', 'products', 'cus code'] 
-                                for val in second_row if pd.notna(val))
-    
-    if has_real_header_next:
-        # Có 2 dòng header: dòng 1 là nhóm (TỒN ĐẦU KỲ, CLOSING STOCK/, ...), dòng 2 là chi tiết
-        # Nhưng các cột "Q'TY/SL" ở dòng 2 cần được map với nhóm ở dòng 1
-        
-        # Tạo map vị trí cột -> tên nhóm
-        group_map = {}
-        current_group = None
-        for i, val in enumerate(first_header):
-            if pd.notna(val) and str(val).strip():
-                current_group = str(val).strip()
-            if current_group:
-                group_map[i] = current_group
-        
-        # Merge header
-        headers = []
-        for i, h2 in enumerate(second_row):
-            if pd.notna(h2) and str(h2).strip():
-                h2_str = str(h2).strip()
-                # Nếu là "Q'TY/SL" và có group, dùng tên group
-                if h2_str.lower() in ["q'ty/sl", "qty/sl"] and i in group_map:
-                    headers.append(group_map[i])
-                else:
-                    headers.append(h2_str)
-            elif i < len(first_header) and pd.notna(first_header[i]) and str(first_header[i]).strip():
-                headers.append(str(first_header[i]).strip())
-            else:
-                headers.append(f"Column_{i}")
-        
-        # Dữ liệu bắt đầu từ dòng start_row + 2
-        data_df = df.iloc[start_row + 2:].reset_index(drop=True)
-    else:
-        # Header  bình thường
-        headers = [clean_column_name(h) if clean_column_name(h) else f"Column_{i}" 
-                   for i, h in enumerate(first_header)]
-        data_df = df.iloc[start_row + 1:].reset_index(drop=True)
+    headers, header_rows = merge_header_rows(first_header, second_row)
     
+    data_df = df.iloc[start_row + header_rows:].reset_index(drop=True)
     data_df.columns = headers
     
-    # BƯỚC 1: Tìm cột "Tên sản phẩm" hoặc "Products" 
-    product_col = None
-    for col in data_df.columns:
-        if not col:
-            continue
-        col_lower = str(col).lower()
-        # Tìm theo tên cột rõ ràng
-        if 'product' in col_lower or 'tên' in col_lower:
-            product_col = col
-            break
-    
-    # Nếu không tìm thấy, tìm cột Column_X có nội dung giống tên sản phẩm (text dài có số-chữ)
-    if not product_col:
-        for col in data_df.columns:
-            if col and col.startswith('Column_'):
-                sample_values = data_df[col].dropna().head(20)
-                if len(sample_values) >= 5:
-                    # Kiểm tra pattern: số ở đầu, theo sau là dấu gạch và text
-                    has_product_pattern = sum(1 for v in sample_values if 
-                        str(v).strip() and '-' in str(v) and str(v)[0].isdigit()) > len(sample_values) * 0.5
-                    if has_product_pattern:
-                        product_col = col
-                        break
+    # BƯỚC 1: Tìm cột "Tên sản phẩm" hoặc "Products" (thống kê các cột trước khi lọc dòng chỉ khi cần)
+    product_col = find_product_column(headers, lambda: profile_columns(data_df))
+    
+    # Vị trí cột product trong sheet (tên cột có thể bị đổi / cột bị xóa ở các bước sau)
+    product_position = headers.index(product_col) if product_col else None
     
     # BƯỚC 2: Xóa các hàng có cột "Tên sản phẩm" trống HOẶC các hàng hoàn toàn trống
     if product_col:
@@ -438,252 +384,143 @@ def process_sheet_data(df, start_row, sheet_name=None):
         data_df = data_df.dropna(how='all')
     
     # BƯỚC 3: Xóa các cột hoàn toàn trống (giống Ctrl+G > Blanks > Delete Columns)
-    data_df = data_df.dropna(axis=1, how='all')
-    
-    # Cập nhật lại headers sau khi xóa cột
-    headers = data_df.columns.tolist()
-    
-    # Debug: In ra tất cả headers
-    # print(f"DEBUG - All headers ({len(headers)}): {headers[:20]}")
+    # Thống kê mọi cột 1 lần (dùng chung cho bước 3, 4, 5), cột trống là cột không có ô dữ liệu nào
+    # Giữ lại vị trí gốc của các cột còn lại để bố cục áp dụng được trực tiếp lên lưới thô
+    column_profiles = profile_columns(data_df)
+    positions = [i for i, profile in enumerate(column_profiles) if profile.non_null > 0]
+    column_profiles = [column_profiles[i] for i in positions]
+    headers = [headers[i] for i in positions]
     
     # BƯỚC 4: Tự động xác định và đặt tên cho cột LOT và Units nếu thiếu tiêu đề
-    renamed_headers = []
-    for i, col in enumerate(headers):
-        if col.startswith('Column_'):
-            # Kiểm tra nội dung để xác định loại cột
-            sample_values = data_df[col].dropna().head(20)
-            if len(sample_values) > 0:
-                # Kiểm tra xem có phải LOT không (có pattern số + chữ)
-                has_lot_pattern = sum(1 for v in sample_values if 
-                    str(v).strip() and len(str(v)) <= 10 and 
-                    any(c.isdigit() for c in str(v))) > len(sample_values) * 0.5
-                
-                # Kiểm tra xem có phải Units không (text ngắn như "Chai", "Hộp", "Cái")
-                avg_length = sum(len(str(v)) for v in sample_values) / len(sample_values)
-                has_unit_pattern = avg_length < 10 and all(not str(v)[0].isdigit() if str(v).strip() else True for v in sample_values)
-                
-                if has_lot_pattern and avg_length < 15:
-                    renamed_headers.append('LOT')
-                elif has_unit_pattern and avg_length < 10:
-                    renamed_headers.append('ĐVT')
-                else:
-                    renamed_headers.append(col)
-            else:
-                renamed_headers.append(col)
-        else:
-            renamed_headers.append(col)
-    
-    data_df.columns = renamed_headers
-    headers = renamed_headers
-    
-    # Reset index sau khi xóa hàng
-    data_df = data_df.reset_index(drop=True)
+    headers = name_unlabeled_columns(headers, column_profiles)
     
     # BƯỚC 5: Lọc và sắp xếp các cột theo logic
-    column_mapping = smart_filter_columns(data_df, headers, sheet_name)
-    
-    if not column_mapping:
-        # Fallback: giữ tất cả cột có dữ liệu
-        column_mapping = [(col, col) for col in headers if data_df[col].notna().any()]
+    return build_layout(start_row, header_rows, product_position, headers, positions, column_profiles, sheet_name)
+
+def extract_sheet_data(df, layout):
+    """
+    Lấy dữ liệu sản phẩm theo bố cục đã xác định (không chạy lại heuristic)
+    Returns: (products, display_columns)
+    """
+    data_df = df.iloc[layout['start_row'] + layout['header_rows']:]
     
-    # Tạo dict để map tên cột cũ sang tên mới
-    col_rename_dict = {old_name: new_name for new_name, old_name in column_mapping}
-    selected_columns = [old_name for _, old_name in column_mapping]
-    display_columns = [new_name for new_name, _ in column_mapping]
+    # Xóa các hàng có cột "Tên sản phẩm" trống, hoặc các hàng hoàn toàn trống
+    if layout['product_column'] is not None:
+        product_values = data_df.iloc[:, layout['product_column']]
+        data_df = data_df[product_values.notna() & (product_values.astype(str).str.strip() != '')]
+    else:
+        data_df = data_df.dropna(how='all')
     
-    # Chỉ giữ các cột đã chọn
-    data_df = data_df[selected_columns]
+    # Chỉ giữ các cột đã chọn còn dữ liệu
+    columns = [column for column in layout['columns'] if data_df.iloc[:, column[2]].notna().any()]
+    data_df = data_df.iloc[:, [position for _, _, position in columns]].reset_index(drop=True)
+    selected_columns = [old_name for _, old_name, _ in columns]
+    display_columns = [new_name for new_name, _, _ in columns]
+    data_df.columns = selected_columns
     
-    # Chuyển đổi thành list of dictionaries với tên cột mới
-    products = []
-    for _, row in data_df.iterrows():
-        product = {}
-        has_data = False
-        
-        for old_col, new_col in zip(selected_columns, display_columns):
-            value = row[old_col]
-            if pd.isna(value):
-                product[new_col] = None
-            elif isinstance(value, (pd.Timestamp, datetime)):
-                product[new_col] = value.strftime("%d/%m/%Y")
-                has_data = True
-            elif isinstance(value, (int, float)):
-                product[new_col] = float(value) if value % 1 else int(value)
-                has_data = True
-            else:
-                value_str = str(value).strip()
-                if value_str:  # Chỉ thêm nếu không rỗng
-                    product[new_col] = value_str
-                    has_data = True
-                else:
-                    product[new_col] = None
-            
-            # Thêm cột "Ngày SX từ Lô" nếu có cột LOT/Lô
-            if new_col and ('lot' in new_col.lower() or 'lô' in new_col.lower()) and value:
-                extracted_date = extract_date_from_lot(value)
-                if extracted_date and 'Ngày SX từ Lô' not in product:
-                    product['Ngày SX từ Lô'] = extracted_date
-                    has_data = True
-        
-        # Chỉ thêm dòng có dữ liệu thực sự
-        if has_data:
-            # Kiểm tra xem có ít nhất 1 cột quan trọng không null
-            important_values = [v for k, v in product.items() if k in ['Mã', 'Tên sản phẩm', 'Tên', 'LOT', 'Số lượng tồn', 'CLOSING STOCK/']]
-            if any(v is not None for v in important_values):
-                products.append(product)
+    # Chuyển đổi thành list of dictionaries với tên cột mới (xử lý theo cột)
+    products = build_product_records(data_df, selected_columns, display_columns)
     
     return products, display_columns
 
-def convert_excel_to_json(excel_file=None, output_file='inventory_data.json'):
+def process_sheet_data(df, start_row, sheet_name=None):
     """
-    Chuyển đổi file Excel sang JSON (tất cả các sheet)
-    
-    Parameters:
-    - excel_file: Tên file Excel (nếu None, sẽ tự động tìm file mới nhất)
-    - output_file: Tên file JSON output
+    Xử lý dữ liệu từ một sheet, bắt đầu từ dòng chỉ định
+    Returns: (products, display_columns)
     """
-    
-    try:
-        # Load cấu hình thời hạn sử dụng
-        config = load_product_config()
-        
-        # Tự động tìm file Excel nếu không được chỉ định
-        if excel_file is None:
-            excel_file = find_excel_file()
-            print(f"Đã tìm thấy file: {excel_file}")
-        
-        # Lấy ngày từ tên file (ví dụ: 22.12.xlsx -> 22/12/2025)
-        try:
-            file_name = os.path.splitext(excel_file)[0]
-            date_parts = file_name.split('.')
-            if len(date_parts) == 2:
-                day, month = date_parts
-                current_year = datetime.now().year
-                date_ton_kho = f"{day.zfill(2)}/{month.zfill(2)}/{current_year}"
-            else:
-                date_ton_kho = datetime.now().strftime("%d/%m/%Y")
-        except:
-            date_ton_kho = datetime.now().strftime("%d/%m/%Y")
-        
-        # Đọc tất cả các sheet
-        excel_file_obj = pd.ExcelFile(excel_file)
-        sheet_names = excel_file_obj.sheet_names
-        
-        print(f"\nĐang xử lý {len(sheet_names)} sheet(s)...")
-        
-        sheets_data = []
-        total_products = 0
-        
-        for sheet_name in sheet_names:
-            print(f"\n  📄 Đang xử lý sheet: {sheet_name}")
-            
-            # Đọc sheet với header=None để tự xử lý
-            df = pd.read_excel(excel_file, sheet_name=sheet_name, header=None)
-            
-            # Tìm dòng bắt đầu có "mã" và "tên sản phẩm"
-            start_row = find_data_start_row(df)
-            print(f"     - Dòng bắt đầu dữ liệu: {start_row + 1}")
-            
-            # Xử lý dữ liệu từ sheet
-            products, selected_columns = process_sheet_data(df, start_row, sheet_name)
-            
-            # Thêm cột % Còn lại và Hạn sử dụng cho các sheet có hạn
-            if products and sheet_name in config['shelf_life_months']:
-                # Lấy thời hạn mặc định cho sheet
-                default_shelf_life = config['shelf_life_months'].get(sheet_name)
-                
-                # Nếu là dict (PIN FUJITSU), xử lý riêng
-                if isinstance(default_shelf_life, dict):
-                    # Thêm cột "Thời hạn (tháng)" để người dùng có thể chọn
-                    if 'Thời hạn (tháng)' not in selected_columns:
-                        selected_columns.insert(3, 'Thời hạn (tháng)')  # Chèn sau LOT
-                    if '% Còn lại' not in selected_columns:
-                        selected_columns.insert(4, '% Còn lại')
-                    if 'Ngày hết hạn' not in selected_columns:
-                        selected_columns.insert(5, 'Ngày hết hạn')
-                    
-                    for product in products:
-                        product_code = str(product.get('Mã', '')).strip()  # Chuyển sang string và trim
-                        
-                        # Xử lý lot_number: None -> rỗng
-                        lot_value = product.get('LOT')
-                        lot_number = str(lot_value).strip() if lot_value not in [None, '', 'None', 'nan'] else ''
-                        
-                        # Tạo unique key: LUÔN dùng format product_code_lot_number
-                        unique_key = f"{product_code}_{lot_number}"
-                        
-                        # Lấy thời hạn đã lưu hoặc mặc định 36 tháng
-                        shelf_life = config['product_specific_shelf_life'].get(unique_key, 36)
-                        product['Thời hạn (tháng)'] = shelf_life
-                        
-                        # Tính % còn lại
-                        lot_value = product.get('LOT')
-                        if lot_value:
-                            percentage, expiry_date = calculate_remaining_percentage(lot_value, shelf_life)
-                            product['% Còn lại'] = percentage
-                            product['Ngày hết hạn'] = expiry_date
-                        else:
-                            product['% Còn lại'] = None
-                            product['Ngày hết hạn'] = None
-                else:
-                    # Sheet khác (BAKING SODA, AZARINE): thời hạn cố định
-                    if '% Còn lại' not in selected_columns:
-                        selected_columns.insert(3, '% Còn lại')  # Chèn sau LOT
-                    if 'Ngày hết hạn' not in selected_columns:
-                        selected_columns.insert(4, 'Ngày hết hạn')
-                    
-                    for product in products:
-                        lot_value = product.get('LOT')
-                        if lot_value:
-                            percentage, expiry_date = calculate_remaining_percentage(lot_value, default_shelf_life)
-                            product['% Còn lại'] = percentage
-                            product['Ngày hết hạn'] = expiry_date
-                        else:
-                            product['% Còn lại'] = None
-                            product['Ngày hết hạn'] = None
-            
-            if products:
-                sheets_data.append({
-                    "sheet_name": sheet_name,
-                    "products": products,
-                    "total_products": len(products),
-                    "columns": selected_columns
-                })
-                total_products += len(products)
-                print(f"     - Số sản phẩm: {len(products)}")
-                print(f"     - Các cột hiển thị: {', '.join(selected_columns[:5])}{'...' if len(selected_columns) > 5 else ''}")
-            else:
-                print(f"     ⚠ Không có dữ liệu")
-        
-        # Tạo cấu trúc JSON với metadata
-        inventory_data = {
-            "metadata": {
-                "date_ton_kho": date_ton_kho,
-                "source_file": excel_file,
-                "last_updated": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-                "total_sheets": len(sheets_data),
-                "total_products": total_products
-            },
-            "sheets": sheets_data
-        }
-        
-        # Lưu vào file JSON
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(inventory_data, f, ensure_ascii=False, indent=2)
-        
-        print(f"\n✓ Đã chuyển đổi thành công!")
-        print(f"  - File nguồn: {excel_file}")
-        print(f"  - File đích: {output_file}")
-        print(f"  - Ngày tồn kho: {date_ton_kho}")
-        print(f"  - Tổng số sheet: {len(sheets_data)}")
-        print(f"  - Tổng số sản phẩm: {total_products}")
-        
-        return inventory_data
-        
-    except Exception as e:
-        print(f"✗ Lỗi khi chuyển đổi: {str(e)}")
-        raise
+    return extract_sheet_data(df, detect_sheet_layout(df, start_row, sheet_name))
+
+def layout_fingerprint(df, sheet_name, start_row, header_rows):
+    """
+    Dấu vân tay bố cục: tên sheet + các ô header thô (bỏ ô trống ở cuối dòng)
+    None nếu sheet không còn đủ dòng tới vị trí header
+    """
+    if start_row + header_rows > len(df):
+        return None
+    cells = [['' if pd.isna(value) else str(value).strip() for value in row]
+             for row in df.iloc[start_row:start_row + header_rows].itertuples(index=False)]
+    return fingerprint_rows(sheet_name, start_row, cells)
+
+def resolve_sheet_layout(df, sheet_name, layouts, layout_changes):
+    """Bố cục của sheet (dùng lại bố cục đã lưu nếu header không đổi), xem convert_core.resolve_sheet_layout"""
+    return convert_core.resolve_sheet_layout(ENGINE, df, sheet_name, layouts, layout_changes)
+
+def convert_excel_to_json(excel_file=None, output_file='inventory_data.json', compact=False,
+                          history_dir=history_store.HISTORY_DIR, db_path=None,
+                          layout_cache_file=LAYOUT_CACHE_FILE,
+                          metrics_file=conversion_metrics.METRICS_FILE, trace_memory=False, split=None,
+                          source_name=None):
+    """
+    Chuyển đổi file Excel sang JSON (tất cả các sheet) bằng pandas
+    Tham số: xem convert_core.convert_workbook
+    """
+    return convert_core.convert_workbook(ENGINE, excel_file, output_file, compact=compact,
+                                         history_dir=history_dir, db_path=db_path,
+                                         layout_cache_file=layout_cache_file,
+                                         metrics_file=metrics_file, trace_memory=trace_memory, split=split,
+                                         source_name=source_name)
+
+def recalculate_inventory(inventory_data, config, today=None):
+    """
+    Tính lại Thời hạn (tháng), % Còn lại và Ngày hết hạn trực tiếp trên dữ liệu JSON đã có
+    Returns: số dòng đã được tính lại
+    """
+    return convert_core.recalculate_inventory(ENGINE, inventory_data, config, today)
+
+def recalculate_shelf_life(data_file='inventory_data.json', db_path=None):
+    """Chỉ tính lại phần hạn sử dụng từ inventory_data.json (hoặc database) hiện có, không đọc lại file Excel"""
+    return convert_core.recalculate_shelf_life(ENGINE, data_file, db_path)
+
+def load_cached_conversion(cache, key, output_file='inventory_data.json', compact=False,
+                           excel_file=None, history_dir=history_store.HISTORY_DIR, db_path=None,
+                           metrics_file=conversion_metrics.METRICS_FILE, split=None):
+    """
+    Lấy kết quả chuyển đổi từ cache (ConversionCache) và ghi ra output_file
+    Returns: inventory_data, hoặc None nếu cache chưa có key này
+    """
+    return convert_core.load_cached_conversion(ENGINE, cache, key, output_file, compact=compact,
+                                               excel_file=excel_file, history_dir=history_dir,
+                                               db_path=db_path, metrics_file=metrics_file, split=split)
 
 if __name__ == "__main__":
-    # Chạy chuyển đổi - tự động tìm file Excel mới nhất
-    convert_excel_to_json()
+    parser = argparse.ArgumentParser(description="Chuyển đổi file Excel tồn kho sang JSON")
+    parser.add_argument('--recalculate', action='store_true',
+                        help="Chỉ tính lại % còn lại từ inventory_data.json hiện có (không đọc Excel)")
+    parser.add_argument('--compact', action='store_true',
+                        help="Lưu dạng cột gọn (không indent) kèm bản nén .gz/.br")
+    parser.add_argument('--db', nargs='?', const=sqlite_store.DB_FILE, default=None,
+                        help=f"Lưu dữ liệu vào database SQLite (mặc định {sqlite_store.DB_FILE}), "
+                             "inventory_data.json được xuất ra từ database")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Đo đỉnh bộ nhớ từng bước bằng tracemalloc (chậm hơn nhiều lần)")
+    parser.add_argument('--stream', action='store_true',
+                        help="Chuyển đổi theo luồng cho file rất lớn: bộ nhớ không tăng theo số dòng (stream_convert)")
+    parser.add_argument('--watch', action='store_true',
+                        help="Chạy liên tục: tự chuyển đổi mỗi file Excel mới được chép vào thư mục (watch_folder)")
+    parser.add_argument('--poll', action='store_true',
+                        help="Dùng với --watch: quét thư mục định kỳ thay cho inotify (thư mục mạng, Windows)")
+    parser.add_argument('--split', action='store_true',
+                        help="Ghi thêm manifest + 1 file mỗi sheet (inventory_data/) để website chỉ tải sheet đang xem")
+    args = parser.parse_args()
+    
+    if args.recalculate:
+        recalculate_shelf_life(db_path=args.db)
+    elif args.watch:
+        import functools
+        import watch_folder
+        if args.stream:
+            import stream_convert
+            convert = stream_convert.convert_excel_to_json
+        else:
+            convert = convert_excel_to_json
+        watch_folder.watch_folder(functools.partial(convert, compact=args.compact, db_path=args.db,
+                                                    trace_memory=args.trace_memory, split=args.split or None),
+                                  poll=args.poll)
+    elif args.stream:
+        import stream_convert
+        stream_convert.convert_excel_to_json(compact=args.compact, db_path=args.db, trace_memory=args.trace_memory,
+                                             split=args.split or None)
+    else:
+        # Chạy chuyển đổi - tự động tìm file Excel mới nhất
+        convert_excel_to_json(compact=args.compact, db_path=args.db, trace_memory=args.trace_memory,
+                              split=args.split or None)
@@ -0,0 +1,552 @@
+"""
+Ghi file an toàn cho product_config.json và inventory_data.json
+- atomic_write_json: ghi ra file tạm cùng thư mục rồi os.replace -> người đọc không bao giờ thấy file ghi dở
+- file_lock: khóa file (fcntl / msvcrt) để nhiều request, nhiều process không ghi đè lên nhau
+- Cập nhật thời hạn đi qua write-ahead log (product_config.json.wal):
+  ghi thay đổi vào log trước, rồi mới thay file cấu hình; nếu bị dừng giữa chừng,
+  lần đọc sau sẽ áp dụng lại phần còn trong log
+- write_inventory / read_inventory: ghi/đọc inventory_data.json, tùy chọn dạng cột gọn (compact)
+  kèm bản nén sẵn .gz và .br để server gửi thẳng cho trình duyệt; dữ liệu lớn được ghi dần (iter_json)
+- write_partitions: tách thêm thành manifest nhỏ + 1 file mỗi sheet (inventory_data/) để website
+  chỉ tải sheet đang xem
+Module này không phụ thuộc pandas để dùng được từ server và các API nhẹ
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    import brotli
+except ImportError:  # Không bắt buộc: thiếu brotli thì chỉ tạo bản .gz
+    brotli = None
+
+CONFIG_FILE = 'product_config.json'
+LOCK_TIMEOUT = 30  # giây
+
+# Bản nén sẵn của file output: encoding (theo Accept-Encoding) -> đuôi file
+COMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+COLUMNAR_FORMAT = 'columnar'
+BROTLI_QUALITY = 9  # Nén 1 lần lúc chuyển đổi, đọc nhiều lần
+JSON_BATCH_SIZE = 1000  # Số phần tử mỗi lần json.dumps khi ghi dần (iter_json)
+# Bản tách theo sheet: inventory_data.json -> inventory_data/manifest.json + inventory_data/sheet_<i>.json
+MANIFEST_FILE = 'manifest.json'
+SHEET_FILE = 'sheet_{}.json'
+
+DEFAULT_CONFIG = {
+    "shelf_life_months": {
+        "BAKING SODA": 36,
+        "AZARINE": 36,
+        "PIN FUJITSU": {}
+    },
+    "product_specific_shelf_life": {}
+}
+
+# umask của process, để file ghi nguyên tử có quyền như file tạo bằng open() (mkstemp luôn tạo 0600)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def default_config():
+    """Cấu hình mặc định (bản sao mới, có thể sửa thoải mái)"""
+    return json.loads(json.dumps(DEFAULT_CONFIG))
+
+@contextmanager
+def file_lock(path, timeout=LOCK_TIMEOUT):
+    """
+    Khóa độc quyền cho path (dùng file path + '.lock' riêng để không đụng tới file dữ liệu)
+    Chờ tối đa timeout giây, quá thời gian thì ném TimeoutError
+    """
+    lock_path = f"{path}.lock"
+    deadline = time.monotonic() + timeout
+    with open(lock_path, 'a+b') as lock_file:
+        while True:
+            try:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Không lấy được khóa cho {path}")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def atomic_write_bytes(path, data):
+    """
+    Ghi bytes ra path một cách nguyên tử:
+    ghi file tạm trong cùng thư mục, fsync, rồi os.replace đè lên file cũ
+    """
+    with atomic_writer(path) as f:
+        f.write(data)
+
+@contextmanager
+def atomic_writer(path):
+    """
+    Như atomic_write_bytes nhưng cho ghi dần: with atomic_writer(path) as f: f.write(...)
+    File chỉ thay file cũ khi khối with kết thúc không lỗi
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def atomic_write_json(path, data, indent=2):
+    """Ghi data ra path dạng JSON một cách nguyên tử; indent=None -> không xuống dòng, bỏ khoảng trắng"""
+    separators = (',', ':') if indent is None else None
+    text = json.dumps(data, ensure_ascii=False, indent=indent, separators=separators)
+    atomic_write_bytes(path, text.encode('utf-8'))
+
+def read_json(path, default=None):
+    """Đọc file JSON, trả về default nếu chưa có file hoặc file hỏng"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def _wal_path(config_path):
+    return f"{config_path}.wal"
+
+def _read_wal(config_path):
+    """Các thay đổi còn nằm trong log (bỏ qua dòng trống và dòng bị ghi dở)"""
+    entries = []
+    try:
+        with open(_wal_path(config_path), 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return entries
+
+def _apply_shelf_life_updates(config, updates):
+    specific = config.setdefault('product_specific_shelf_life', {})
+    for key, months in updates:
+        specific[key] = months
+    return config
+
+def load_product_config(config_path=CONFIG_FILE):
+    """
+    Load cấu hình thời hạn sử dụng, áp dụng thêm các thay đổi còn trong write-ahead log
+    Trả về cấu hình mặc định nếu chưa có file
+    """
+    config = read_json(config_path)
+    if not isinstance(config, dict):
+        config = default_config()
+    for entry in _read_wal(config_path):
+        _apply_shelf_life_updates(config, entry.get('updates', []))
+    return config
+
+def save_product_config(config, config_path=CONFIG_FILE):
+    """Lưu toàn bộ cấu hình (có khóa, ghi nguyên tử)"""
+    with file_lock(config_path):
+        atomic_write_json(config_path, config)
+        _clear_wal(config_path)
+
+def _clear_wal(config_path):
+    try:
+        os.remove(_wal_path(config_path))
+    except FileNotFoundError:
+        pass
+
+def update_product_shelf_life(updates, config_path=CONFIG_FILE):
+    """
+    Lưu nhiều thời hạn riêng cùng lúc với 1 lần ghi file
+    updates: list (unique_key, shelf_life_months)
+
+    Trình tự: khóa -> ghi thay đổi vào WAL (fsync) -> đọc cấu hình + WAL -> ghi nguyên tử -> xóa WAL
+    Returns: cấu hình sau khi cập nhật
+    """
+    updates = [[key, months] for key, months in updates]
+    with file_lock(config_path):
+        with open(_wal_path(config_path), 'a', encoding='utf-8') as wal:
+            # Xuống dòng trước để không dính vào dòng ghi dở của lần bị dừng trước
+            wal.write('\n' + json.dumps({'updates': updates}, ensure_ascii=False) + '\n')
+            wal.flush()
+            os.fsync(wal.fileno())
+
+        config = load_product_config(config_path)
+        atomic_write_json(config_path, config)
+        _clear_wal(config_path)
+    return config
+
+def shelf_life_updates(items):
+    """
+    Chuyển danh sách {product_code, lot_number, shelf_life_months} từ request
+    thành list (unique_key, shelf_life_months); lỗi ValueError nếu thiếu thông tin
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError('Danh sách cập nhật rỗng')
+
+    updates = []
+    for item in items:
+        product_code = str(item.get('product_code', '')).strip()
+        lot_number = str(item.get('lot_number', '') or '').strip()
+        shelf_life_months = item.get('shelf_life_months')
+        # lot_number có thể rỗng
+        if not product_code or shelf_life_months is None:
+            raise ValueError('Missing required fields')
+        # Unique key: LUÔN dùng format product_code_lot_number
+        updates.append((f"{product_code}_{lot_number}", int(shelf_life_months)))
+    return updates
+
+def to_columnar(inventory_data):
+    """
+    Chuyển inventory_data sang dạng cột: mỗi sheet lưu data = {tên cột: [giá trị từng dòng]}
+    thay cho list products lặp lại tên cột ở mọi dòng (giữ thứ tự cột như trong products)
+    Dòng không có cột đó (khác với giá trị null) được ghi trong missing = {tên cột: [chỉ số dòng]}
+    """
+    sheets = []
+    for sheet in inventory_data.get('sheets', []):
+        products = sheet.get('products', [])
+        # Thứ tự cột theo dòng có nhiều cột nhất (các dòng khác chỉ thiếu bớt cột)
+        keys = dict.fromkeys(max(products, key=len, default={}))
+        for product in products:
+            keys.update(dict.fromkeys(product))
+        entry = {key: value for key, value in sheet.items() if key != 'products'}
+        entry['data'] = {key: [product.get(key) for product in products] for key in keys}
+        missing = {key: [i for i, product in enumerate(products) if key not in product] for key in keys}
+        missing = {key: rows for key, rows in missing.items() if rows}
+        if missing:
+            entry['missing'] = missing
+        sheets.append(entry)
+
+    metadata = dict(inventory_data.get('metadata', {}))
+    metadata['format'] = COLUMNAR_FORMAT
+    return {'metadata': metadata, 'sheets': sheets}
+
+def _column_values(products, key):
+    return (product.get(key) for product in products)
+
+def _missing_rows(products, key):
+    return (i for i, product in enumerate(products) if key not in product)
+
+def _product_columns(products):
+    """
+    1 lần đọc products: thứ tự cột (như to_columnar - theo dòng có nhiều cột nhất, rồi các cột gặp sau),
+    số dòng có từng cột và tổng số dòng
+    """
+    longest = {}
+    counts = {}
+    rows = 0
+    for product in products:
+        rows += 1
+        if len(product) > len(longest):
+            longest = product
+        for key in product:
+            counts[key] = counts.get(key, 0) + 1
+    keys = dict.fromkeys(longest)
+    keys.update(dict.fromkeys(counts))
+    return keys, counts, rows
+
+def to_columnar_stream(inventory_data):
+    """
+    Như to_columnar cho products là iterable đọc lại được nhiều lần (vd. engine theo luồng lưu tạm trên đĩa):
+    data / missing của mỗi cột là generator, mỗi cột đọc lại products 1 lần khi ghi file (iter_json)
+    """
+    sheets = []
+    for sheet in inventory_data.get('sheets', []):
+        products = sheet.get('products', [])
+        keys, counts, rows = _product_columns(products)
+        entry = {key: value for key, value in sheet.items() if key != 'products'}
+        entry['data'] = {key: _column_values(products, key) for key in keys}
+        missing = {key: _missing_rows(products, key) for key in keys if counts[key] < rows}
+        if missing:
+            entry['missing'] = missing
+        sheets.append(entry)
+
+    metadata = dict(inventory_data.get('metadata', {}))
+    metadata['format'] = COLUMNAR_FORMAT
+    return {'metadata': metadata, 'sheets': sheets}
+
+def iter_json(value, indent=None, level=0, batch_size=JSON_BATCH_SIZE):
+    """
+    json.dumps(value, ensure_ascii=False) theo từng đoạn (ghép lại giống hệt từng byte),
+    để ghi dữ liệu lớn mà không dựng cả chuỗi JSON trong bộ nhớ
+    indent=None: không xuống dòng, bỏ khoảng trắng (như atomic_write_json)
+    dict / list / tuple được duyệt đệ quy; iterable khác (generator, dữ liệu lưu tạm trên đĩa) là 1 mảng
+    chỉ chứa giá trị JSON thường, được đọc dần và ghi theo lô batch_size phần tử
+    """
+    separators = (',', ':') if indent is None else (',', ': ')
+    newline = '' if indent is None else '\n' + ' ' * (indent * (level + 1))
+    closing = '' if indent is None else '\n' + ' ' * (indent * level)
+
+    def dump(item):
+        return json.dumps(item, ensure_ascii=False, indent=indent, separators=separators)
+
+    if isinstance(value, dict):
+        if not value:
+            yield '{}'
+            return
+        for i, (key, item) in enumerate(value.items()):
+            yield ('{' if i == 0 else ',') + newline + dump(key) + separators[1]
+            yield from iter_json(item, indent, level + 1, batch_size)
+        yield closing + '}'
+    elif isinstance(value, (list, tuple)):
+        if not value:
+            yield '[]'
+            return
+        for i, item in enumerate(value):
+            yield ('[' if i == 0 else ',') + newline
+            yield from iter_json(item, indent, level + 1, batch_size)
+        yield closing + ']'
+    elif isinstance(value, str) or not hasattr(value, '__iter__'):
+        yield dump(value)
+    else:
+        iterator = iter(value)
+        started = False
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                break
+            text = dump(batch)
+            if indent is None:
+                text = text[1:-1]
+            else:
+                # Bỏ "[\n" và "\n]", lùi các dòng vào thêm level mức
+                padding = '\n' + ' ' * (indent * level)
+                text = padding + text[2:-2].replace('\n', padding)
+            yield (',' if started else '[') + text
+            started = True
+        yield (closing + ']') if started else '[]'
+
+def from_columnar(inventory_data):
+    """Chuyển dữ liệu dạng cột về dạng products (list dict), dữ liệu dạng dòng trả về nguyên vẹn"""
+    metadata = dict(inventory_data.get('metadata', {}))
+    if metadata.pop('format', None) != COLUMNAR_FORMAT:
+        return inventory_data
+
+    sheets = []
+    for sheet in inventory_data.get('sheets', []):
+        data = sheet.get('data', {})
+        missing = sheet.get('missing', {})
+        entry = {key: value for key, value in sheet.items() if key not in ('data', 'missing')}
+        keys = list(data)
+        products = [dict(zip(keys, values)) for values in zip(*data.values())]
+        for key, rows in missing.items():
+            for i in rows:
+                products[i].pop(key, None)
+        entry['products'] = products
+        sheets.append(entry)
+    return {'metadata': metadata, 'sheets': sheets}
+
+def write_inventory(path, inventory_data, compact=False, split=None):
+    """
+    Ghi inventory_data (dạng products) ra path một cách nguyên tử
+    compact=True: lưu dạng cột, không pretty-print, kèm bản nén path.gz và path.br
+    compact=False: định dạng cũ (indent=2); xóa các bản nén cũ để không bị gửi nhầm dữ liệu cũ
+    products có thể là iterable đọc lại được thay cho list (engine theo luồng lưu tạm trên đĩa):
+    khi đó file được ghi dần, không dựng cả chuỗi JSON trong bộ nhớ (cùng nội dung từng byte)
+    split: True -> ghi thêm bản tách theo sheet (write_partitions), False -> xóa bản tách,
+    None -> giữ như đang có (đã có bản tách thì ghi lại để không bị lệch với path)
+    Người gọi tự giữ file_lock(path) nếu cần
+    """
+    _write_json_file(path, inventory_data, compact, to_columnar, to_columnar_stream)
+
+    if split is None:
+        split = has_partitions(path)
+    if split:
+        write_partitions(path, inventory_data, compact=compact)
+    else:
+        remove_partitions(path)
+
+def _write_json_file(path, data, compact, columnar, columnar_stream):
+    """
+    Ghi data (có products) ra path: dạng dòng indent=2, hoặc dạng cột gọn (columnar / columnar_stream) kèm bản nén
+    Dữ liệu có products không phải list (lưu tạm trên đĩa) được ghi dần
+    """
+    sheets = data['sheets'] if 'sheets' in data else [data]
+    streamed = any(not isinstance(sheet.get('products', []), list) for sheet in sheets)
+    if not compact:
+        if streamed:
+            write_json_stream(path, data)
+        else:
+            atomic_write_json(path, data)
+        _remove_compressed(path)
+        return
+
+    if streamed:
+        write_json_stream(path, columnar_stream(data), indent=None)
+        compress_file(path)
+        return
+
+    raw = json.dumps(columnar(data), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    atomic_write_bytes(path, raw)
+    atomic_write_bytes(path + COMPRESSED_SUFFIXES['gzip'], gzip.compress(raw, compresslevel=9, mtime=0))
+    if brotli is not None:
+        atomic_write_bytes(path + COMPRESSED_SUFFIXES['br'], brotli.compress(raw, quality=BROTLI_QUALITY))
+
+def _remove_compressed(path):
+    for suffix in COMPRESSED_SUFFIXES.values():
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+def partition_dir(path):
+    """Thư mục bản tách theo sheet của path: inventory_data.json -> inventory_data"""
+    root, ext = os.path.splitext(path)
+    return root if ext else path + '.parts'
+
+def has_partitions(path):
+    return os.path.exists(os.path.join(partition_dir(path), MANIFEST_FILE))
+
+def _sheet_to_columnar(sheet):
+    return to_columnar({'sheets': [sheet]})['sheets'][0]
+
+def _sheet_to_columnar_stream(sheet):
+    return to_columnar_stream({'sheets': [sheet]})['sheets'][0]
+
+def write_partitions(path, inventory_data, compact=False):
+    """
+    Tách inventory_data thành các file trong partition_dir(path):
+    - sheet_<i>.json: 1 sheet (cùng định dạng với sheet trong path: dạng dòng, hoặc dạng cột kèm bản nén)
+    - manifest.json: metadata (trừ metrics) + thông tin từng sheet (không có products) kèm columns, file
+      và version (hash nội dung file sheet - không đổi thì trình duyệt dùng lại bản đã tải)
+    manifest được ghi sau cùng; file sheet thừa của lần trước bị xóa
+    """
+    directory = partition_dir(path)
+    os.makedirs(directory, exist_ok=True)
+
+    entries = []
+    files = set()
+    for i, sheet in enumerate(inventory_data.get('sheets', [])):
+        file_name = SHEET_FILE.format(i)
+        sheet_path = os.path.join(directory, file_name)
+        _write_json_file(sheet_path, sheet, compact, _sheet_to_columnar, _sheet_to_columnar_stream)
+        files.add(file_name)
+
+        entry = {key: value for key, value in sheet.items() if key != 'products'}
+        entry['columns'] = list(_product_columns(sheet.get('products', []))[0])
+        entry['file'] = file_name
+        entry['version'] = _file_digest(sheet_path)
+        entries.append(entry)
+
+    # Số liệu từng bước (metrics) chỉ để chẩn đoán, vẫn có trong path - manifest chỉ giữ phần website cần
+    metadata = {key: value for key, value in inventory_data.get('metadata', {}).items() if key != 'metrics'}
+    if compact:
+        metadata['format'] = COLUMNAR_FORMAT
+    atomic_write_json(os.path.join(directory, MANIFEST_FILE), {'metadata': metadata, 'sheets': entries},
+                      indent=None if compact else 2)
+
+    for name in os.listdir(directory):
+        base = name
+        for suffix in COMPRESSED_SUFFIXES.values():
+            if base.endswith(suffix):
+                base = base[:-len(suffix)]
+        if base.startswith('sheet_') and base.endswith('.json') and base not in files:
+            os.remove(os.path.join(directory, name))
+
+def remove_partitions(path):
+    """Xóa bản tách theo sheet của path (nếu có)"""
+    directory = partition_dir(path)
+    if has_partitions(path):
+        shutil.rmtree(directory, ignore_errors=True)
+
+def _file_digest(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()[:20]
+
+def write_json_stream(path, data, indent=2):
+    """Như atomic_write_json nhưng ghi dần từng đoạn (iter_json)"""
+    with atomic_writer(path) as f:
+        for piece in iter_json(data, indent):
+            f.write(piece.encode('utf-8'))
+
+def compress_file(path, block_size=1 << 20):
+    """Tạo bản nén path.gz và path.br (như write_inventory compact) bằng cách đọc dần path"""
+    with open(path, 'rb') as source, atomic_writer(path + COMPRESSED_SUFFIXES['gzip']) as target:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=target, compresslevel=9, mtime=0) as archive:
+            shutil.copyfileobj(source, archive, block_size)
+    if brotli is not None:
+        with open(path, 'rb') as source, atomic_writer(path + COMPRESSED_SUFFIXES['br']) as target:
+            compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            for block in iter(lambda: source.read(block_size), b''):
+                target.write(compressor.process(block))
+            target.write(compressor.finish())
+
+def read_inventory(path):
+    """
+    Đọc inventory_data.json (dạng dòng hoặc dạng cột)
+    Returns: (inventory_data dạng products, compact) - compact cho biết file đang ở dạng cột
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    compact = raw.get('metadata', {}).get('format') == COLUMNAR_FORMAT
+    return from_columnar(raw), compact
+
+def accepted_encodings(accept_encoding):
+    """Parse header Accept-Encoding -> dict encoding -> q (bỏ các encoding bị từ chối q=0)"""
+    encodings = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return {name: q for name, q in encodings.items() if q > 0}
+
+def compressed_variants(path):
+    """Các bản nén còn mới (không cũ hơn file gốc): encoding -> đường dẫn"""
+    try:
+        source_mtime = os.stat(path).st_mtime
+    except OSError:
+        return {}
+    variants = {}
+    for encoding, suffix in COMPRESSED_SUFFIXES.items():
+        try:
+            if os.stat(path + suffix).st_mtime >= source_mtime:
+                variants[encoding] = path + suffix
+        except OSError:
+            pass
+    return variants
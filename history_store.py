@@ -0,0 +1,302 @@
+"""
+Lưu lịch sử các lần chuyển đổi (snapshot) để so sánh tồn kho giữa các ngày
+Cấu trúc thư mục history/:
+- rows.jsonl: kho dòng dùng chung, mỗi dòng sản phẩm khác nhau chỉ lưu 1 lần (dòng không đổi giữa các ngày không bị lưu lại)
+  Chỉ lưu các cột lấy từ file Excel: các cột tính theo ngày (DERIVED_COLUMNS) nằm trong manifest của từng snapshot
+- rows.idx.sqlite: hash nội dung dòng -> vị trí (offset) trong rows.jsonl (tra từng lô, chỉ thêm dòng mới,
+  không đọc / ghi lại cả index mỗi lần lưu)
+- snapshots/<ngày>_<file nguồn>.json.gz: manifest của snapshot, mỗi sheet chỉ gồm
+  [Mã, LOT, số lượng, offset, giá trị các cột DERIVED_COLUMNS (null nếu sheet không có hạn)]
+  theo thứ tự dòng trong file, được ghi dần trong lúc lưu dòng (không giữ cả manifest trong bộ nhớ)
+- index.json: danh sách snapshot theo ngày tồn kho (metadata.date_ton_kho) và file nguồn
+So sánh 2 ngày chỉ đọc 2 manifest (không đọc lại toàn bộ dữ liệu), dòng chi tiết được đọc theo offset khi cần
+Module này không phụ thuộc pandas để dùng được từ server và các API nhẹ
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime
+from itertools import islice
+
+import file_store
+from inventory_index import find_column, normalize_key, to_number, LOT_KEYWORDS, QUANTITY_KEYWORDS
+
+HISTORY_DIR = 'history'
+# Cột do add_shelf_life tính theo ngày chạy: đổi mỗi ngày dù dòng trong Excel không đổi -> không đưa vào kho dòng
+DERIVED_COLUMNS = ('Thời hạn (tháng)', '% Còn lại', 'Ngày hết hạn')
+LOOKUP_BATCH = 500  # Số hash mỗi lần tra rows.idx.sqlite (dưới giới hạn 999 tham số của SQLite cũ)
+
+def snapshot_date(date_ton_kho):
+    """'dd/mm/YYYY' (hoặc 'YYYY-MM-DD') -> 'YYYY-MM-DD'; ValueError nếu không phải ngày"""
+    value = str(date_ton_kho or '').strip()
+    for date_format in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, date_format).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ValueError(f"Ngày không hợp lệ: {date_ton_kho}")
+
+def row_hash(row):
+    """Hash nội dung dòng (không phụ thuộc thứ tự cột) để loại bỏ dòng trùng"""
+    canonical = json.dumps(row, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:20]
+
+def split_derived(product):
+    """
+    Tách dòng sản phẩm thành (các cột gốc, giá trị DERIVED_COLUMNS theo thứ tự)
+    Dòng không có cột tính theo ngày nào -> giá trị thứ 2 là None
+    """
+    if not any(column in product for column in DERIVED_COLUMNS):
+        return product, None
+    source = {key: value for key, value in product.items() if key not in DERIVED_COLUMNS}
+    return source, [product.get(column) for column in DERIVED_COLUMNS]
+
+def merge_derived(row, derived, columns):
+    """
+    Ghép lại dòng đầy đủ của 1 snapshot từ dòng gốc trong kho + giá trị tính theo ngày
+    (thêm vào cuối dòng như add_shelf_life; cột có trong columns của sheet được giữ cả khi giá trị null)
+    """
+    if derived is None:
+        return row
+    merged = dict(row)
+    merged.update((column, value) for column, value in zip(DERIVED_COLUMNS, derived)
+                  if value is not None or column in columns)
+    return merged
+
+def sheet_key_columns(sheet):
+    """Cột Mã, LOT, số lượng của sheet (giống cách inventory_index chọn cột)"""
+    columns = sheet.get('columns') or []
+    code_column = 'Mã' if 'Mã' in columns else (columns[0] if columns else None)
+    lot_column = find_column(columns, LOT_KEYWORDS, exclude=(code_column,))
+    quantity_column = find_column(columns, QUANTITY_KEYWORDS)
+    return code_column, lot_column, quantity_column
+
+def group_entries(entries):
+    """Gom các dòng cùng (Mã, LOT): tổng số lượng + danh sách offset"""
+    groups = {}
+    for code, lot, quantity, offset, *derived in entries:
+        group = groups.setdefault((code, lot), [None, []])
+        if quantity is not None:
+            group[0] = quantity if group[0] is None else group[0] + quantity
+        # Manifest cũ (trước khi tách cột tính theo ngày) chỉ có 4 phần tử
+        group[1].append((offset, derived[0] if derived else None))
+    # Manifest được ghi theo thứ tự dòng trong file, không sắp xếp sẵn
+    for group in groups.values():
+        group[1].sort(key=lambda row: row[0])
+    return dict(sorted(groups.items()))
+
+def store_rows(connection, rows_file, products, counter):
+    """
+    Ghi các dòng chưa có vào kho dòng (rows_file) và index hash -> offset (connection), theo từng lô LOOKUP_BATCH dòng
+    counter['new_rows'] tăng theo số dòng mới ghi
+    Yields: (product, offset của phần cột gốc trong kho, giá trị cột tính theo ngày)
+    """
+    iterator = iter(products)
+    while True:
+        batch = list(islice(iterator, LOOKUP_BATCH))
+        if not batch:
+            return
+        parts = [split_derived(product) for product in batch]
+        digests = [row_hash(source) for source, _ in parts]
+        unique = list(dict.fromkeys(digests))
+        placeholders = ','.join('?' * len(unique))
+        offsets = dict(connection.execute(f"SELECT hash, offset FROM rows WHERE hash IN ({placeholders})", unique))
+        for product, (source, derived), digest in zip(batch, parts, digests):
+            offset = offsets.get(digest)
+            if offset is None:
+                offset = rows_file.tell()
+                line = json.dumps(source, ensure_ascii=False, separators=(',', ':'))
+                rows_file.write(line.encode('utf-8') + b'\n')
+                offsets[digest] = offset
+                connection.execute("INSERT INTO rows (hash, offset) VALUES (?, ?)", (digest, offset))
+                counter['new_rows'] += 1
+            yield product, offset, derived
+
+class HistoryStore:
+    """Kho lịch sử snapshot, dùng chung kho dòng để các dòng không đổi chỉ lưu 1 lần"""
+    def __init__(self, history_dir=HISTORY_DIR):
+        self.history_dir = history_dir
+        self.index_path = os.path.join(history_dir, 'index.json')
+        self.rows_path = os.path.join(history_dir, 'rows.jsonl')
+        self.rows_index_path = os.path.join(history_dir, 'rows.idx.sqlite')
+        self.snapshots_dir = os.path.join(history_dir, 'snapshots')
+
+    def list_snapshots(self):
+        """Danh sách snapshot, sắp xếp theo ngày tồn kho rồi thời điểm lưu"""
+        snapshots = file_store.read_json(self.index_path, default=[])
+        return sorted(snapshots, key=lambda entry: (entry['date'], entry['saved_at']))
+
+    def save_snapshot(self, inventory_data):
+        """
+        Lưu inventory_data (dạng products) thành 1 snapshot
+        Cùng ngày tồn kho + cùng file nguồn -> ghi đè snapshot cũ
+        Returns: thông tin snapshot trong index
+        """
+        metadata = inventory_data.get('metadata', {})
+        date = snapshot_date(metadata.get('date_ton_kho'))
+        source_file = os.path.basename(str(metadata.get('source_file') or ''))
+        snapshot_id = f"{date}_{re.sub(r'[^0-9A-Za-z._-]+', '_', source_file) or 'unknown'}"
+
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        with file_store.file_lock(self.index_path):
+            # Index cũ (rows.idx.json) băm cả cột tính theo ngày nên không dùng lại được
+            try:
+                os.remove(os.path.join(self.history_dir, 'rows.idx.json'))
+            except FileNotFoundError:
+                pass
+            connection = sqlite3.connect(self.rows_index_path)
+            try:
+                connection.execute("CREATE TABLE IF NOT EXISTS rows (hash TEXT PRIMARY KEY, offset INTEGER NOT NULL)"
+                                   " WITHOUT ROWID")
+                counter = {'new_rows': 0}
+
+                def sheet_entries(sheet, code_column, lot_column, quantity_column, rows_file):
+                    """Các dòng manifest của sheet, sinh dần theo từng lô của store_rows"""
+                    for product, offset, derived in store_rows(connection, rows_file, sheet.get('products', []),
+                                                               counter):
+                        yield [
+                            normalize_key(product.get(code_column)) or '' if code_column else '',
+                            normalize_key(product.get(lot_column)) or '' if lot_column else '',
+                            to_number(product.get(quantity_column)) if quantity_column else None,
+                            offset,
+                            derived
+                        ]
+
+                # Manifest được ghi dần (gzip) trong lúc ghi kho dòng, không giữ danh sách dòng trong bộ nhớ
+                with open(self.rows_path, 'ab') as rows_file, \
+                        file_store.atomic_writer(self._manifest_path(snapshot_id)) as target:
+                    sheets = {}
+                    for sheet in inventory_data.get('sheets', []):
+                        code_column, lot_column, quantity_column = sheet_key_columns(sheet)
+                        sheets[sheet.get('sheet_name')] = {
+                            'columns': sheet.get('columns', []),
+                            'quantity_column': quantity_column,
+                            'entries': sheet_entries(sheet, code_column, lot_column, quantity_column, rows_file)
+                        }
+                    manifest = {
+                        'id': snapshot_id,
+                        'date': date,
+                        'date_ton_kho': metadata.get('date_ton_kho'),
+                        'source_file': source_file,
+                        'sheets': sheets
+                    }
+                    with gzip.GzipFile(filename='', mode='wb', fileobj=target, mtime=0) as archive:
+                        for piece in file_store.iter_json(manifest):
+                            archive.write(piece.encode('utf-8'))
+                    rows_file.flush()
+                    os.fsync(rows_file.fileno())
+                    # Kho dòng đã ghi xong mới ghi offset vào index, rồi manifest mới thay file cũ
+                    connection.commit()
+            finally:
+                connection.close()
+            new_rows = counter['new_rows']
+
+            entry = {
+                'id': snapshot_id,
+                'date': date,
+                'date_ton_kho': metadata.get('date_ton_kho'),
+                'source_file': source_file,
+                'saved_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'total_products': metadata.get('total_products'),
+                'new_rows': new_rows
+            }
+            snapshots = [s for s in self.list_snapshots() if s['id'] != snapshot_id] + [entry]
+            file_store.atomic_write_json(self.index_path, snapshots)
+
+        print(f"✓ Đã lưu lịch sử {snapshot_id} ({new_rows} dòng mới)")
+        return entry
+
+    def _manifest_path(self, snapshot_id):
+        return os.path.join(self.snapshots_dir, f"{snapshot_id}.json.gz")
+
+    def find_snapshot(self, date_or_id):
+        """Snapshot theo id, hoặc snapshot lưu sau cùng của ngày đó; KeyError nếu không có"""
+        snapshots = self.list_snapshots()
+        for entry in snapshots:
+            if entry['id'] == date_or_id:
+                return entry
+        date = snapshot_date(date_or_id)
+        matches = [entry for entry in snapshots if entry['date'] == date]
+        if not matches:
+            raise KeyError(date_or_id)
+        return matches[-1]
+
+    def load_manifest(self, entry):
+        with gzip.open(self._manifest_path(entry['id']), 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def read_rows(self, offsets):
+        """Đọc các dòng trong kho theo offset (chỉ đọc đúng các dòng cần)"""
+        rows = {}
+        with open(self.rows_path, 'rb') as rows_file:
+            for offset in sorted(set(offsets)):
+                rows_file.seek(offset)
+                rows[offset] = json.loads(rows_file.readline())
+        return rows
+
+    def diff(self, from_date, to_date, sheet_name=None, include_rows=True):
+        """
+        So sánh 2 snapshot theo (sheet, Mã, LOT)
+        - added / removed: có ở ngày sau / ngày trước mà không có ở ngày kia
+        - changed: có ở cả 2 ngày nhưng số lượng khác nhau
+        include_rows=True: kèm nội dung dòng cho added/removed (đọc theo offset)
+        """
+        old_entry = self.find_snapshot(from_date)
+        new_entry = self.find_snapshot(to_date)
+        old_sheets = self.load_manifest(old_entry)['sheets']
+        new_sheets = self.load_manifest(new_entry)['sheets']
+
+        names = [name for name in new_sheets if name not in old_sheets]
+        names = list(old_sheets) + names
+        if sheet_name is not None:
+            if sheet_name not in old_sheets and sheet_name not in new_sheets:
+                raise KeyError(sheet_name)
+            names = [sheet_name]
+
+        result_sheets = {}
+        wanted_offsets = []
+        for name in names:
+            old_groups = group_entries(old_sheets.get(name, {}).get('entries', []))
+            new_groups = group_entries(new_sheets.get(name, {}).get('entries', []))
+            added = [(key, new_groups[key]) for key in new_groups if key not in old_groups]
+            removed = [(key, old_groups[key]) for key in old_groups if key not in new_groups]
+            changed = []
+            for key, (new_quantity, _) in new_groups.items():
+                if key in old_groups and old_groups[key][0] != new_quantity:
+                    old_quantity = old_groups[key][0]
+                    delta = new_quantity - old_quantity if None not in (old_quantity, new_quantity) else None
+                    changed.append({'code': key[0], 'lot': key[1], 'old_quantity': old_quantity,
+                                    'new_quantity': new_quantity, 'delta': delta})
+            if not (added or removed or changed):
+                continue
+            for _, (_, rows_of_key) in added + removed:
+                wanted_offsets.extend(offset for offset, _ in rows_of_key)
+            result_sheets[name] = {'added': added, 'removed': removed, 'changed': changed}
+
+        rows = self.read_rows(wanted_offsets) if include_rows and wanted_offsets else {}
+
+        def describe(key, group, sheet):
+            quantity, rows_of_key = group
+            item = {'code': key[0], 'lot': key[1], 'quantity': quantity}
+            if include_rows:
+                columns = sheet.get('columns', [])
+                item['rows'] = [merge_derived(rows[offset], derived, columns) for offset, derived in rows_of_key]
+            return item
+
+        summary = {'added': 0, 'removed': 0, 'changed': 0}
+        for name, sheet_diff in result_sheets.items():
+            sheet_diff['added'] = [describe(key, group, new_sheets[name]) for key, group in sheet_diff['added']]
+            sheet_diff['removed'] = [describe(key, group, old_sheets[name]) for key, group in sheet_diff['removed']]
+            for kind in summary:
+                summary[kind] += len(sheet_diff[kind])
+
+        return {
+            'from': old_entry,
+            'to': new_entry,
+            'summary': summary,
+            'sheets': result_sheets
+        }
@@ -0,0 +1,440 @@
+"""
+Index cho truy vấn tồn kho phía server (/query)
+Dựng 1 lần cho mỗi phiên bản inventory_data.json (tức mỗi lần chuyển đổi / tính lại),
+sau đó mỗi request chỉ lọc trên index và trả về 1 trang kết quả:
+- Mã, LOT: hash map giá trị -> danh sách dòng
+- Tên: cột tên đã chuyển sẵn sang chữ thường để tìm chuỗi con
+- Ô tìm kiếm của website (q): nội dung từng dòng / từng cột chữ thường, dựng khi được tìm lần đầu
+- Số lượng tồn, % Còn lại: các dòng sắp xếp sẵn theo giá trị, lọc khoảng bằng bisect
+- Hạn sử dụng: mọi LOT của mọi sheet sắp xếp theo Ngày hết hạn và theo % Còn lại (/expiring)
+Module này không phụ thuộc pandas để dùng được từ server và các API nhẹ
+"""
+
+import bisect
+import os
+import threading
+from datetime import date, datetime
+from itertools import islice
+
+import file_store
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+MAX_EXPIRING_LIMIT = 5000
+
+NAME_KEYWORDS = ('tên', 'product')
+LOT_KEYWORDS = ('lot', 'lô')
+QUANTITY_KEYWORDS = ('closing stock', 'tồn cuối', 'cuối kỳ', 'số lượng tồn', 'closing')
+PERCENT_COLUMN = '% Còn lại'
+EXPIRY_COLUMN = 'Ngày hết hạn'
+
+def find_column(columns, keywords, exclude=()):
+    """Cột đầu tiên có tên chứa một trong các từ khóa (không phân biệt hoa thường)"""
+    for column in columns:
+        if column in exclude:
+            continue
+        column_lower = str(column).lower()
+        if any(keyword in column_lower for keyword in keywords):
+            return column
+    return None
+
+def normalize_key(value):
+    """Chuẩn hóa Mã / LOT để tra cứu: 2805, 2805.0 và ' 2805 ' đều thành '2805'"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    key = str(value).strip().upper()
+    return key or None
+
+def to_number(value):
+    """Giá trị số của ô (None nếu không phải số)"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(str(value).replace(',', '').strip())
+    except ValueError:
+        return None
+
+def search_text(value):
+    """Chuỗi chữ thường của ô như String(value) trong trình duyệt (2805.0 -> '2805', True -> 'true')"""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).lower()
+
+def sort_key(value):
+    """Khóa sắp xếp cho cột bất kỳ: số trước, rồi chữ (không phân biệt hoa thường)"""
+    number = to_number(value)
+    if number is not None:
+        return (0, number, '')
+    return (1, 0, str(value).lower())
+
+class SheetIndex:
+    """Index của một sheet"""
+    def __init__(self, sheet):
+        self.sheet_name = sheet.get('sheet_name')
+        self.products = sheet.get('products', [])
+        self.columns = sheet.get('columns') or (list(self.products[0]) if self.products else [])
+
+        # Xác định cột theo vai trò, giống cách convert_to_json chọn cột
+        self.code_column = 'Mã' if 'Mã' in self.columns else (self.columns[0] if self.columns else None)
+        self.name_column = find_column(self.columns, NAME_KEYWORDS, exclude=(self.code_column,))
+        self.lot_column = find_column(self.columns, LOT_KEYWORDS, exclude=(self.code_column,))
+        self.quantity_column = find_column(self.columns, QUANTITY_KEYWORDS)
+        self.percent_column = PERCENT_COLUMN if PERCENT_COLUMN in self.columns else None
+
+        self.by_code = self._build_map(self.code_column)
+        self.by_lot = self._build_map(self.lot_column)
+        self.names = [str(product.get(self.name_column) or '').lower() for product in self.products] \
+            if self.name_column else None
+
+        # Nội dung chữ thường cho tìm kiếm q: None -> cả dòng (các ô nối bằng \0), tên cột -> cột đó
+        self.search_texts = {}
+        self._search_lock = threading.Lock()
+
+        # Cột số đã sắp xếp: column -> (giá trị tăng dần, chỉ số dòng tương ứng, các dòng không có số)
+        self.sorted_columns = {}
+        for column in (self.quantity_column, self.percent_column):
+            if column:
+                self.sorted_columns[column] = self._build_sorted(column)
+
+    def _build_map(self, column):
+        index = {}
+        if not column:
+            return index
+        for i, product in enumerate(self.products):
+            key = normalize_key(product.get(column))
+            if key is not None:
+                index.setdefault(key, []).append(i)
+        return index
+
+    def _build_sorted(self, column):
+        pairs = []
+        blanks = []
+        for i, product in enumerate(self.products):
+            number = to_number(product.get(column))
+            if number is not None:
+                pairs.append((number, i))
+            else:
+                blanks.append(i)
+        pairs.sort()
+        return [number for number, _ in pairs], [i for _, i in pairs], blanks
+
+    def resolve_column(self, name):
+        """Đổi tên vai trò (code, name, lot, quantity, percent) sang tên cột thật của sheet"""
+        aliases = {
+            'code': self.code_column,
+            'name': self.name_column,
+            'lot': self.lot_column,
+            'quantity': self.quantity_column,
+            'percent': self.percent_column,
+        }
+        column = aliases.get(name, name)
+        if column not in self.columns and not any(column in product for product in self.products[:1]):
+            raise ValueError(f"Sheet {self.sheet_name} không có cột {name}")
+        return column
+
+    def texts(self, column=None):
+        """Nội dung chữ thường của mọi dòng (column=None: tất cả các ô của dòng), dựng 1 lần cho mỗi cột"""
+        with self._search_lock:
+            texts = self.search_texts.get(column)
+            if texts is None:
+                if column is None:
+                    texts = ['\0'.join(search_text(value) for value in product.values() if value is not None)
+                             for product in self.products]
+                else:
+                    texts = [search_text(product[column]) if product.get(column) is not None else None
+                             for product in self.products]
+                self.search_texts[column] = texts
+            return texts
+
+    def range_rows(self, column, low=None, high=None):
+        """Các dòng có giá trị trong [low, high] của cột số đã sắp xếp"""
+        values, rows, _ = self.sorted_columns[column]
+        start = 0 if low is None else bisect.bisect_left(values, low)
+        end = len(values) if high is None else bisect.bisect_right(values, high)
+        return rows[start:end]
+
+    def query(self, code=None, name=None, lot=None, quantity_range=(None, None),
+              percent_range=(None, None), sort=None, descending=False,
+              offset=0, limit=DEFAULT_LIMIT, text=None, text_column=None):
+        """
+        Lọc + sắp xếp + phân trang
+        text: chuỗi con (không phân biệt hoa thường) trong bất kỳ ô nào, hoặc trong cột text_column
+        (giống ô tìm kiếm của website)
+        Returns: dict gồm tổng số dòng khớp và các sản phẩm của trang hiện tại
+        """
+        matched = None  # None = tất cả các dòng
+
+        def narrow(rows):
+            nonlocal matched
+            rows = set(rows)
+            matched = rows if matched is None else matched & rows
+
+        if code:
+            narrow(self.by_code.get(normalize_key(code), []))
+        if lot:
+            narrow(self.by_lot.get(normalize_key(lot), []))
+        for column, (low, high) in ((self.quantity_column, quantity_range),
+                                    (self.percent_column, percent_range)):
+            if low is None and high is None:
+                continue
+            narrow(self.range_rows(column, low, high) if column else [])
+        if name:
+            needle = name.lower()
+            candidates = range(len(self.products)) if matched is None else matched
+            narrow([i for i in candidates if self.names and needle in self.names[i]])
+        if text:
+            needle = text.lower()
+            texts = self.texts(self.resolve_column(text_column) if text_column else None)
+            candidates = range(len(self.products)) if matched is None else matched
+            narrow([i for i in candidates if texts[i] is not None and needle in texts[i]])
+
+        total = len(self.products) if matched is None else len(matched)
+        page = self._ordered_page(matched, sort, descending, offset, limit)
+
+        return {
+            'sheet_name': self.sheet_name,
+            'columns': self.columns,
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'products': [self.products[i] for i in page]
+        }
+
+    def _ordered_page(self, matched, sort, descending, offset, limit):
+        if sort is None:
+            rows = range(len(self.products)) if matched is None else sorted(matched)
+            return list(islice(rows, offset, offset + limit))
+
+        column = self.resolve_column(sort)
+        if column in self.sorted_columns:
+            # Cột số đã có thứ tự sẵn: chỉ đi tới hết trang, không cần sắp xếp lại
+            _, sorted_rows, blanks = self.sorted_columns[column]
+            ordered = reversed(sorted_rows) if descending else sorted_rows
+            # Dòng không có giá trị số luôn nằm cuối
+            rows = (i for source in (ordered, blanks) for i in source
+                    if matched is None or i in matched)
+            return list(islice(rows, offset, offset + limit))
+
+        rows = range(len(self.products)) if matched is None else matched
+        present = [i for i in rows if self.products[i].get(column) is not None]
+        blanks = sorted(i for i in rows if self.products[i].get(column) is None)
+        present.sort(key=lambda i: sort_key(self.products[i][column]), reverse=descending)
+        return (present + blanks)[offset:offset + limit]
+
+class ExpiryIndex:
+    """
+    Index hạn sử dụng cho mọi LOT của các sheet có Ngày hết hạn / % Còn lại
+    Hai danh sách sắp xếp sẵn (theo ngày hết hạn và theo % còn lại): truy vấn chỉ cần 2 lần bisect
+    rồi đọc đúng các dòng khớp -> thời gian tỉ lệ với số kết quả, không phụ thuộc tổng số tồn kho
+    """
+    def __init__(self, sheet_indexes):
+        parsed_dates = {}
+        by_expiry = []
+        by_percent = []
+        for sheet_index in sheet_indexes:
+            if EXPIRY_COLUMN not in sheet_index.columns and not sheet_index.percent_column:
+                continue
+            for i, product in enumerate(sheet_index.products):
+                expiry = product.get(EXPIRY_COLUMN)
+                if expiry not in parsed_dates:
+                    parsed_dates[expiry] = parse_date_ordinal(expiry)
+                ordinal = parsed_dates[expiry]
+                percent = to_number(product.get(sheet_index.percent_column)) if sheet_index.percent_column else None
+                entry = (sheet_index, i, ordinal, percent)
+                if ordinal is not None:
+                    by_expiry.append(entry)
+                if percent is not None:
+                    by_percent.append(entry)
+
+        by_expiry.sort(key=lambda entry: entry[2])
+        by_percent.sort(key=lambda entry: entry[3])
+        self.by_expiry = by_expiry
+        self.expiry_keys = [entry[2] for entry in by_expiry]
+        self.by_percent = by_percent
+        self.percent_keys = [entry[3] for entry in by_percent]
+        # (ordinal hôm nay, danh sách theo % chỉ gồm LOT chưa hết hạn, khóa %): dựng lại khi sang ngày mới
+        self._unexpired_percent = None
+
+    def unexpired_by_percent(self, today):
+        """
+        by_percent bỏ các LOT đã hết hạn trước today (dựng 1 lần mỗi ngày), để lọc max_pct không phải
+        bỏ qua từng LOT đã hết hạn (đều có % <= 0, nằm đầu danh sách)
+        """
+        cached = self._unexpired_percent
+        if cached is None or cached[0] != today:
+            entries = [entry for entry in self.by_percent if entry[2] is None or entry[2] >= today]
+            cached = (today, entries, [entry[3] for entry in entries])
+            self._unexpired_percent = cached
+        return cached[1], cached[2]
+
+    def query(self, days=None, max_percent=None, today=None, include_expired=False):
+        """
+        Các LOT hết hạn trong vòng days ngày tới HOẶC có % còn lại <= max_percent
+        include_expired=True: thêm các LOT đã hết hạn trước hôm nay, xếp sau các LOT còn hạn
+        (để giới hạn số kết quả không cắt mất các LOT sắp hết hạn)
+        Returns: list (sheet_index, chỉ số dòng, ordinal ngày hết hạn, % còn lại), sắp theo ngày hết hạn
+        """
+        today = (today or date.today()).toordinal()
+        matched = []
+        if days is not None:
+            start = bisect.bisect_left(self.expiry_keys, today) if not include_expired else 0
+            end = bisect.bisect_right(self.expiry_keys, today + days)
+            matched.extend(self.by_expiry[start:end])
+        if max_percent is not None:
+            if include_expired:
+                entries, keys = self.by_percent, self.percent_keys
+            else:
+                entries, keys = self.unexpired_by_percent(today)
+            end = bisect.bisect_right(keys, max_percent)
+            seen = {(id(entry[0]), entry[1]) for entry in matched}
+            matched.extend(entry for entry in entries[:end] if (id(entry[0]), entry[1]) not in seen)
+        # LOT đã hết hạn xếp sau cùng, LOT không có ngày hết hạn nằm trước chúng
+        matched.sort(key=lambda entry: (entry[2] is not None and entry[2] < today, entry[2] is None, entry[2] or 0))
+        return matched
+
+def parse_date_ordinal(value):
+    """'dd/mm/YYYY' -> số ngày (date.toordinal), None nếu không phải ngày hợp lệ"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value).strip(), "%d/%m/%Y").toordinal()
+    except ValueError:
+        return None
+
+class InventoryIndex:
+    """Index cho tất cả các sheet của inventory_data"""
+    def __init__(self, inventory_data):
+        self.metadata = inventory_data.get('metadata', {})
+        self.sheets = {}
+        for sheet in inventory_data.get('sheets', []):
+            self.sheets[sheet.get('sheet_name')] = SheetIndex(sheet)
+        self.expiry = ExpiryIndex(self.sheets.values())
+
+    def sheet(self, sheet_name=None):
+        """Index của sheet theo tên (mặc định sheet đầu tiên); KeyError nếu không có"""
+        if sheet_name is None:
+            if not self.sheets:
+                raise KeyError('Không có sheet nào trong dữ liệu')
+            return next(iter(self.sheets.values()))
+        return self.sheets[sheet_name]
+
+_index_cache = {}
+_index_lock = threading.Lock()
+
+def load_index(data_file='inventory_data.json'):
+    """
+    Index của data_file, chỉ dựng lại khi file thay đổi (sau mỗi lần chuyển đổi / tính lại)
+    """
+    path = os.path.abspath(data_file)
+    stat = os.stat(path)
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _index_lock:
+        cached = _index_cache.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        inventory_data, _ = file_store.read_inventory(path)
+        index = InventoryIndex(inventory_data)
+        _index_cache[path] = (signature, index)
+        return index
+
+def _number_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Tham số {name} phải là số")
+
+def _int_param(params, name, default):
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Tham số {name} phải là số nguyên")
+
+def query_inventory(index, params):
+    """
+    Chạy truy vấn từ tham số URL (dict tên -> giá trị chuỗi)
+    - sheet: tên sheet (mặc định sheet đầu tiên)
+    - code, lot: tìm chính xác theo Mã / LOT
+    - name: tìm chuỗi con trong tên sản phẩm
+    - q: tìm chuỗi con trong mọi cột, hoặc trong cột column (ô tìm kiếm của website)
+    - min_qty, max_qty, min_pct, max_pct: khoảng số lượng tồn / % còn lại
+    - sort: tên cột hoặc code/name/lot/quantity/percent, order=asc|desc
+    - offset, limit: phân trang (limit tối đa MAX_LIMIT)
+    Lỗi tham số -> ValueError, không có sheet -> KeyError
+    """
+    offset = max(_int_param(params, 'offset', 0), 0)
+    limit = min(max(_int_param(params, 'limit', DEFAULT_LIMIT), 1), MAX_LIMIT)
+    order = (params.get('order') or 'asc').lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError("Tham số order phải là asc hoặc desc")
+
+    sheet_index = index.sheet(params.get('sheet') or None)
+    return sheet_index.query(
+        code=params.get('code') or None,
+        name=params.get('name') or None,
+        lot=params.get('lot') or None,
+        quantity_range=(_number_param(params, 'min_qty'), _number_param(params, 'max_qty')),
+        percent_range=(_number_param(params, 'min_pct'), _number_param(params, 'max_pct')),
+        sort=params.get('sort') or None,
+        descending=order == 'desc',
+        offset=offset,
+        limit=limit,
+        text=params.get('q') or None,
+        text_column=params.get('column') or None
+    )
+
+def _bool_param(params, name, default):
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    return str(value).lower() not in ('0', 'false', 'no')
+
+def query_expiring(index, params, today=None):
+    """
+    Các LOT sắp hết hạn từ tham số URL
+    - days: hết hạn trong vòng N ngày tới (include_expired=1: thêm các LOT đã hết hạn, xếp sau cùng)
+    - max_pct: hoặc % còn lại <= X
+    - limit: số LOT tối đa trả về (mặc định và tối đa MAX_EXPIRING_LIMIT)
+    Phải có ít nhất days hoặc max_pct; lỗi tham số -> ValueError
+    """
+    days = _int_param(params, 'days', None)
+    max_percent = _number_param(params, 'max_pct')
+    if days is None and max_percent is None:
+        raise ValueError("Cần tham số days hoặc max_pct")
+    limit = min(max(_int_param(params, 'limit', MAX_EXPIRING_LIMIT), 1), MAX_EXPIRING_LIMIT)
+    include_expired = _bool_param(params, 'include_expired', False)
+    today = today or date.today()
+
+    matched = index.expiry.query(days, max_percent, today, include_expired)
+    lots = []
+    for sheet_index, i, ordinal, percent in matched[:limit]:
+        product = sheet_index.products[i]
+        lots.append({
+            'sheet_name': sheet_index.sheet_name,
+            'code': product.get(sheet_index.code_column) if sheet_index.code_column else None,
+            'name': product.get(sheet_index.name_column) if sheet_index.name_column else None,
+            'lot': product.get(sheet_index.lot_column) if sheet_index.lot_column else None,
+            'expiry_date': product.get(EXPIRY_COLUMN),
+            'days_left': ordinal - today.toordinal() if ordinal is not None else None,
+            'remaining_percent': percent,
+            'stock': product.get(sheet_index.quantity_column) if sheet_index.quantity_column else None
+        })
+
+    return {
+        'today': today.strftime("%d/%m/%Y"),
+        'days': days,
+        'max_pct': max_percent,
+        'total': len(matched),
+        'lots': lots
+    }
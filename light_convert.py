@@ -0,0 +1,728 @@
+"""
+Engine chuyển đổi Excel -> JSON không dùng pandas (cho API serverless: import nhanh, ít bộ nhớ)
+- Đọc workbook bằng openpyxl chế độ read-only (lần lượt từng dòng, không dựng DataFrame)
+- Kiểu dữ liệu của từng cột được suy ra theo đúng luật của pd.read_excel(header=None)
+  (ô trống / chuỗi NA, cột số, cột TRUE/FALSE, cột ngày tháng...) để cho ra cùng inventory_data.json
+- Luật nhận diện header, chọn cột, tính hạn theo LOT và quy trình chuyển đổi dùng chung convert_core
+File .xls (openpyxl không đọc được) vẫn đọc bằng pandas rồi xử lý tiếp bằng engine này
+"""
+
+import re
+import sys
+import time
+from datetime import datetime, date, timedelta
+from itertools import compress, islice
+
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+import conversion_metrics
+import history_store
+from convert_core import (
+    LAYOUT_CACHE_FILE, PROFILE_SAMPLE_SIZE, HEADER_MATCHER, HEADER_SCAN_ROWS, IMPORTANT_COLUMNS,
+    ColumnProfile, ConversionError, is_missing, merge_header_rows, find_product_column,
+    name_unlabeled_columns, build_layout, is_lot_column, assemble_products, fingerprint_rows
+)
+import convert_core
+
+# Module này là engine cho quy trình dùng chung của convert_core
+ENGINE = sys.modules[__name__]
+
+# Định dạng openpyxl đọc được, các định dạng khác (.xls) đọc bằng pandas
+OPENPYXL_EXTENSIONS = ('.xlsx', '.xlsm', '.xltx', '.xltm')
+
+# Chuỗi được pandas coi là ô trống (giá trị mặc định của na_values)
+NA_STRINGS = frozenset({
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+})
+TRUE_STRINGS = frozenset({'True', 'TRUE', 'true'})
+FALSE_STRINGS = frozenset({'False', 'FALSE', 'false'})
+
+# Chuỗi số được đọc như bộ đọc số của pandas (precise_xstrtod): chỉ bỏ khoảng trắng ASCII ở 2 đầu,
+# chỉ lấy 17 chữ số đầu (kể cả số 0 ở đầu), nhân / chia với bảng lũy thừa của 10
+ASCII_WHITESPACE = ' \t\n\r\f\v'
+ASCII_DIGITS = frozenset('0123456789')
+MAX_DIGITS = 17
+POWERS_OF_TEN = [float(f"1e{exponent}") for exponent in range(309)]
+INF_STRINGS = {'inf': float('inf'), '+inf': float('inf'), '-inf': float('-inf'),
+               'infinity': float('inf'), '+infinity': float('inf'), '-infinity': float('-inf')}
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+UINT64_MAX = 2 ** 64 - 1
+
+# Loại cột số: dòng lấy ngang qua các cột này được đổi sang cùng 1 kiểu (giống df.iloc[i])
+NUMERIC_KINDS = frozenset({'int', 'uint', 'float'})
+
+class Duration(timedelta):
+    """Khoảng thời gian trong cột thời lượng, hiển thị như pandas ("1 days 06:00:00")"""
+    def __str__(self):
+        hours, rest = divmod(self.seconds, 3600)
+        minutes, seconds = divmod(rest, 60)
+        fraction = f".{self.microseconds:06d}" if self.microseconds else ''
+        sign = ' +' if self.days < 0 else ' '
+        return f"{self.days} days{sign}{hours:02d}:{minutes:02d}:{seconds:02d}{fraction}"
+
+def read_digits(text, position, number, num_digits, exponent_step):
+    """Đọc dãy chữ số từ position, chỉ cộng MAX_DIGITS chữ số đầu vào number"""
+    end = len(text)
+    skipped = 0
+    while position < end and text[position] in ASCII_DIGITS:
+        if num_digits < MAX_DIGITS:
+            number = number * 10. + (ord(text[position]) - 48)
+            num_digits += 1
+        else:
+            skipped += exponent_step
+        position += 1
+    return position, number, num_digits, skipped
+
+def parse_float(text):
+    """
+    Chuỗi -> (số thực, có dạng số nguyên không) theo đúng cách pandas đọc số (kể cả phần làm tròn)
+    Returns: None nếu không phải số
+    """
+    # pandas đọc chuỗi dạng C: dừng ở ký tự NUL
+    text = text.split('\x00', 1)[0]
+    end = len(text)
+    position = 0
+    while position < end and text[position] in ASCII_WHITESPACE:
+        position += 1
+    negative = position < end and text[position] == '-'
+    if position < end and text[position] in '+-':
+        position += 1
+
+    maybe_int = True
+    position, number, num_digits, exponent = read_digits(text, position, 0., 0, 1)
+    if position < end and text[position] == '.':
+        maybe_int = False
+        digits_before = num_digits
+        position, number, num_digits, _ = read_digits(text, position + 1, number, num_digits, 0)
+        exponent -= num_digits - digits_before
+    if num_digits == 0:
+        return INF_STRINGS.get(text.lower()), False
+    if negative:
+        number = -number
+
+    if position < end and text[position] in 'eE':
+        maybe_int = False
+        # Số mũ được đọc như strtol: cho phép khoảng trắng và dấu trước chữ số, không giới hạn độ dài
+        cursor = position + 1
+        while cursor < end and text[cursor] in ASCII_WHITESPACE:
+            cursor += 1
+        sign = -1 if cursor < end and text[cursor] == '-' else 1
+        if cursor < end and text[cursor] in '+-':
+            cursor += 1
+        digits_start = cursor
+        while cursor < end and text[cursor] in ASCII_DIGITS:
+            cursor += 1
+        if cursor > digits_start:
+            exponent += sign * int(text[digits_start:cursor])
+            position = cursor
+
+    if exponent > 308:
+        number = 0. if number == 0 else (float('-inf') if number < 0 else float('inf'))
+    elif exponent > 0:
+        number *= POWERS_OF_TEN[exponent]
+    elif exponent < -616:
+        number = 0.
+    elif exponent < -308:
+        number = number / POWERS_OF_TEN[-308 - exponent] / POWERS_OF_TEN[308]
+    else:
+        number /= POWERS_OF_TEN[-exponent]
+
+    while position < end and text[position] in ASCII_WHITESPACE:
+        position += 1
+    if position < end:
+        return INF_STRINGS.get(text.lower()), False
+    return number, maybe_int
+
+def parse_number(text):
+    """
+    Chuỗi số -> (số thực, số nguyên hoặc None nếu không có dạng số nguyên) giống pandas
+    Returns: None nếu không phải số
+    """
+    number, maybe_int = parse_float(text)
+    if number is None:
+        return None
+    if not maybe_int:
+        return number, None
+    try:
+        return number, int(text)
+    except ValueError:
+        return None
+
+def is_na(value):
+    """Ô được pandas coi là trống: ô trống, ô lỗi (NaN) hoặc chuỗi NA"""
+    if isinstance(value, str):
+        return value in NA_STRINGS
+    return value is None or (isinstance(value, float) and value != value)
+
+class ColumnTyper:
+    """
+    Suy ra kiểu của 1 cột giống pd.read_excel(header=None): số, TRUE/FALSE, ngày tháng, chuỗi...
+    Cột được đưa vào dần từng phần theo thứ tự dòng (update), chỉ giữ vài cờ thống kê nên
+    không cần giữ cả cột; sau finish(): kind là loại cột, convert(value) đổi 1 ô sang giá trị đã có kiểu
+    Giá trị ô: chuỗi rỗng = ô trống, NaN = ô lỗi; sau khi đổi ô trống là None
+    """
+    def __init__(self):
+        self.count = 0
+        self.first = None
+        # Cột số (giống lib.maybe_convert_numeric): mọi ô có dữ liệu là số / chuỗi số / TRUE-FALSE
+        self.numeric = True
+        self.seen_null = self.seen_float = self.seen_int = self.seen_bool = False
+        self.seen_uint = self.seen_negative = self.seen_huge = False
+        # Cột TRUE/FALSE: mọi ô có dữ liệu là bool hoặc chuỗi True/False
+        self.booleans = True
+        self.present = 0
+        self.datetimes = self.timedeltas = True
+        # Các ô bằng nhau dùng chung giá trị gặp đầu tiên (True rồi 1 -> True) như pandas;
+        # ô đọc từ Excel chỉ bằng nhau khác kiểu ở 0 / 1 (số thực nguyên đã thành int)
+        self.shared = {}
+        self.kind = None
+        self.convert = None
+
+    def update(self, values):
+        """Đưa thêm các ô tiếp theo của cột"""
+        for value in values:
+            if not self.count:
+                self.first = value
+            self.count += 1
+            if is_na(value):
+                self.seen_null = True
+                continue
+            self.present += 1
+
+            if self.numeric:
+                if isinstance(value, bool):
+                    self.seen_bool = True
+                elif isinstance(value, float):
+                    self.seen_float = True
+                elif isinstance(value, int):
+                    self.add_integer(value)
+                elif isinstance(value, str):
+                    parsed = parse_number(value)
+                    if parsed is None:
+                        self.numeric = False
+                    elif parsed[1] is None:
+                        self.seen_float = True
+                    else:
+                        self.add_integer(parsed[1])
+                else:
+                    self.numeric = False
+
+            if isinstance(value, (int, float)) and (value == 0 or value == 1):
+                value = self.shared.setdefault(value, value)
+            if self.booleans and not isinstance(value, bool) and \
+                    value not in TRUE_STRINGS and value not in FALSE_STRINGS:
+                self.booleans = False
+            if self.datetimes and not isinstance(value, datetime):
+                self.datetimes = False
+            if self.timedeltas and not isinstance(value, timedelta):
+                self.timedeltas = False
+
+    def update_empty(self, count):
+        """Đưa thêm count ô trống (dòng ngắn hơn cột)"""
+        if count > 0:
+            if not self.count:
+                self.first = ''
+            self.count += count
+            self.seen_null = True
+
+    def add_integer(self, number):
+        self.seen_int = True
+        if number > UINT64_MAX or number < INT64_MIN:
+            # Ngoài khoảng int64 / uint64: cột số thực nếu có ô thực / ô trống, không thì giữ số nguyên Python
+            self.seen_huge = True
+        elif number > INT64_MAX:
+            self.seen_uint = True
+        elif number < 0:
+            self.seen_negative = True
+
+    def finish(self):
+        """Chốt loại cột sau khi đã đưa hết các ô"""
+        if self.numeric:
+            if self.seen_uint and (self.seen_null or self.seen_negative):
+                # Số > int64 lẫn với số âm / ô trống: pandas giữ nguyên giá trị gốc
+                self.kind, self.convert = 'object', self.to_original
+            elif self.seen_float or self.seen_null:
+                self.kind, self.convert = 'float', self.to_float
+            elif self.seen_huge:
+                # Ô đầu là bool: bước TRUE/FALSE của pandas không đổi được và trả lại giá trị gốc
+                self.kind = 'object'
+                self.convert = self.to_original if isinstance(self.first, bool) else self.to_big_integer
+            elif self.seen_int:
+                self.kind, self.convert = ('uint' if self.seen_uint else 'int'), self.to_integer
+            else:
+                self.kind, self.convert = ('bool' if self.seen_bool else 'int'), self.to_integer
+        # pandas bỏ qua bước TRUE/FALSE nếu ô đầu tiên là số nguyên / bool
+        elif self.booleans and (is_na(self.first) or not isinstance(self.first, int)):
+            # Có ô trống thì pandas giữ cột object (True / False / NaN)
+            self.kind, self.convert = ('object' if self.seen_null else 'bool'), self.to_bool
+        elif self.present and self.datetimes:
+            self.kind, self.convert = 'datetime', self.to_shared
+        elif self.present and self.timedeltas:
+            self.kind, self.convert = 'timedelta', self.to_duration
+        else:
+            self.kind, self.convert = 'object', self.to_shared
+        return self.kind
+
+    def to_original(self, value):
+        return None if isinstance(value, float) and value != value else value
+
+    def to_float(self, value):
+        if is_na(value):
+            return None
+        return parse_number(value)[0] if isinstance(value, str) else float(value)
+
+    def to_integer(self, value):
+        if isinstance(value, bool):
+            return value if self.kind == 'bool' else int(value)
+        return parse_number(value)[1] if isinstance(value, str) else value
+
+    def to_big_integer(self, value):
+        return None if isinstance(value, bool) else self.to_integer(value)
+
+    def to_bool(self, value):
+        value = self.to_shared(value)
+        return value if value is None or isinstance(value, bool) else value in TRUE_STRINGS
+
+    def to_shared(self, value):
+        if is_na(value):
+            return None
+        if isinstance(value, (int, float)) and (value == 0 or value == 1):
+            return self.shared[value]
+        return value
+
+    def to_duration(self, value):
+        if is_na(value):
+            return None
+        return Duration(value.days, value.seconds, value.microseconds)
+
+def type_column(values):
+    """
+    Suy ra kiểu của 1 cột giống pd.read_excel(header=None) (xem ColumnTyper)
+    Returns: (loại cột, giá trị) - ô trống là None
+    """
+    typer = ColumnTyper()
+    typer.update(values)
+    kind = typer.finish()
+    return kind, [typer.convert(value) for value in values]
+
+class SheetGrid:
+    """
+    Lưới thô của 1 sheet (thay cho DataFrame header=None): lưu theo cột, mỗi cột đã có kiểu
+    Ô trống là None
+    """
+    def __init__(self, columns, kinds, height):
+        self.columns = columns
+        self.kinds = kinds
+        self.shape = (height, len(columns))
+        # Dòng lấy ngang qua các cột số khác kiểu được đổi hết sang float (giống df.iloc[i])
+        kind_set = set(kinds)
+        self.row_as_float = bool(kind_set) and kind_set <= NUMERIC_KINDS and \
+            ('float' in kind_set or {'int', 'uint'} <= kind_set)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Lưới từ các dòng đã đọc (cùng độ dài), suy ra kiểu từng cột"""
+        typed = [type_column(list(values)) for values in zip(*rows)]
+        return cls([values for _, values in typed], [kind for kind, _ in typed], len(rows))
+
+    @classmethod
+    def from_frame(cls, df):
+        """Lưới từ DataFrame đã đọc bằng pandas (file .xls)"""
+        kinds = {'i': 'int', 'u': 'uint', 'f': 'float', 'b': 'bool', 'M': 'datetime', 'm': 'timedelta'}
+        columns = [[None if is_missing(value) else value for value in df.iloc[:, i].tolist()]
+                   for i in range(df.shape[1])]
+        for values, dtype in zip(columns, df.dtypes):
+            if dtype.kind == 'm':
+                values[:] = [None if value is None else Duration(value.days, value.seconds, value.microseconds)
+                             for value in values]
+        return cls(columns, [kinds.get(dtype.kind, 'object') for dtype in df.dtypes], df.shape[0])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def cells(self, i):
+        """Giá trị các ô của dòng i (giữ kiểu của từng cột)"""
+        return [values[i] for values in self.columns]
+
+    def row(self, i):
+        """Dòng i như df.iloc[i].tolist()"""
+        if not 0 <= i < self.shape[0]:
+            raise IndexError("single positional indexer is out-of-bounds")
+        values = self.cells(i)
+        if self.row_as_float:
+            values = [None if value is None else float(value) for value in values]
+        return values
+
+def convert_cell(cell):
+    """Giá trị 1 ô giống pandas: ô trống -> '', ô lỗi -> NaN, số nguyên -> int"""
+    value = cell.value
+    if value is None:
+        return ''
+    if cell.data_type == TYPE_ERROR:
+        return float('nan')
+    if cell.data_type == TYPE_NUMERIC:
+        number = int(value)
+        return number if number == value else float(value)
+    return value
+
+def read_sheet_rows(sheet):
+    """
+    Các dòng của sheet giống pandas: bỏ ô trống ở cuối dòng và dòng trống ở cuối sheet,
+    các dòng được bù ô trống cho cùng độ dài
+    """
+    rows = []
+    last_row_with_data = -1
+    for row_number, row in enumerate(sheet.rows):
+        values = [convert_cell(cell) for cell in row]
+        while values and values[-1] == '':
+            values.pop()
+        if values:
+            last_row_with_data = row_number
+        rows.append(values)
+    del rows[last_row_with_data + 1:]
+
+    if rows:
+        width = max(len(values) for values in rows)
+        for values in rows:
+            if len(values) < width:
+                values.extend([''] * (width - len(values)))
+    return rows
+
+def read_workbook_sheets(excel_file):
+    """
+    Đọc workbook một lần (openpyxl read-only, đọc lần lượt từng dòng) và trả về từng sheet dạng lưới thô
+    File .xls: đọc bằng pandas (openpyxl không hỗ trợ) rồi chuyển sang lưới
+
+    Yields: (sheet_name, grid, parse_seconds)
+    """
+    if not str(excel_file).lower().endswith(OPENPYXL_EXTENSIONS):
+        import convert_to_json
+        for sheet_name, df, parse_seconds in convert_to_json.read_workbook_sheets(excel_file):
+            started = time.perf_counter()
+            grid = SheetGrid.from_frame(df)
+            yield sheet_name, grid, parse_seconds + time.perf_counter() - started
+        return
+
+    workbook = load_workbook(excel_file, read_only=True, data_only=True, keep_links=False)
+    try:
+        for sheet in workbook.worksheets:
+            started = time.perf_counter()
+            sheet.reset_dimensions()
+            grid = SheetGrid.from_rows(read_sheet_rows(sheet))
+            yield sheet.title, grid, time.perf_counter() - started
+    finally:
+        workbook.close()
+
+def find_data_start_row(grid, max_rows=HEADER_SCAN_ROWS, matcher=HEADER_MATCHER):
+    """
+    Tìm dòng bắt đầu có 'mã' và 'tên sản phẩm' hoặc 'Item Code' và 'Products'
+    Chỉ dò trong max_rows dòng đầu (None -> cả sheet); không tìm thấy -> 0
+    """
+    rows = len(grid) if max_rows is None else min(max_rows, len(grid))
+    for i in range(rows):
+        if matcher.matches(' '.join(str(value) for value in grid.cells(i) if value is not None)):
+            return i
+    return 0
+
+def profile_columns(columns, sample_size=PROFILE_SAMPLE_SIZE):
+    """
+    Thống kê các cột (list giá trị, None = ô trống): số ô có dữ liệu và sample_size giá trị đầu tiên
+    Returns: list ColumnProfile theo thứ tự cột
+    """
+    return [ColumnProfile(len(values) - values.count(None),
+                          list(islice((value for value in values if value is not None), sample_size)))
+            for values in columns]
+
+def filter_rows(columns, product_position):
+    """
+    Các dòng được giữ: cột "Tên sản phẩm" có dữ liệu (không chỉ khoảng trắng),
+    không có cột này thì bỏ các dòng hoàn toàn trống
+    """
+    if product_position is not None:
+        return [value is not None and str(value).strip() != '' for value in columns[product_position]]
+    return [any(value is not None for value in row) for row in zip(*columns)]
+
+def keep_row(row, product_position):
+    """filter_rows cho 1 dòng (list giá trị các cột)"""
+    if product_position is not None:
+        value = row[product_position]
+        return value is not None and str(value).strip() != ''
+    return any(value is not None for value in row)
+
+def detect_sheet_layout(grid, start_row, sheet_name=None):
+    """
+    Xác định bố cục của sheet bằng các heuristic (header nhiều dòng, cột tên sản phẩm,
+    cột Column_X là LOT / ĐVT, chọn cột hiển thị) - cùng các bước với convert_to_json.detect_sheet_layout
+
+    Returns: dict bố cục dùng cho extract_sheet_data (vị trí cột tính theo lưới thô của sheet)
+    """
+    first_header = grid.row(start_row)
+    second_row = grid.row(start_row + 1) if start_row + 1 < len(grid) else []
+    headers, header_rows = merge_header_rows(first_header, second_row)
+
+    data = [values[start_row + header_rows:] for values in grid.columns]
+
+    # BƯỚC 1: Tìm cột "Tên sản phẩm" hoặc "Products"
+    product_col = find_product_column(headers, lambda: profile_columns(data))
+    product_position = headers.index(product_col) if product_col else None
+
+    # BƯỚC 2: Xóa các hàng có cột "Tên sản phẩm" trống HOẶC các hàng hoàn toàn trống
+    keep = filter_rows(data, product_position)
+    data = [list(compress(values, keep)) for values in data]
+
+    # BƯỚC 3: Xóa các cột hoàn toàn trống, giữ vị trí gốc của các cột còn lại
+    column_profiles = profile_columns(data)
+    positions = [i for i, profile in enumerate(column_profiles) if profile.non_null > 0]
+    column_profiles = [column_profiles[i] for i in positions]
+    headers = [headers[i] for i in positions]
+
+    # BƯỚC 4: Tự động xác định và đặt tên cho cột LOT và Units nếu thiếu tiêu đề
+    headers = name_unlabeled_columns(headers, column_profiles)
+
+    # BƯỚC 5: Lọc và sắp xếp các cột theo logic
+    return build_layout(start_row, header_rows, product_position, headers, positions, column_profiles, sheet_name)
+
+def materialize_value(value):
+    """
+    Chuẩn hóa 1 ô (giống convert_to_json.materialize_column):
+    ngày tháng -> "DD/MM/YYYY", số -> int hoặc float, chuỗi -> strip (rỗng -> None)
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime("%d/%m/%Y")
+    if isinstance(value, (int, float)):
+        number = float(value)
+        return int(number) if number % 1 == 0 else number
+    text = str(value).strip()
+    return text if text else None
+
+def is_whole_days(value):
+    """Thời lượng tròn ngày (không có giờ / phút / giây)"""
+    return isinstance(value, Duration) and not value.seconds and not value.microseconds
+
+def materialize_values(values, whole_days=None):
+    """
+    Chuẩn hóa cả cột (giống convert_to_json.materialize_column)
+    Cột thời lượng toàn ngày chẵn được pandas hiển thị gọn "N days" (định dạng chọn theo cả cột)
+    whole_days: đã biết cả cột là thời lượng tròn ngày hay không (khi values chỉ là 1 phần của cột)
+    """
+    if whole_days is None:
+        present = [value for value in values if value is not None]
+        whole_days = bool(present) and all(is_whole_days(value) for value in present)
+    if whole_days:
+        return [None if value is None else f"{value.days} days" for value in values]
+    return [materialize_value(value) for value in values]
+
+def extract_date_from_lot_text(text):
+    """Ngày SX "DD/MM/YYYY" từ chuỗi LOT (giống convert_to_json.extract_dates_from_lots cho 1 giá trị)"""
+    match = re.search(r'(\d{6})', text)
+    if not match:
+        return None
+    digits = match.group(1)
+    if 1 <= int(digits[2:4]) <= 12 and 1 <= int(digits[4:6]) <= 31:
+        return f"{digits[4:6]}/{digits[2:4]}/20{digits[0:2]}"
+
+    match = re.search(r'(\d{8})', text)
+    if match:
+        digits = match.group(1)
+        if 1 <= int(digits[4:6]) <= 12 and 1 <= int(digits[6:8]) <= 31:
+            return f"{digits[6:8]}/{digits[4:6]}/{int(digits[0:4])}"
+    return None
+
+def build_product_records(column_values, display_columns, whole_days=None):
+    """
+    Chuyển các cột đã chọn thành list of dictionaries (tên cột mới)
+    Thêm "Ngày SX từ Lô" ngay sau cột LOT/Lô nếu số lô có dạng ngày
+    whole_days: cờ thời lượng tròn ngày của từng cột (xem materialize_values), None -> tính từ column_values
+    """
+    if whole_days is None:
+        whole_days = [None] * len(column_values)
+    columns = [materialize_values(values, flag) for values, flag in zip(column_values, whole_days)]
+    rows = len(column_values[0]) if column_values else 0
+
+    # Chỉ giữ dòng có ít nhất 1 cột quan trọng không null
+    important = [values for name, values in zip(display_columns, columns) if name in IMPORTANT_COLUMNS]
+    keep = [any(value is not None for value in row) for row in zip(*important)] if important else [False] * rows
+
+    # Ngày SX từ Lô: lấy từ cột LOT/Lô đầu tiên trích xuất được ngày
+    lot_dates = [None] * rows
+    lot_positions = [None] * rows
+    for position, (values, name) in enumerate(zip(column_values, display_columns)):
+        if is_lot_column(name):
+            for i, value in enumerate(values):
+                if lot_dates[i] is None and value is not None:
+                    lot_date = extract_date_from_lot_text(str(value))
+                    if lot_date is not None:
+                        lot_dates[i] = lot_date
+                        lot_positions[i] = position
+
+    return assemble_products(columns, display_columns, keep, lot_dates, lot_positions)
+
+def extract_sheet_data(grid, layout):
+    """
+    Lấy dữ liệu sản phẩm theo bố cục đã xác định (không chạy lại heuristic)
+    Returns: (products, display_columns)
+    """
+    start = layout['start_row'] + layout['header_rows']
+    data = [values[start:] for values in grid.columns]
+    keep = filter_rows(data, layout['product_column'])
+
+    # Chỉ giữ các cột đã chọn còn dữ liệu
+    column_values = []
+    display_columns = []
+    for new_name, _, position in layout['columns']:
+        values = list(compress(data[position], keep))
+        if any(value is not None for value in values):
+            column_values.append(values)
+            display_columns.append(new_name)
+
+    return build_product_records(column_values, display_columns), display_columns
+
+def process_sheet_data(grid, start_row, sheet_name=None):
+    """
+    Xử lý dữ liệu từ một sheet, bắt đầu từ dòng chỉ định
+    Returns: (products, display_columns)
+    """
+    return extract_sheet_data(grid, detect_sheet_layout(grid, start_row, sheet_name))
+
+def layout_fingerprint(grid, sheet_name, start_row, header_rows):
+    """
+    Dấu vân tay bố cục: tên sheet + các ô header thô (bỏ ô trống ở cuối dòng)
+    None nếu sheet không còn đủ dòng tới vị trí header
+    """
+    if start_row + header_rows > len(grid):
+        return None
+    cells = [['' if value is None else str(value).strip() for value in grid.cells(i)]
+             for i in range(start_row, start_row + header_rows)]
+    return fingerprint_rows(sheet_name, start_row, cells)
+
+def parse_lot_date(lot_value):
+    """
+    Ngày hết hạn từ LOT (giống convert_to_json.parse_lots_to_dates cho 1 giá trị)
+    YYYYMMDD, YYMMDD: ngày cụ thể, YYMM: ngày cuối tháng; None nếu không parse được
+    """
+    digits = '' if is_missing(lot_value) else re.sub(r'\D', '', str(lot_value))
+    try:
+        if len(digits) == 8:
+            return date(int(digits[0:4]), int(digits[4:6]), int(digits[6:8]))
+        if len(digits) in (6, 4):
+            year = int(digits[0:2])
+            year = 2000 + year if year < 50 else 1900 + year
+            month = int(digits[2:4])
+            if len(digits) == 6:
+                return date(year, month, int(digits[4:6]))
+            # Tháng 00 -> ngày cuối năm trước
+            if month <= 12:
+                return date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    except ValueError:
+        pass
+    return None
+
+def parse_lots_to_dates(lot_values):
+    """Ngày hết hạn cho cả cột LOT: list date, None nếu không parse được"""
+    return [parse_lot_date(lot_value) for lot_value in lot_values]
+
+def shelf_life_number(value):
+    """Thời hạn (tháng) dạng số như pd.to_numeric(errors='coerce').fillna(0)"""
+    if isinstance(value, str):
+        parsed = parse_number(value)
+        value = None if parsed is None else parsed[0]
+    if not isinstance(value, (int, float)) or value != value:
+        return 0.0
+    return float(value)
+
+def format_dates(dates):
+    """Định dạng list ngày thành chuỗi "DD/MM/YYYY" (None giữ nguyên)"""
+    return [None if value is None else value.strftime("%d/%m/%Y") for value in dates]
+
+def calculate_remaining_percentages(lot_values, shelf_life_months, today=None):
+    """
+    Tính % hạn sử dụng còn lại cho cả cột LOT (cùng kết quả với convert_to_json.calculate_remaining_percentages)
+    shelf_life_months: Thời hạn sử dụng (tháng) - một số chung hoặc danh sách theo từng dòng
+    today: Ngày tham chiếu dùng chung cho cả lô (mặc định: datetime.now())
+
+    Returns: (percentages, expiry_dates, production_dates) - None nếu không tính được
+    """
+    if today is None:
+        today = datetime.now()
+
+    expiry_dates = parse_lots_to_dates(lot_values)
+    if isinstance(shelf_life_months, (list, tuple)):
+        shelf_lives = [shelf_life_number(value) for value in shelf_life_months]
+    else:
+        shelf_lives = [shelf_life_number(shelf_life_months)] * len(expiry_dates)
+
+    # Thời hạn theo ngày: mỗi giá trị thời hạn khác nhau chỉ tính một lần
+    deltas = {months: timedelta(days=months * 30.44) for months in set(shelf_lives)}
+    one_day = timedelta(days=1)
+
+    percentages = []
+    production_dates = []
+    for i, (expiry_date, months) in enumerate(zip(expiry_dates, shelf_lives)):
+        # Không có thời hạn hoặc không parse được LOT -> không tính
+        if months == 0 or expiry_date is None:
+            expiry_dates[i] = None
+            percentages.append(None)
+            production_dates.append(None)
+            continue
+
+        expiry = datetime(expiry_date.year, expiry_date.month, expiry_date.day)
+        delta = deltas[months]
+        try:
+            production_dates.append(expiry - delta)
+        except OverflowError:
+            production_dates.append(None)
+        total_days = delta // one_day
+        days_remaining = (expiry - today) // one_day
+        if days_remaining <= 0 or total_days <= 0:
+            percentages.append(0)
+        else:
+            percentages.append(round(days_remaining / total_days * 100, 1))
+
+    return percentages, expiry_dates, production_dates
+
+def resolve_sheet_layout(grid, sheet_name, layouts, layout_changes):
+    """Bố cục của sheet (dùng lại bố cục đã lưu nếu header không đổi), xem convert_core.resolve_sheet_layout"""
+    return convert_core.resolve_sheet_layout(ENGINE, grid, sheet_name, layouts, layout_changes)
+
+def convert_excel_to_json(excel_file=None, output_file='inventory_data.json', compact=False,
+                          history_dir=history_store.HISTORY_DIR, db_path=None,
+                          layout_cache_file=LAYOUT_CACHE_FILE,
+                          metrics_file=conversion_metrics.METRICS_FILE, trace_memory=False, split=None,
+                          source_name=None):
+    """
+    Chuyển đổi file Excel sang JSON (tất cả các sheet) không dùng pandas
+    Tham số: xem convert_core.convert_workbook
+    """
+    return convert_core.convert_workbook(ENGINE, excel_file, output_file, compact=compact,
+                                         history_dir=history_dir, db_path=db_path,
+                                         layout_cache_file=layout_cache_file,
+                                         metrics_file=metrics_file, trace_memory=trace_memory, split=split,
+                                         source_name=source_name)
+
+def recalculate_inventory(inventory_data, config, today=None):
+    """
+    Tính lại Thời hạn (tháng), % Còn lại và Ngày hết hạn trực tiếp trên dữ liệu JSON đã có
+    Returns: số dòng đã được tính lại
+    """
+    return convert_core.recalculate_inventory(ENGINE, inventory_data, config, today)
+
+def recalculate_shelf_life(data_file='inventory_data.json', db_path=None):
+    """Chỉ tính lại phần hạn sử dụng từ inventory_data.json (hoặc database) hiện có, không đọc lại file Excel"""
+    return convert_core.recalculate_shelf_life(ENGINE, data_file, db_path)
+
+def load_cached_conversion(cache, key, output_file='inventory_data.json', compact=False,
+                           excel_file=None, history_dir=history_store.HISTORY_DIR, db_path=None,
+                           metrics_file=conversion_metrics.METRICS_FILE, split=None):
+    """
+    Lấy kết quả chuyển đổi từ cache (ConversionCache) và ghi ra output_file
+    Returns: inventory_data, hoặc None nếu cache chưa có key này
+    """
+    return convert_core.load_cached_conversion(ENGINE, cache, key, output_file, compact=compact,
+                                               excel_file=excel_file, history_dir=history_dir,
+                                               db_path=db_path, metrics_file=metrics_file, split=split)
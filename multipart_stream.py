@@ -0,0 +1,198 @@
+"""
+Parser multipart/form-data dạng streaming cho upload file Excel
+Đọc request theo từng chunk, tìm boundary kể cả khi boundary nằm vắt qua 2 chunk,
+và ghi phần file thẳng xuống đĩa (hoặc spooled temp file) trong lúc đọc.
+Bộ nhớ dùng tối đa chỉ vài chunk, không phụ thuộc kích thước file.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from email.message import Message
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024      # File nhỏ hơn 1 MB giữ trong RAM khi không chỉ định thư mục
+MAX_HEADER_SIZE = 16 * 1024
+MAX_FIELD_SIZE = 1024 * 1024      # Giới hạn cho các field text (không phải file)
+
+class UploadedFile:
+    """
+    File đã nhận từ request multipart
+    - filename: tên file gốc (đã bỏ phần đường dẫn)
+    - file: file object đã ghi xong, con trỏ ở đầu file
+    - path: đường dẫn trên đĩa (None nếu là spooled temp file)
+    - size, sha256: kích thước và hash nội dung, tính trong lúc stream
+    """
+    def __init__(self, filename, file, path=None):
+        self.filename = filename
+        self.file = file
+        self.path = path
+        self.size = 0
+        self._digest = hashlib.sha256()
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    def write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+        self._digest.update(data)
+
+    def finish(self):
+        self.file.flush()
+        self.file.seek(0)
+
+    def save_as(self, destination):
+        """Lưu file tới destination (đổi tên nếu đã nằm trên đĩa, copy nếu là spooled file)"""
+        if self.path:
+            self.file.close()
+            os.replace(self.path, destination)
+            self.path = destination
+        else:
+            with open(destination, 'wb') as out:
+                shutil.copyfileobj(self.file, out, CHUNK_SIZE)
+            self.file.close()
+        return destination
+
+    def discard(self):
+        """Bỏ file (ví dụ khi đã có kết quả trong cache)"""
+        self.file.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+def get_boundary(content_type):
+    """Lấy boundary từ header Content-Type, lỗi ValueError nếu không phải multipart"""
+    message = Message()
+    message['Content-Type'] = content_type or ''
+    boundary = message.get_param('boundary')
+    if message.get_content_type() != 'multipart/form-data' or not boundary:
+        raise ValueError('Invalid content type')
+    return boundary.encode('latin-1')
+
+def parse_part_headers(header_block):
+    """Parse header của một part -> (name, filename); filename là None nếu không phải file"""
+    message = Message()
+    for line in header_block.decode('utf-8', errors='replace').split('\r\n'):
+        if ':' in line:
+            key, value = line.split(':', 1)
+            message[key.strip()] = value.strip()
+    name = message.get_param('name', header='content-disposition')
+    filename = message.get_filename()
+    if filename is not None:
+        # Một số trình duyệt gửi kèm đường dẫn đầy đủ
+        filename = os.path.basename(filename.replace('\\', '/'))
+    return name, filename
+
+def parse_multipart(rfile, content_type, content_length, upload_dir=None, chunk_size=CHUNK_SIZE, max_files=None):
+    """
+    Đọc request multipart/form-data từ rfile theo từng chunk
+    upload_dir: thư mục ghi file trực tiếp; None -> dùng SpooledTemporaryFile
+    max_files: chỉ giữ ngần này file đầu tiên, các part file sau được đọc bỏ (không ghi ra đĩa)
+    Part file trùng tên field với part trước cũng bị đọc bỏ
+
+    Returns: (fields, files)
+    - fields: dict tên field -> giá trị text
+    - files: dict tên field -> UploadedFile
+    """
+    delimiter = b'\r\n--' + get_boundary(content_type)
+    keep = len(delimiter) - 1
+    remaining = content_length
+    # Thêm CRLF ở đầu để boundary đầu tiên có cùng dạng với các boundary sau
+    buffer = bytearray(b'\r\n')
+
+    def read_more():
+        nonlocal remaining
+        if remaining <= 0:
+            return False
+        chunk = rfile.read(min(chunk_size, remaining))
+        if not chunk:
+            raise ValueError('Upload bị ngắt giữa chừng')
+        remaining -= len(chunk)
+        buffer.extend(chunk)
+        return True
+
+    def need(size):
+        while len(buffer) < size:
+            if not read_more():
+                raise ValueError('Dữ liệu multipart không đầy đủ')
+
+    fields = {}
+    files = {}
+    try:
+        # Bỏ qua phần preamble trước boundary đầu tiên
+        while True:
+            index = buffer.find(delimiter)
+            if index >= 0:
+                del buffer[:index + len(delimiter)]
+                break
+            if len(buffer) > keep:
+                del buffer[:-keep]
+            if not read_more():
+                raise ValueError('No file found in request')
+
+        while True:
+            need(2)
+            if buffer[:2] == b'--':
+                break  # Boundary kết thúc
+
+            # Header của part
+            while True:
+                index = buffer.find(b'\r\n\r\n')
+                if index >= 0:
+                    break
+                if len(buffer) > MAX_HEADER_SIZE or not read_more():
+                    raise ValueError('Header multipart không hợp lệ')
+            name, filename = parse_part_headers(bytes(buffer[:index]))
+            del buffer[:index + 4]
+
+            if filename is not None and (name in files or (max_files is not None and len(files) >= max_files)):
+                sink = None
+            elif filename is not None:
+                if upload_dir:
+                    handle = tempfile.NamedTemporaryFile(dir=upload_dir, suffix='.part', delete=False)
+                    sink = UploadedFile(filename, handle, handle.name)
+                else:
+                    sink = UploadedFile(filename, tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE))
+                files[name] = sink
+            else:
+                sink = bytearray()
+
+            # Nội dung part: ghi phần chắc chắn không chứa boundary, giữ lại đuôi cho chunk sau
+            while True:
+                index = buffer.find(delimiter)
+                if index >= 0:
+                    sink_data, consumed = buffer[:index], index + len(delimiter)
+                else:
+                    sink_data, consumed = buffer[:max(len(buffer) - keep, 0)], None
+                if sink is None:
+                    pass
+                elif isinstance(sink, UploadedFile):
+                    sink.write(sink_data)
+                else:
+                    sink.extend(sink_data)
+                    if len(sink) > MAX_FIELD_SIZE:
+                        raise ValueError(f'Field {name} quá lớn')
+                if consumed is not None:
+                    del buffer[:consumed]
+                    break
+                del buffer[:len(sink_data)]
+                if not read_more():
+                    raise ValueError('Thiếu boundary kết thúc')
+
+            if isinstance(sink, UploadedFile):
+                sink.finish()
+            elif sink is not None:
+                fields[name] = sink.decode('utf-8', errors='replace')
+
+        # Đọc hết phần còn lại (epilogue) để không lệch dữ liệu trên kết nối
+        while remaining > 0:
+            buffer.clear()
+            read_more()
+    except Exception:
+        for uploaded in files.values():
+            uploaded.discard()
+        raise
+
+    return fields, files
@@ -5,6 +5,21 @@ let currentSheetIndex = 0;
 let currentSheetProducts = [];
 let filteredProducts = [];
 let selectedFile = null;
+let inventoryEtag = null;  // ETag của inventory_data.json đã tải (bỏ qua parse nếu không đổi)
+let filteredTotal = null;  // Tổng số dòng khớp khi tìm trên server (chỉ tải về 1 trang), null khi lọc tại chỗ
+
+// Tìm kiếm qua /query: server tìm trên index dựng sẵn và chỉ trả về 1 trang kết quả
+const SEARCH_PAGE_SIZE = 500;  // MAX_LIMIT của /query
+const SEARCH_DELAY_MS = 200;   // Chờ ngừng gõ rồi mới gửi, không gửi mỗi phím
+let dataFromServer = false;    // Dữ liệu đang xem là inventory_data.json của server (không phải kết quả upload trên Vercel)
+let serverSearchAvailable = true;  // Tắt khi /query không dùng được (chỉ có file tĩnh) -> lọc trong trình duyệt
+let searchTimer = null;
+let searchRequestId = 0;
+
+// Dữ liệu tách theo sheet (convert_to_json.py --split): manifest nhỏ + 1 file mỗi sheet, chỉ tải sheet đang xem
+const PARTITION_DIR = 'inventory_data/';
+const loadedSheets = {};   // Sheet đã tải: { tên file: sheet } - dùng lại khi version trong manifest không đổi
+const pendingSheets = {};  // Sheet đang tải: { tên file: Promise }
 
 // Kiểm tra xem có đang chạy trên production (Vercel) hay không
 function isProduction() {
@@ -90,6 +105,9 @@ function setupFileUpload() {
             // If data is returned, use it directly (for Vercel deployment)
             if (result.data) {
                 inventoryData = result.data;
+                inventoryEtag = null;
+                // Kết quả chỉ có trong response, /query của server không có dữ liệu này
+                dataFromServer = false;
                 allSheets = inventoryData.sheets || [];
                 
                 if (allSheets.length > 0) {
@@ -122,14 +140,32 @@ async function loadInventoryData(preserveCurrentSheet = false) {
         // Lưu sheet index hiện tại nếu cần preserve
         const savedSheetIndex = preserveCurrentSheet ? currentSheetIndex : 0;
         
-        const response = await fetch('inventory_data.json?' + new Date().getTime());
+        // Có bản tách theo sheet thì chỉ tải manifest, không thì tải cả inventory_data.json
+        // no-cache: trình duyệt hỏi lại server bằng ETag, nhận 304 (không tải lại) nếu dữ liệu chưa đổi
+        let response = await fetch(PARTITION_DIR + 'manifest.json', { cache: 'no-cache' });
+        const partitioned = response.ok;
+        if (!partitioned) {
+            response = await fetch('inventory_data.json', { cache: 'no-cache' });
+        }
         
         if (!response.ok) {
             throw new Error('Không thể tải file dữ liệu');
         }
 
-        inventoryData = await response.json();
+        const etag = response.headers.get('ETag');
+        if (!(inventoryData && etag && etag === inventoryEtag)) {
+            inventoryData = await response.json();
+            inventoryEtag = etag;
+        }
+        dataFromServer = true;
         allSheets = inventoryData.sheets || [];
+        if (partitioned) {
+            // Sheet đã tải và không đổi (cùng version) thì dùng lại, không tải lại
+            allSheets = allSheets.map(entry => {
+                const loaded = loadedSheets[entry.file];
+                return loaded && loaded.version === entry.version ? loaded : entry;
+            });
+        }
 
         if (allSheets.length === 0) {
             throw new Error('Không có sheet nào trong dữ liệu');
@@ -142,7 +178,7 @@ async function loadInventoryData(preserveCurrentSheet = false) {
         createTabs();
         
         // Hiển thị sheet đã lưu hoặc sheet đầu tiên
-        switchToSheet(savedSheetIndex);
+        await switchToSheet(savedSheetIndex);
         
         // Ẩn thông báo không có dữ liệu
         document.getElementById('no-data').classList.add('hidden');
@@ -184,12 +220,72 @@ function createTabs() {
     });
 }
 
+// Lấy danh sách sản phẩm của sheet
+// Hỗ trợ cả dạng dòng (products) và dạng cột gọn (data: { tên cột: [giá trị từng dòng] })
+function getSheetProducts(sheet) {
+    if (sheet.products) return sheet.products;
+    if (!sheet.data) return [];
+    
+    const keys = Object.keys(sheet.data);
+    const rowCount = keys.length > 0 ? sheet.data[keys[0]].length : 0;
+    // missing: { tên cột: [chỉ số các dòng không có cột này] }
+    const missing = {};
+    Object.entries(sheet.missing || {}).forEach(([key, rows]) => {
+        missing[key] = new Set(rows);
+    });
+    
+    const products = new Array(rowCount);
+    for (let i = 0; i < rowCount; i++) {
+        const product = {};
+        keys.forEach(key => {
+            if (missing[key] && missing[key].has(i)) return;
+            product[key] = sheet.data[key][i];
+        });
+        products[i] = product;
+    }
+    
+    // Chỉ dựng 1 lần cho mỗi sheet, lần sau dùng lại
+    sheet.products = products;
+    return products;
+}
+
+// Sheet trong manifest chưa có dữ liệu (chưa tải file của sheet)
+function isSheetLoaded(sheet) {
+    return !sheet.file || Boolean(sheet.products || sheet.data);
+}
+
+// Tải file của 1 sheet (dữ liệu tách theo sheet), lưu lại để lần sau không tải nữa
+async function loadSheet(sheetIndex) {
+    const entry = allSheets[sheetIndex];
+    if (isSheetLoaded(entry)) return entry;
+    
+    if (!pendingSheets[entry.file]) {
+        pendingSheets[entry.file] = (async () => {
+            const response = await fetch(PARTITION_DIR + entry.file, { cache: 'no-cache' });
+            if (!response.ok) {
+                throw new Error(`Không thể tải sheet ${entry.sheet_name} (${response.status})`);
+            }
+            // Giữ thông tin trong manifest (file, version, columns) kèm dữ liệu của sheet
+            const sheet = { ...entry, ...(await response.json()) };
+            loadedSheets[entry.file] = sheet;
+            return sheet;
+        })().finally(() => {
+            delete pendingSheets[entry.file];
+        });
+    }
+    
+    const sheet = await pendingSheets[entry.file];
+    // Manifest có thể đã được tải lại trong lúc chờ
+    if (allSheets[sheetIndex] === entry) {
+        allSheets[sheetIndex] = sheet;
+    }
+    return sheet;
+}
+
 // Chuyển đổi giữa các sheet
-function switchToSheet(sheetIndex) {
+async function switchToSheet(sheetIndex) {
     currentSheetIndex = sheetIndex;
-    const sheet = allSheets[sheetIndex];
-    currentSheetProducts = sheet.products || [];
-    filteredProducts = [...currentSheetProducts];
+    let sheet = allSheets[sheetIndex];
     
     // Cập nhật active tab
     document.querySelectorAll('.tab').forEach((tab, index) => {
@@ -200,12 +296,51 @@ function switchToSheet(sheetIndex) {
         }
     });
     
-    // Hiển thị nội dung sheet
-    displaySheetContent(sheet);
-    
     // Reset tìm kiếm
     document.getElementById('search-input').value = '';
     document.getElementById('column-filter').value = 'all';
+    clearTimeout(searchTimer);
+    searchRequestId++;  // Bỏ kết quả tìm kiếm của sheet trước nếu còn đang chờ
+    filteredTotal = null;
+    
+    if (!isSheetLoaded(sheet)) {
+        currentSheetProducts = [];
+        filteredProducts = [];
+        displaySheetContent(sheet);
+        showSheetMessage('⏳ Đang tải dữ liệu sheet...');
+        try {
+            sheet = await loadSheet(sheetIndex);
+        } catch (error) {
+            console.error('Lỗi khi tải sheet:', error);
+            if (currentSheetIndex === sheetIndex) {
+                showSheetMessage('✗ ' + error.message);
+            }
+            return;
+        }
+        // Người dùng đã chuyển sang tab khác trong lúc tải
+        if (currentSheetIndex !== sheetIndex) return;
+    }
+    
+    currentSheetProducts = getSheetProducts(sheet);
+    filteredProducts = [...currentSheetProducts];
+    
+    // Hiển thị nội dung sheet
+    displaySheetContent(sheet);
+}
+
+// Hiển thị 1 dòng thông báo trong bảng (đang tải, lỗi)
+function showSheetMessage(message) {
+    const tbody = document.getElementById('table-body');
+    if (!tbody) return;
+    
+    tbody.innerHTML = '';
+    const row = document.createElement('tr');
+    const cell = document.createElement('td');
+    cell.colSpan = Math.max(1, (allSheets[currentSheetIndex].columns || []).length);
+    cell.textContent = message;
+    cell.className = 'no-results-cell';
+    row.appendChild(cell);
+    tbody.appendChild(row);
 }
 
 // Hiển thị nội dung sheet
@@ -246,9 +381,12 @@ function displaySheetContent(sheet) {
     
     sheetContents.appendChild(sheetDiv);
     
-    // Hiển thị dữ liệu
-    if (currentSheetProducts.length > 0) {
-        const columns = Object.keys(currentSheetProducts[0]);
+    // Hiển thị dữ liệu (sheet đang tải: chỉ dựng header theo danh sách cột trong manifest)
+    let columns = currentSheetProducts.length > 0 ? Object.keys(currentSheetProducts[0]) : [];
+    if (columns.length === 0 && !isSheetLoaded(sheet)) {
+        columns = sheet.columns || [];
+    }
+    if (columns.length > 0) {
         
         // Tạo header
         const headerRow = document.createElement('tr');
@@ -263,7 +401,9 @@ function displaySheetContent(sheet) {
         updateColumnFilter(columns);
         
         // Hiển thị body
-        displayTableBody();
+        if (currentSheetProducts.length > 0) {
+            displayTableBody();
+        }
     }
 }
 
@@ -428,30 +568,132 @@ async function saveProductShelfLife(productCode, lotNumber, shelfLifeMonths) {
     }
 }
 
-// Lọc sản phẩm theo từ khóa tìm kiếm
+// Lưu nhiều thời hạn cùng lúc (1 lần ghi cấu hình + 1 lần tính lại trên server)
+// updates: [{ product_code, lot_number, shelf_life_months }, ...]
+async function saveProductShelfLifeBatch(updates) {
+    try {
+        const saveUrl = window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1'
+            ? '/save_shelf_life_batch'
+            : '/api/save_shelf_life_batch';
+
+        const response = await fetch(saveUrl, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ updates })
+        });
+
+        if (!response.ok) {
+            const errorData = await response.json().catch(() => ({}));
+            console.error('Không thể lưu thời hạn sử dụng:', errorData.message || response.statusText);
+            return false;
+        }
+
+        // Server đã tính lại % -> tải lại dữ liệu, giữ nguyên sheet hiện tại
+        await loadInventoryData(true);
+        return true;
+    } catch (error) {
+        console.error('Lỗi khi lưu:', error.message);
+        return false;
+    }
+}
+
+// Gọi API truy vấn (GET) với tham số, bỏ qua các tham số rỗng
+async function fetchQuery(path, params = {}) {
+    const queryUrl = window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1'
+        ? `/${path}`
+        : `/api/${path}`;
+    
+    const search = new URLSearchParams();
+    Object.entries(params).forEach(([key, value]) => {
+        if (value !== null && value !== undefined && value !== '') {
+            search.append(key, value);
+        }
+    });
+    
+    const response = await fetch(`${queryUrl}?${search.toString()}`);
+    const result = await response.json().catch(() => ({}));
+    if (!response.ok) {
+        throw new Error(result.message || `Truy vấn thất bại (${response.status})`);
+    }
+    return result;
+}
+
+// Truy vấn sản phẩm phía server (chỉ tải về 1 trang kết quả)
+// params: { sheet, code, name, lot, min_qty, max_qty, min_pct, max_pct, sort, order, offset, limit }
+function queryProducts(params = {}) {
+    return fetchQuery('query', params);
+}
+
+// Các LOT hết hạn trong N ngày tới hoặc còn dưới X%
+// params: { days, max_pct, include_expired, limit }
+function queryExpiringLots(params = {}) {
+    return fetchQuery('expiring', params);
+}
+
+// Lọc sản phẩm theo từ khóa tìm kiếm: tìm trên server qua /query nếu được, không thì lọc trong trình duyệt
 function filterProducts(searchTerm) {
     const columnFilter = document.getElementById('column-filter').value;
     searchTerm = searchTerm.toLowerCase().trim();
+    clearTimeout(searchTimer);
+    const requestId = ++searchRequestId;
 
     if (!searchTerm) {
         filteredProducts = [...currentSheetProducts];
-    } else {
-        filteredProducts = currentSheetProducts.filter(product => {
-            if (columnFilter === 'all') {
-                // Tìm kiếm trong tất cả các cột
-                return Object.values(product).some(value => {
-                    if (value === null || value === undefined) return false;
-                    return String(value).toLowerCase().includes(searchTerm);
-                });
-            } else {
-                // Tìm kiếm trong cột cụ thể
-                const value = product[columnFilter];
+        filteredTotal = null;
+        showFilteredProducts();
+        return;
+    }
+    if (!dataFromServer || !serverSearchAvailable) {
+        filterProductsLocally(searchTerm, columnFilter);
+        return;
+    }
+
+    const sheetIndex = currentSheetIndex;
+    searchTimer = setTimeout(async () => {
+        try {
+            const result = await queryProducts({
+                sheet: allSheets[sheetIndex].sheet_name,
+                q: searchTerm,
+                column: columnFilter === 'all' ? '' : columnFilter,
+                limit: SEARCH_PAGE_SIZE
+            });
+            // Đã gõ tiếp hoặc chuyển sheet trong lúc chờ kết quả
+            if (requestId !== searchRequestId || sheetIndex !== currentSheetIndex) return;
+            filteredProducts = result.products;
+            filteredTotal = result.total;
+            showFilteredProducts();
+        } catch (error) {
+            if (requestId !== searchRequestId) return;
+            console.warn('Không tìm được qua /query, lọc trong trình duyệt:', error.message);
+            serverSearchAvailable = false;
+            filterProductsLocally(searchTerm, columnFilter);
+        }
+    }, SEARCH_DELAY_MS);
+}
+
+// Lọc trên dữ liệu đã tải (bản upload trên Vercel, hoặc khi không có /query)
+function filterProductsLocally(searchTerm, columnFilter) {
+    filteredProducts = currentSheetProducts.filter(product => {
+        if (columnFilter === 'all') {
+            // Tìm kiếm trong tất cả các cột
+            return Object.values(product).some(value => {
                 if (value === null || value === undefined) return false;
                 return String(value).toLowerCase().includes(searchTerm);
-            }
-        });
-    }
+            });
+        } else {
+            // Tìm kiếm trong cột cụ thể
+            const value = product[columnFilter];
+            if (value === null || value === undefined) return false;
+            return String(value).toLowerCase().includes(searchTerm);
+        }
+    });
+    filteredTotal = null;
+    showFilteredProducts();
+}
 
+function showFilteredProducts() {
     displayTableBody();
     updateProductCount();
 }
@@ -461,7 +703,11 @@ function updateProductCount() {
     const sheet = allSheets[currentSheetIndex];
     const sheetStats = document.querySelector('.sheet-stats strong');
     if (sheetStats) {
-        sheetStats.textContent = `${filteredProducts.length} / ${sheet.total_products}`;
+        // Tìm trên server chỉ hiện trang đầu: ghi rõ số dòng đang hiện / số dòng khớp
+        const matched = filteredTotal !== null && filteredTotal > filteredProducts.length
+            ? `${filteredProducts.length} (${filteredTotal} khớp)`
+            : `${filteredTotal ?? filteredProducts.length}`;
+        sheetStats.textContent = `${matched} / ${sheet.total_products}`;
     }
 }
 
@@ -534,7 +780,12 @@ window.inventoryManager = {
     getSheets: () => allSheets,
     getCurrentSheet: () => allSheets[currentSheetIndex],
     getCurrentProducts: () => currentSheetProducts,
+    getSheetProducts: getSheetProducts,
+    loadSheet: loadSheet,
     getFilteredProducts: () => filteredProducts,
     switchSheet: (index) => switchToSheet(index),
-    recalculate: recalculatePercentages
+    recalculate: recalculatePercentages,
+    saveShelfLives: saveProductShelfLifeBatch,
+    query: queryProducts,
+    expiring: queryExpiringLots
 };
@@ -0,0 +1,349 @@
+"""
+Lưu tồn kho trong SQLite (inventory.db) thay cho 1 file JSON lớn
+- snapshots: thông tin mỗi lần chuyển đổi (ngày tồn kho, file nguồn, số sản phẩm...)
+- sheets: thông tin từng sheet của snapshot (cột hiển thị, thời hạn...)
+- products: mỗi dòng sản phẩm 1 bản ghi, có index theo sheet, Mã, LOT
+- shelf_life / sheet_shelf_life: thời hạn sử dụng (thay cho product_config.json)
+Chỉ giữ dữ liệu dòng của snapshot mới nhất (lịch sử các ngày nằm trong history_store),
+inventory_data.json chỉ còn là bản xuất ra từ database khi cần
+Module này không phụ thuộc pandas để dùng được từ server và các API nhẹ
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from datetime import datetime
+
+import file_store
+from history_store import sheet_key_columns
+from inventory_index import normalize_key, DEFAULT_LIMIT, MAX_LIMIT, _int_param
+
+DB_FILE = 'inventory.db'
+BUSY_TIMEOUT = 30  # giây
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date_ton_kho TEXT,
+    source_file TEXT,
+    last_updated TEXT,
+    total_sheets INTEGER,
+    total_products INTEGER,
+    metadata TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sheets (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    sheet_name TEXT NOT NULL,
+    info TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, position)
+);
+CREATE TABLE IF NOT EXISTS products (
+    snapshot_id INTEGER NOT NULL,
+    sheet_name TEXT NOT NULL,
+    row_num INTEGER NOT NULL,
+    code TEXT,
+    lot TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, sheet_name, row_num)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_products_code ON products (snapshot_id, code);
+CREATE INDEX IF NOT EXISTS idx_products_lot ON products (snapshot_id, lot);
+CREATE TABLE IF NOT EXISTS shelf_life (
+    unique_key TEXT PRIMARY KEY,
+    shelf_life_months INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sheet_shelf_life (
+    sheet_name TEXT PRIMARY KEY,
+    shelf_life_months TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Các database đã tạo bảng trong process này (không chạy lại SCHEMA mỗi lần mở)
+_initialized = set()
+_init_lock = threading.Lock()
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+class InventoryDB:
+    """Truy cập inventory.db; mỗi thao tác mở 1 kết nối riêng nên dùng được từ nhiều thread"""
+    def __init__(self, db_path=DB_FILE, config_path=file_store.CONFIG_FILE):
+        self.db_path = db_path
+        # product_config.json cũ được nhập vào database ở lần mở đầu tiên
+        self.config_path = config_path
+
+    def connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        key = os.path.abspath(self.db_path)
+        if key not in _initialized:
+            with _init_lock:
+                if key not in _initialized:
+                    # WAL: đọc không bị chặn trong lúc đang ghi snapshot mới
+                    connection.execute("PRAGMA journal_mode = WAL")
+                    connection.executescript(SCHEMA)
+                    self._import_config(connection)
+                    _initialized.add(key)
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        """1 transaction ghi (BEGIN IMMEDIATE: giữ quyền ghi ngay từ đầu, tránh deadlock khi nâng cấp khóa)"""
+        with closing(self.connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def _import_config(self, connection):
+        """Nhập product_config.json (nếu có) vào bảng thời hạn, chỉ 1 lần cho mỗi database"""
+        if connection.execute("SELECT 1 FROM state WHERE key = 'config_imported'").fetchone():
+            return
+        config = file_store.load_product_config(self.config_path)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._write_config(connection, config)
+            connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('config_imported', ?)", (_now(),))
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    @staticmethod
+    def _bump_version(connection):
+        """Tăng phiên bản dữ liệu sau mỗi lần ghi (để biết khi nào cần xuất lại JSON)"""
+        connection.execute(
+            "INSERT INTO state (key, value) VALUES ('version', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+    def version(self):
+        """Phiên bản dữ liệu hiện tại (0 nếu chưa có snapshot)"""
+        with closing(self.connect()) as connection:
+            row = connection.execute("SELECT value FROM state WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else 0
+
+    # ---- Cấu hình thời hạn sử dụng ----
+
+    @staticmethod
+    def _write_config(connection, config):
+        connection.execute("DELETE FROM sheet_shelf_life")
+        connection.executemany(
+            "INSERT INTO sheet_shelf_life (sheet_name, shelf_life_months) VALUES (?, ?)",
+            [(name, json.dumps(months, ensure_ascii=False))
+             for name, months in config.get('shelf_life_months', {}).items()])
+        connection.execute("DELETE FROM shelf_life")
+        now = _now()
+        connection.executemany(
+            "INSERT INTO shelf_life (unique_key, shelf_life_months, updated_at) VALUES (?, ?, ?)",
+            [(key, months, now) for key, months in config.get('product_specific_shelf_life', {}).items()])
+
+    def load_product_config(self):
+        """Cấu hình thời hạn, cùng dạng với product_config.json"""
+        with closing(self.connect()) as connection:
+            sheet_rows = connection.execute(
+                "SELECT sheet_name, shelf_life_months FROM sheet_shelf_life ORDER BY rowid").fetchall()
+            product_rows = connection.execute(
+                "SELECT unique_key, shelf_life_months FROM shelf_life ORDER BY rowid").fetchall()
+        return {
+            'shelf_life_months': {name: json.loads(months) for name, months in sheet_rows},
+            'product_specific_shelf_life': dict(product_rows)
+        }
+
+    def save_product_config(self, config):
+        """Thay toàn bộ cấu hình thời hạn"""
+        with self.transaction() as connection:
+            self._write_config(connection, config)
+
+    def update_product_shelf_life(self, updates):
+        """
+        Lưu nhiều thời hạn riêng trong 1 transaction
+        updates: list (unique_key, shelf_life_months), giống file_store.update_product_shelf_life
+        """
+        now = _now()
+        with self.transaction() as connection:
+            connection.executemany(
+                "INSERT INTO shelf_life (unique_key, shelf_life_months, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(unique_key) DO UPDATE SET "
+                "shelf_life_months = excluded.shelf_life_months, updated_at = excluded.updated_at",
+                [(key, int(months), now) for key, months in updates])
+        return self.load_product_config()
+
+    # ---- Dữ liệu tồn kho ----
+
+    @staticmethod
+    def _product_rows(snapshot_id, sheet):
+        code_column, lot_column, _ = sheet_key_columns(sheet)
+        sheet_name = sheet.get('sheet_name')
+        for row_num, product in enumerate(sheet.get('products', [])):
+            yield (
+                snapshot_id, sheet_name, row_num,
+                normalize_key(product.get(code_column)) if code_column else None,
+                normalize_key(product.get(lot_column)) if lot_column else None,
+                json.dumps(product, ensure_ascii=False, separators=(',', ':'))
+            )
+
+    @staticmethod
+    def _sheet_info(sheet):
+        """Thông tin sheet trừ danh sách sản phẩm (giữ nguyên thứ tự key)"""
+        return json.dumps({key: value for key, value in sheet.items() if key != 'products'},
+                          ensure_ascii=False)
+
+    def save_inventory(self, inventory_data):
+        """
+        Ghi inventory_data (dạng products) thành snapshot mới trong 1 transaction (bulk insert)
+        Dữ liệu dòng của các snapshot cũ bị xóa, chỉ giữ lại thông tin snapshot
+        Returns: id của snapshot
+        """
+        metadata = inventory_data.get('metadata', {})
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO snapshots (date_ton_kho, source_file, last_updated, total_sheets, "
+                "total_products, metadata, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (metadata.get('date_ton_kho'), metadata.get('source_file'), metadata.get('last_updated'),
+                 metadata.get('total_sheets'), metadata.get('total_products'),
+                 json.dumps(metadata, ensure_ascii=False), _now()))
+            snapshot_id = cursor.lastrowid
+            connection.execute("DELETE FROM products WHERE snapshot_id != ?", (snapshot_id,))
+            connection.execute("DELETE FROM sheets WHERE snapshot_id != ?", (snapshot_id,))
+            for position, sheet in enumerate(inventory_data.get('sheets', [])):
+                connection.execute(
+                    "INSERT INTO sheets (snapshot_id, position, sheet_name, info) VALUES (?, ?, ?, ?)",
+                    (snapshot_id, position, sheet.get('sheet_name'), self._sheet_info(sheet)))
+                connection.executemany(
+                    "INSERT INTO products (snapshot_id, sheet_name, row_num, code, lot, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    self._product_rows(snapshot_id, sheet))
+            self._bump_version(connection)
+        # Cập nhật thống kê sau bulk insert, nếu không planner quét theo snapshot_id thay vì dùng index Mã / LOT
+        with closing(self.connect()) as connection:
+            connection.execute("ANALYZE products")
+        return snapshot_id
+
+    def update_inventory(self, inventory_data, snapshot_id=None):
+        """
+        Ghi lại dữ liệu của snapshot hiện tại sau khi tính lại hạn sử dụng (không tạo snapshot mới)
+        Chỉ các dòng có nội dung thay đổi mới được UPDATE
+        """
+        current = self.current_snapshot()
+        if current is None:
+            return self.save_inventory(inventory_data)
+        snapshot_id = snapshot_id or current['id']
+        metadata = inventory_data.get('metadata', {})
+        with self.transaction() as connection:
+            connection.execute(
+                "UPDATE snapshots SET last_updated = ?, metadata = ? WHERE id = ?",
+                (metadata.get('last_updated'), json.dumps(metadata, ensure_ascii=False), snapshot_id))
+            for position, sheet in enumerate(inventory_data.get('sheets', [])):
+                connection.execute(
+                    "UPDATE sheets SET info = ? WHERE snapshot_id = ? AND position = ?",
+                    (self._sheet_info(sheet), snapshot_id, position))
+                existing = dict(connection.execute(
+                    "SELECT row_num, data FROM products WHERE snapshot_id = ? AND sheet_name = ?",
+                    (snapshot_id, sheet.get('sheet_name'))))
+                connection.executemany(
+                    "UPDATE products SET data = ? WHERE snapshot_id = ? AND sheet_name = ? AND row_num = ?",
+                    [(data, snapshot_id, sheet_name, row_num)
+                     for _, sheet_name, row_num, _, _, data in self._product_rows(snapshot_id, sheet)
+                     if existing.get(row_num) != data])
+            self._bump_version(connection)
+        return snapshot_id
+
+    def current_snapshot(self):
+        """Thông tin snapshot mới nhất (None nếu database chưa có dữ liệu)"""
+        with closing(self.connect()) as connection:
+            row = connection.execute(
+                "SELECT id, date_ton_kho, source_file, last_updated, total_sheets, total_products, created_at "
+                "FROM snapshots ORDER BY id DESC LIMIT 1").fetchone()
+        if row is None:
+            return None
+        keys = ('id', 'date_ton_kho', 'source_file', 'last_updated', 'total_sheets', 'total_products', 'created_at')
+        return dict(zip(keys, row))
+
+    def list_snapshots(self):
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                "SELECT id, date_ton_kho, source_file, total_products, created_at FROM snapshots ORDER BY id").fetchall()
+        return [dict(zip(('id', 'date_ton_kho', 'source_file', 'total_products', 'created_at'), row)) for row in rows]
+
+    def load_inventory(self):
+        """
+        Dựng lại inventory_data (dạng products, giống inventory_data.json) từ snapshot mới nhất
+        FileNotFoundError nếu database chưa có dữ liệu (giống khi chưa có file JSON)
+        """
+        with closing(self.connect()) as connection:
+            # Đọc trong 1 transaction để không lẫn dữ liệu của lần ghi đang diễn ra
+            connection.execute("BEGIN")
+            try:
+                row = connection.execute("SELECT id, metadata FROM snapshots ORDER BY id DESC LIMIT 1").fetchone()
+                if row is None:
+                    raise FileNotFoundError(self.db_path)
+                snapshot_id, metadata = row
+                sheets = []
+                for sheet_name, info in connection.execute(
+                        "SELECT sheet_name, info FROM sheets WHERE snapshot_id = ? ORDER BY position", (snapshot_id,)):
+                    info = json.loads(info)
+                    products = [json.loads(data) for (data,) in connection.execute(
+                        "SELECT data FROM products WHERE snapshot_id = ? AND sheet_name = ? ORDER BY row_num",
+                        (snapshot_id, sheet_name))]
+                    sheets.append({'sheet_name': info.pop('sheet_name', sheet_name), 'products': products, **info})
+            finally:
+                connection.execute("COMMIT")
+        return {'metadata': json.loads(metadata), 'sheets': sheets}
+
+    def export_json(self, output_file='inventory_data.json', compact=False, split=None):
+        """Xuất snapshot mới nhất ra inventory_data.json (cùng định dạng như khi chuyển đổi)"""
+        inventory_data = self.load_inventory()
+        with file_store.file_lock(output_file):
+            file_store.write_inventory(output_file, inventory_data, compact=compact, split=split)
+        return inventory_data
+
+    def find_products(self, params):
+        """
+        Tìm sản phẩm theo index: sheet, code (Mã), lot - so khớp chính xác
+        Phân trang bằng limit / offset như /query
+        """
+        limit = min(_int_param(params, 'limit', DEFAULT_LIMIT), MAX_LIMIT)
+        offset = _int_param(params, 'offset', 0)
+        if limit < 0 or offset < 0:
+            raise ValueError('limit / offset phải >= 0')
+
+        current = self.current_snapshot()
+        if current is None:
+            raise FileNotFoundError(self.db_path)
+        conditions = ["snapshot_id = ?"]
+        values = [current['id']]
+        if params.get('sheet'):
+            conditions.append("sheet_name = ?")
+            values.append(params['sheet'])
+        for name, column in (('code', 'code'), ('lot', 'lot')):
+            if params.get(name):
+                conditions.append(f"{column} = ?")
+                values.append(normalize_key(params[name]))
+        where = " AND ".join(conditions)
+
+        with closing(self.connect()) as connection:
+            total = connection.execute(f"SELECT COUNT(*) FROM products WHERE {where}", values).fetchone()[0]
+            rows = connection.execute(
+                f"SELECT sheet_name, row_num, data FROM products WHERE {where} "
+                f"ORDER BY sheet_name, row_num LIMIT ? OFFSET ?", values + [limit, offset]).fetchall()
+        return {
+            'snapshot': current,
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'items': [{'sheet_name': sheet_name, 'row': row_num, 'product': json.loads(data)}
+                      for sheet_name, row_num, data in rows]
+        }
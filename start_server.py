@@ -8,19 +8,324 @@ import webbrowser
 import os
 import json
 import io
-from urllib.parse import urlparse
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
 from email import message_from_bytes
 from email.parser import BytesParser
+from email.utils import formatdate, parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# Import một lần khi khởi động (nạp sẵn pandas/openpyxl) thay vì chạy python convert_to_json.py mỗi request
+import convert_to_json
+from conversion_cache import ConversionCache, hash_file
+from multipart_stream import parse_multipart
+import file_store
+import inventory_index
+import history_store
+import sqlite_store
+import conversion_metrics
 
 PORT = 8000
+# File upload đang nhận (*.part) được ghi vào đây rồi mới đổi tên ra thư mục chính
+UPLOAD_DIR = '.uploads'
+
+# Cache kết quả chuyển đổi theo nội dung file (upload lại cùng file -> trả kết quả ngay)
+conversion_cache = ConversionCache()
+
+# Worker chạy chuyển đổi trong cùng process (1 worker -> các lần chuyển đổi không chồng lên nhau)
+conversion_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='conversion')
+
+def run_conversion(func, *args, **kwargs):
+    """
+    Chạy hàm chuyển đổi trên worker và chờ kết quả
+    Lỗi được ném lại nguyên vẹn (ConversionError hoặc lỗi gốc) để handler trả về dạng JSON
+    """
+    return conversion_executor.submit(func, *args, **kwargs).result()
+
+# Phiên bản database đã được xuất ra inventory_data.json (khi chạy với --db)
+exported_db_version = {}
+
+def export_inventory(db_path, compact=False, output_file='inventory_data.json', split=None):
+    """
+    Xuất inventory_data.json từ database nếu database đã thay đổi kể từ lần xuất trước
+    Chạy trên worker chuyển đổi để không chồng lên lần ghi database đang diễn ra
+    """
+    db = sqlite_store.InventoryDB(db_path)
+    version = db.version()
+    if exported_db_version.get(output_file) == version and os.path.exists(output_file):
+        return
+    try:
+        db.export_json(output_file, compact=compact, split=split)
+    except FileNotFoundError:
+        # Database chưa có dữ liệu: giữ nguyên file JSON đang có (nếu có)
+        exported_db_version[output_file] = version
+        return
+    exported_db_version[output_file] = version
+    print(f"✓ Đã xuất {output_file} từ {db_path} (phiên bản {version})")
+
+def ensure_export(db_path, compact=False, output_file='inventory_data.json', split=None):
+    """Gọi từ request: chỉ đẩy việc xuất sang worker khi database mới hơn file JSON"""
+    if not db_path:
+        return
+    if exported_db_version.get(output_file) == sqlite_store.InventoryDB(db_path).version():
+        return
+    run_conversion(export_inventory, db_path, compact, output_file, split)
+
+def refresh_indexes(db_path=None, compact=False, split=None):
+    """Dựng sẵn index truy vấn / hạn sử dụng ngay sau khi chuyển đổi (chạy nền trên worker chuyển đổi)"""
+    def build():
+        try:
+            if db_path:
+                export_inventory(db_path, compact, split=split)
+            inventory_index.load_index()
+        except Exception as e:
+            print(f"⚠ Không dựng được index: {e}")
+    conversion_executor.submit(build)
+
+def error_payload(error):
+    """Tạo nội dung JSON cho lỗi, giữ thông tin có cấu trúc nếu là ConversionError"""
+    if isinstance(error, convert_to_json.ConversionError):
+        payload = error.to_dict()
+    else:
+        payload = {'error_type': type(error).__name__, 'message': str(error)}
+    payload['status'] = 'error'
+    return payload
+
+def choose_encoding(accept_encoding, path):
+    """
+    Chọn bản nén sẵn nhỏ nhất mà client chấp nhận
+    Returns: (encoding, đường dẫn file) - encoding là None nếu gửi file gốc
+    """
+    accepted = file_store.accepted_encodings(accept_encoding)
+    candidates = []
+    for encoding, variant_path in file_store.compressed_variants(path).items():
+        if encoding in accepted or '*' in accepted:
+            try:
+                candidates.append((os.path.getsize(variant_path), encoding, variant_path))
+            except OSError:
+                pass
+    if not candidates:
+        return None, path
+    _, encoding, variant_path = min(candidates)
+    return encoding, variant_path
+
+# ETag theo nội dung file: path -> (inode, mtime, size, hash), chỉ hash lại khi file thay đổi
+etag_cache = {}
+
+def file_etag(path):
+    """ETag (hash nội dung) của file, dùng lại kết quả cũ nếu file chưa đổi"""
+    stat = os.stat(path)
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = etag_cache.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    etag = hash_file(path)[:20]
+    etag_cache[path] = (signature, etag)
+    return etag
+
+def etag_matches(if_none_match, etag):
+    """Kiểm tra header If-None-Match có chứa etag không (so sánh yếu, bỏ qua W/)"""
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+def not_modified_since(if_modified_since, mtime):
+    """True nếu file không đổi kể từ thời điểm If-Modified-Since"""
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since is None:
+        return False
+    return int(mtime) <= since.timestamp()
 
 class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def end_headers(self):
+    # HTTP/1.1 keep-alive: trình duyệt dùng lại kết nối cho các request tiếp theo
+    protocol_version = 'HTTP/1.1'
+    # Đóng kết nối keep-alive rảnh quá lâu để không giữ thread
+    timeout = 5
+    # Lưu inventory_data.json dạng cột gọn + bản nén (bật bằng --compact)
+    compact_output = False
+    # Ghi thêm manifest + 1 file mỗi sheet trong inventory_data/ (bật bằng --split; None -> giữ như đang có)
+    split_output = None
+    # Database SQLite (--db): dữ liệu và thời hạn lưu trong database, inventory_data.json chỉ là bản xuất
+    db_path = None
+    # Đo đỉnh bộ nhớ từng bước chuyển đổi bằng tracemalloc (bật bằng --trace-memory)
+    trace_memory = False
+    
+    def send_json(self, status_code, payload):
+        """Gửi response JSON kèm Content-Length (bắt buộc với keep-alive)"""
+        body = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status_code >= 400:
+            # Request lỗi có thể chưa được đọc hết body -> không dùng lại kết nối
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def end_headers(self, cache_control='no-store, no-cache, must-revalidate'):
         # Thêm CORS headers để tránh lỗi khi load JSON
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
+        self.send_header('Cache-Control', cache_control)
         super().end_headers()
     
+    def do_GET(self):
+        parsed_path = urlparse(self.path)
+        if parsed_path.path == '/query':
+            self.handle_query(parsed_path.query)
+        elif parsed_path.path == '/expiring':
+            self.handle_query(parsed_path.query, inventory_index.query_expiring)
+        elif parsed_path.path == '/history':
+            self.send_json(200, {'status': 'success', 'snapshots': history_store.HistoryStore().list_snapshots()})
+        elif parsed_path.path == '/history/diff':
+            self.handle_history_diff(parsed_path.query)
+        elif parsed_path.path == '/metrics':
+            self.handle_metrics(parsed_path.query)
+        elif parsed_path.path == '/products' and self.db_path:
+            self.handle_query(parsed_path.query, sqlite_store.InventoryDB.find_products,
+                              index=sqlite_store.InventoryDB(self.db_path))
+        else:
+            super().do_GET()
+    
+    def handle_query(self, query_string, query_func=inventory_index.query_inventory, index=None):
+        """
+        Truy vấn trên index dựng sẵn (tìm sản phẩm theo trang, hoặc LOT sắp hết hạn)
+        index: nguồn dữ liệu khác cho query_func (ví dụ database), mặc định là index của inventory_data.json
+        """
+        params = {name: values[-1] for name, values in parse_qs(query_string).items()}
+        try:
+            if index is None:
+                ensure_export(self.db_path, self.compact_output, split=self.split_output)
+                index = inventory_index.load_index()
+            result = query_func(index, params)
+        except FileNotFoundError:
+            self.send_json(404, {'status': 'error', 'message': 'Chưa có dữ liệu tồn kho'})
+            return
+        except KeyError as e:
+            self.send_json(404, {'status': 'error', 'message': f"Không tìm thấy sheet {e.args[0]}"})
+            return
+        except ValueError as e:
+            self.send_json(400, {'status': 'error', 'message': str(e)})
+            return
+        except Exception as e:
+            print(f"❌ Lỗi khi truy vấn: {e}")
+            self.send_json(500, error_payload(e))
+            return
+        
+        result['status'] = 'success'
+        self.send_json(200, result)
+    
+    def handle_history_diff(self, query_string):
+        """So sánh 2 snapshot: /history/diff?from=22/12/2025&to=23/12/2025[&sheet=...][&rows=0]"""
+        params = {name: values[-1] for name, values in parse_qs(query_string).items()}
+        if not params.get('from') or not params.get('to'):
+            self.send_json(400, {'status': 'error', 'message': 'Thiếu tham số from / to'})
+            return
+        try:
+            result = history_store.HistoryStore().diff(
+                params['from'], params['to'],
+                sheet_name=params.get('sheet') or None,
+                include_rows=params.get('rows', '1').lower() not in ('0', 'false', 'no')
+            )
+        except KeyError as e:
+            self.send_json(404, {'status': 'error', 'message': f"Không tìm thấy snapshot / sheet {e.args[0]}"})
+            return
+        except ValueError as e:
+            self.send_json(400, {'status': 'error', 'message': str(e)})
+            return
+        except Exception as e:
+            print(f"❌ Lỗi khi so sánh lịch sử: {e}")
+            self.send_json(500, error_payload(e))
+            return
+        
+        result['status'] = 'success'
+        self.send_json(200, result)
+    
+    def handle_metrics(self, query_string):
+        """Phân vị thời gian từng bước trên các lần chuyển đổi gần đây: /metrics[?limit=100][&recent=5]"""
+        params = {name: values[-1] for name, values in parse_qs(query_string).items()}
+        try:
+            limit = int(params.get('limit', 100))
+            recent = int(params.get('recent', 5))
+            if limit < 1 or recent < 0:
+                raise ValueError
+        except ValueError:
+            self.send_json(400, {'status': 'error', 'message': 'limit / recent phải là số nguyên dương'})
+            return
+        records = conversion_metrics.load_recent_metrics(limit=limit)
+        result = conversion_metrics.summarize_metrics(records)
+        result['recent'] = records[-recent:][::-1] if recent else []
+        result['status'] = 'success'
+        self.send_json(200, result)
+    
+    def send_head(self):
+        path = urlparse(self.path).path
+        if path == '/inventory_data.json' or path.startswith('/inventory_data/'):
+            ensure_export(self.db_path, self.compact_output, split=self.split_output)
+            return self.send_inventory_head(path)
+        return super().send_head()
+    
+    def send_inventory_head(self, url_path='/inventory_data.json'):
+        """
+        Gửi header cho inventory_data.json (hoặc manifest / file sheet trong inventory_data/),
+        dùng bản .br/.gz nén sẵn nếu client chấp nhận
+        Có ETag (hash nội dung) + Last-Modified: trình duyệt hỏi lại bằng If-None-Match /
+        If-Modified-Since và nhận 304 không kèm dữ liệu nếu file chưa đổi
+        """
+        path = self.translate_path(url_path)
+        try:
+            mtime = os.stat(path).st_mtime
+            base_etag = file_etag(path)
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+        
+        encoding, file_path = choose_encoding(self.headers.get('Accept-Encoding'), path)
+        # Mỗi encoding là một bản khác nhau -> ETag riêng
+        etag = f'"{base_etag}-{encoding}"' if encoding else f'"{base_etag}"'
+        
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            not_modified = etag_matches(if_none_match, etag)
+        else:
+            not_modified = not_modified_since(self.headers.get('If-Modified-Since'), mtime)
+        
+        if not_modified:
+            self.send_response(304)
+            self.send_validator_headers(etag, mtime)
+            self.end_headers(cache_control='no-cache')
+            return None
+        
+        try:
+            f = open(file_path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_validator_headers(etag, mtime)
+        self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+        # no-cache: được lưu cache nhưng phải hỏi lại server (304) trước khi dùng
+        self.end_headers(cache_control='no-cache')
+        return f
+    
+    def send_validator_headers(self, etag, mtime):
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(mtime, usegmt=True))
+        self.send_header('Vary', 'Accept-Encoding')
+    
     def do_POST(self):
         """Xử lý POST request để lưu thời hạn sử dụng hoặc upload file"""
         parsed_path = urlparse(self.path)
@@ -29,87 +334,67 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             # Xử lý upload file Excel  
             try:
                 content_type = self.headers.get('Content-Type', '')
-                
-                if 'multipart/form-data' not in content_type:
-                    raise ValueError('Invalid content type')
-                
-                # Đọc toàn bộ dữ liệu
                 content_length = int(self.headers['Content-Length'])
-                post_data = self.rfile.read(content_length)
                 
-                # Lấy boundary
-                boundary = content_type.split('boundary=')[1]
-                boundary_bytes = ('--' + boundary).encode()
-                
-                # Tìm file data
-                parts = post_data.split(boundary_bytes)
-                
-                file_data = None
-                file_name = None
-                
-                for part in parts:
-                    if b'filename=' in part and b'Content-Type:' in part:
-                        # Tìm tên file
-                        filename_match = part.find(b'filename="')
-                        if filename_match != -1:
-                            start = filename_match + 10
-                            end = part.find(b'"', start)
-                            file_name = part[start:end].decode('utf-8')
-                        
-                        # Tìm dữ liệu file (sau 2 CRLF)
-                        data_start = part.find(b'\r\n\r\n')
-                        if data_start != -1:
-                            file_data = part[data_start + 4:]
-                            # Loại bỏ trailing CRLF
-                            if file_data.endswith(b'\r\n'):
-                                file_data = file_data[:-2]
-                            break
-                
-                if not file_data or not file_name:
+                # Đọc request theo từng chunk, file được ghi thẳng xuống UPLOAD_DIR (không nằm lẫn trong repo)
+                os.makedirs(UPLOAD_DIR, exist_ok=True)
+                fields, files = parse_multipart(self.rfile, content_type, content_length,
+                                                upload_dir=UPLOAD_DIR, max_files=1)
+                uploaded = next(iter(files.values()), None)
+                
+                if uploaded is None or uploaded.size == 0 or not uploaded.filename:
+                    if uploaded is not None:
+                        uploaded.discard()
                     raise ValueError('No file found in request')
                 
-                # Lưu file với tên mới để tránh conflict
-                import time
-                timestamp = int(time.time())
-                base_name, ext = os.path.splitext(file_name)
-                new_file_name = f"{base_name}_{timestamp}{ext}"
-                file_path = os.path.join(os.getcwd(), new_file_name)
-                
-                with open(file_path, 'wb') as f:
-                    f.write(file_data)
-                
-                # Chạy conversion
-                import subprocess
-                result = subprocess.run(
-                    ['python', 'convert_to_json.py'],
-                    capture_output=True,
-                    timeout=60,
-                    cwd=os.getcwd(),
-                    text=True
-                )
-                
-                if result.returncode == 0:
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'status': 'success',
-                        'message': 'File đã được xử lý thành công'
-                    }).encode())
+                # Cùng nội dung file + cùng cấu hình -> dùng lại kết quả đã chuyển đổi
+                if self.db_path:
+                    config = sqlite_store.InventoryDB(self.db_path).load_product_config()
+                    cache_key = conversion_cache.make_key(uploaded.sha256, config=config)
                 else:
-                    raise Exception(result.stderr or result.stdout or 'Conversion failed')
+                    cache_key = conversion_cache.make_key(uploaded.sha256)
+                inventory_data = run_conversion(convert_to_json.load_cached_conversion,
+                                                conversion_cache, cache_key,
+                                                output_file=self.output_file,
+                                                compact=self.compact_output,
+                                                excel_file=uploaded.filename,
+                                                db_path=self.db_path,
+                                                split=self.split_output)
+                cached = inventory_data is not None
+                
+                if cached:
+                    uploaded.discard()
+                else:
+                    # Lưu file với tên mới để tránh conflict
+                    import time
+                    timestamp = int(time.time())
+                    base_name, ext = os.path.splitext(uploaded.filename)
+                    new_file_name = f"{base_name}_{timestamp}{ext}"
+                    uploaded.save_as(os.path.join(os.getcwd(), new_file_name))
+                    
+                    # Chạy conversion trong cùng process
+                    # Lịch sử / metadata ghi tên file gốc như khi dùng cache, không phải tên có timestamp
+                    inventory_data = run_conversion(convert_to_json.convert_excel_to_json, excel_file=new_file_name,
+                                                    source_name=uploaded.filename,
+                                                    output_file=self.output_file,
+                                                    compact=self.compact_output,
+                                                    db_path=self.db_path,
+                                                    trace_memory=self.trace_memory,
+                                                    split=self.split_output)
+                    conversion_cache.put(cache_key, inventory_data)
+                refresh_indexes(self.db_path, self.compact_output, self.split_output)
+                
+                self.send_json(200, {
+                    'status': 'success',
+                    'message': 'File đã được xử lý thành công',
+                    'cached': cached
+                })
                     
             except Exception as e:
                 print(f"ERROR in upload: {e}")
                 import traceback
                 traceback.print_exc()
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'status': 'error',
-                    'message': str(e)
-                }).encode())
+                self.send_json(500, error_payload(e))
         
         elif parsed_path.path == '/save_shelf_life':
             # Đọc dữ liệu từ request
@@ -127,107 +412,193 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 # Tạo unique key: LUÔN dùng format product_code_lot_number
                 unique_key = f"{product_code}_{lot_number}"
                 
-                # Load config
-                try:
-                    with open('product_config.json', 'r', encoding='utf-8') as f:
-                        config = json.load(f)
-                except:
-                    config = {
-                        "shelf_life_months": {
-                            "BAKING SODA": 36,
-                            "AZARINE": 36,
-                            "PIN FUJITSU": {}
-                        },
-                        "product_specific_shelf_life": {}
-                    }
-                
-                # Lưu thời hạn cho sản phẩm với unique key
-                config['product_specific_shelf_life'][unique_key] = shelf_life_months
-                
-                # Ghi vào file
-                with open('product_config.json', 'w', encoding='utf-8') as f:
-                    json.dump(config, f, ensure_ascii=False, indent=2)
+                # Lưu thời hạn cho sản phẩm với unique key (có khóa + WAL, ghi nguyên tử)
+                self.update_shelf_life([(unique_key, shelf_life_months)])
                 
                 print(f"✓ Đã lưu {unique_key} = {shelf_life_months} tháng")
                 
                 # Trả về response ngay lập tức (không chạy conversion)
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
+                self.send_json(200, {
                     'status': 'success',
                     'message': 'Đã lưu thời hạn thành công'
-                }).encode())
+                })
             except Exception as e:
                 print(f"❌ Lỗi khi lưu thời hạn: {e}")
                 import traceback
                 traceback.print_exc()
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
+                self.send_json(500, {
                     'status': 'error',
                     'message': str(e)
-                }).encode())
+                })
         
+        elif parsed_path.path == '/save_shelf_life_batch':
+            # Lưu nhiều thời hạn trong 1 request: 1 lần ghi cấu hình + 1 lần tính lại
+            try:
+                content_length = int(self.headers['Content-Length'])
+                data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+                items = data.get('updates') if isinstance(data, dict) else data
+                
+                try:
+                    updates = file_store.shelf_life_updates(items)
+                except (ValueError, TypeError, AttributeError) as e:
+                    self.send_json(400, {'status': 'error', 'message': str(e)})
+                    return
+                
+                print(f"📝 Nhận {len(updates)} thời hạn cần lưu")
+                self.update_shelf_life(updates)
+                run_conversion(convert_to_json.recalculate_shelf_life,
+                               data_file=self.output_file, db_path=self.db_path)
+                refresh_indexes(self.db_path, self.compact_output, self.split_output)
+                
+                self.send_json(200, {
+                    'status': 'success',
+                    'message': f'Đã lưu {len(updates)} thời hạn thành công',
+                    'saved': len(updates)
+                })
+            except Exception as e:
+                print(f"❌ Lỗi khi lưu thời hạn: {e}")
+                import traceback
+                traceback.print_exc()
+                self.send_json(500, error_payload(e))
+                
         elif parsed_path.path == '/recalculate':
-            # Tính lại phần trăm còn lại
-            import subprocess
+            # Tính lại phần trăm còn lại từ JSON hiện có (không đọc lại Excel)
             try:
-                result = subprocess.run(['python', 'convert_to_json.py'], 
-                             capture_output=True, 
-                             timeout=60,
-                             cwd=os.getcwd(),
-                             text=True)
-                
-                if result.returncode == 0:
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'status': 'success',
-                        'message': 'Đã tính lại thành công'
-                    }).encode())
-                else:
-                    raise Exception(result.stderr or 'Conversion failed')
+                run_conversion(convert_to_json.recalculate_shelf_life,
+                               data_file=self.output_file, db_path=self.db_path)
+                refresh_indexes(self.db_path, self.compact_output, self.split_output)
+                
+                self.send_json(200, {
+                    'status': 'success',
+                    'message': 'Đã tính lại thành công'
+                })
             except Exception as e:
                 print(f"Lỗi khi tính lại: {e}")
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'status': 'error',
-                    'message': str(e)
-                }).encode())
+                self.send_json(500, error_payload(e))
         else:
             self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.send_header('Connection', 'close')
+            self.close_connection = True
             self.end_headers()
     
+    @property
+    def output_file(self):
+        """File JSON ghi ra khi chuyển đổi; None khi dùng database (file được xuất lại khi có request)"""
+        return None if self.db_path else 'inventory_data.json'
+    
+    def update_shelf_life(self, updates):
+        """Lưu thời hạn riêng vào database hoặc product_config.json"""
+        if self.db_path:
+            sqlite_store.InventoryDB(self.db_path).update_product_shelf_life(updates)
+        else:
+            file_store.update_product_shelf_life(updates)
+    
     def do_OPTIONS(self):
         """Xử lý OPTIONS request cho CORS"""
         self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
-# Đổi thư mục làm việc
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+class ThreadedHTTPServer(http.server.ThreadingHTTPServer):
+    """
+    HTTP server xử lý mỗi kết nối trên 1 thread riêng: kết nối keep-alive đang rảnh không chặn người khác
+    Số kết nối xử lý cùng lúc có giới hạn (max_connections): kết nối vượt quá bị trả 503 và đóng ngay,
+    không tạo thêm thread
+    File tĩnh, inventory_data.json và các API chạy song song; riêng việc chuyển đổi
+    vẫn đi qua conversion_executor (1 worker) nên không bao giờ ghi đè lên nhau
+    """
+    daemon_threads = True
+    REJECT_RESPONSE = (b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\n"
+                       b"Content-Length: 0\r\nConnection: close\r\n\r\n")
 
-Handler = MyHTTPRequestHandler
+    def __init__(self, server_address, handler_class, max_connections=32):
+        self.connection_slots = threading.BoundedSemaphore(max_connections)
+        super().__init__(server_address, handler_class)
 
-print(f"🚀 Đang khởi động server...")
-print(f"📂 Thư mục: {os.getcwd()}")
-print(f"🌐 Địa chỉ: http://localhost:{PORT}")
-print(f"\n✓ Server đã sẵn sàng!")
-print(f"👉 Mở trình duyệt và truy cập: http://localhost:{PORT}")
-print(f"\n⚠️  Nhấn Ctrl+C để dừng server\n")
+    def process_request(self, request, client_address):
+        if not self.connection_slots.acquire(blocking=False):
+            self.reject_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except BaseException:
+            self.connection_slots.release()
+            raise
 
-# Tự động mở trình duyệt
-webbrowser.open(f'http://localhost:{PORT}')
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.connection_slots.release()
 
-with socketserver.TCPServer(("", PORT), Handler) as httpd:
-    try:
-        httpd.serve_forever()
-    except KeyboardInterrupt:
-        print("\n\n✓ Đã dừng server!")
+    def reject_request(self, request):
+        """Đã đủ kết nối: trả 503 trên luồng chính (không đọc request) rồi đóng"""
+        try:
+            request.settimeout(1)
+            request.sendall(self.REJECT_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server quản lý tồn kho")
+    parser.add_argument('--workers', type=int, default=32,
+                        help="Số kết nối được xử lý cùng lúc, kết nối vượt quá nhận 503 (mặc định: 32)")
+    parser.add_argument('--single-thread', action='store_true',
+                        help="Chạy server đơn luồng như cũ (xử lý từng request một)")
+    parser.add_argument('--compact', action='store_true',
+                        help="Lưu inventory_data.json dạng cột gọn kèm bản nén .gz/.br")
+    parser.add_argument('--split', action='store_true',
+                        help="Ghi thêm manifest + 1 file mỗi sheet (inventory_data/) để website chỉ tải sheet đang xem")
+    parser.add_argument('--db', nargs='?', const=sqlite_store.DB_FILE, default=None,
+                        help=f"Lưu dữ liệu trong database SQLite (mặc định {sqlite_store.DB_FILE}), "
+                             "inventory_data.json được xuất ra khi có request")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Đo đỉnh bộ nhớ từng bước chuyển đổi bằng tracemalloc (chậm hơn nhiều lần)")
+    args = parser.parse_args()
+    
+    # Đổi thư mục làm việc
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    
+    Handler = MyHTTPRequestHandler
+    Handler.compact_output = args.compact
+    Handler.split_output = args.split or None
+    if args.split and not args.db and os.path.exists('inventory_data.json') \
+            and not file_store.has_partitions('inventory_data.json'):
+        # Dữ liệu có từ trước khi bật --split: tách ngay, không chờ lần chuyển đổi sau
+        inventory_data, compact = file_store.read_inventory('inventory_data.json')
+        file_store.write_partitions('inventory_data.json', inventory_data, compact=compact)
+    Handler.db_path = args.db
+    Handler.trace_memory = args.trace_memory
+    # File upload dở dang còn lại khi server bị dừng giữa chừng
+    if os.path.isdir(UPLOAD_DIR):
+        for name in os.listdir(UPLOAD_DIR):
+            if name.endswith('.part'):
+                os.remove(os.path.join(UPLOAD_DIR, name))
+    
+    print(f"🚀 Đang khởi động server...")
+    print(f"📂 Thư mục: {os.getcwd()}")
+    print(f"🌐 Địa chỉ: http://localhost:{PORT}")
+    if args.single_thread:
+        print(f"🧵 Chế độ: đơn luồng")
+        # Như cũ: HTTP/1.0, đóng kết nối sau mỗi response (kết nối keep-alive rảnh sẽ chặn mọi request khác)
+        Handler.protocol_version = 'HTTP/1.0'
+        httpd = socketserver.TCPServer(("", PORT), Handler)
+    else:
+        print(f"🧵 Chế độ: song song (tối đa {args.workers} kết nối, HTTP/1.1 keep-alive)")
+        httpd = ThreadedHTTPServer(("", PORT), Handler, max_connections=args.workers)
+    print(f"\n✓ Server đã sẵn sàng!")
+    print(f"👉 Mở trình duyệt và truy cập: http://localhost:{PORT}")
+    print(f"\n⚠️  Nhấn Ctrl+C để dừng server\n")
+    
+    # Tự động mở trình duyệt
+    webbrowser.open(f'http://localhost:{PORT}')
+    
+    with httpd:
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\n\n✓ Đã dừng server!")
@@ -0,0 +1,324 @@
+"""
+Engine chuyển đổi Excel -> JSON theo luồng cho workbook rất lớn (bộ nhớ không tăng theo số dòng)
+- Mỗi sheet được đọc 1 lần bằng openpyxl read-only: dòng thô được ghi tạm ra đĩa theo từng lô,
+  kiểu từng cột được suy ra dần (light_convert.ColumnTyper) nên không giữ cả sheet trong bộ nhớ
+- Dò cột, lọc dòng, tạo sản phẩm và tính hạn sử dụng chạy theo từng lô dòng (generator);
+  sản phẩm của mỗi sheet được ghi tạm ra đĩa rồi ghi dần ra JSON (file_store.iter_json), database, lịch sử
+- Cho ra cùng inventory_data.json với light_convert / convert_to_json, đổi lại phải đọc lại file tạm vài lần
+File .xls vẫn được đọc cả sheet bằng pandas (tối đa 65536 dòng) rồi xử lý tiếp theo luồng
+"""
+
+import pickle
+import sys
+import tempfile
+import time
+from itertools import islice
+
+from openpyxl import load_workbook
+
+import conversion_metrics
+import convert_core
+import history_store
+import light_convert
+from convert_core import (
+    LAYOUT_CACHE_FILE, PROFILE_SAMPLE_SIZE, HEADER_SCAN_ROWS, ColumnProfile,
+    merge_header_rows, find_product_column, name_unlabeled_columns, build_layout
+)
+from light_convert import (
+    OPENPYXL_EXTENSIONS, ColumnTyper, SheetGrid, convert_cell, keep_row, is_whole_days,
+    build_product_records, calculate_remaining_percentages, format_dates
+)
+
+# Module này là engine cho quy trình dùng chung của convert_core
+ENGINE = sys.modules[__name__]
+
+# Số dòng mỗi lô khi ghi tạm dòng thô và khi tạo sản phẩm
+CHUNK_ROWS = 2000
+
+class SpillFile:
+    """
+    Danh sách chỉ thêm vào cuối, lưu tạm ra đĩa theo từng lô (pickle) và duyệt lại được nhiều lần
+    File tạm tự xóa khi đối tượng bị hủy
+    """
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        # (vị trí trong file, số phần tử) của từng lô
+        self.chunks = []
+        self.length = 0
+
+    def extend(self, items):
+        """Thêm 1 lô phần tử vào cuối"""
+        if not items:
+            return
+        self.file.seek(0, 2)
+        self.chunks.append((self.file.tell(), len(items)))
+        pickle.dump(items, self.file, pickle.HIGHEST_PROTOCOL)
+        self.length += len(items)
+
+    def iter_chunks(self, start=0):
+        """Các lô phần tử từ vị trí start (lô nằm hẳn trước start không được đọc lại)"""
+        skipped = 0
+        for offset, count in self.chunks:
+            if skipped + count > start:
+                # Đọc theo vị trí của lô nên nhiều vòng duyệt xen kẽ nhau vẫn đúng
+                self.file.seek(offset)
+                items = pickle.load(self.file)
+                yield items[start - skipped:] if start > skipped else items
+            skipped += count
+
+    def __iter__(self):
+        for items in self.iter_chunks():
+            yield from items
+
+    def __len__(self):
+        return self.length
+
+class StreamSheet:
+    """
+    Sheet đọc theo luồng (thay cho lưới thô SheetGrid): dòng thô nằm trong file tạm,
+    kiểu từng cột đã được suy ra từ cả sheet; rows() đọc lại từng dòng đã có kiểu (ô trống là None)
+    """
+    def __init__(self, raw_rows, kinds, converters, height):
+        self.raw_rows = raw_rows
+        self.kinds = kinds
+        # Hàm đổi ô thô của từng cột, None nếu dòng đã có kiểu sẵn (file .xls đọc bằng pandas)
+        self.converters = converters
+        self.shape = (height, len(kinds))
+        self.head_grid = None
+        self.head_rows = 0
+        # Thống kê các dòng được giữ, theo (dòng bắt đầu dữ liệu, vị trí cột tên sản phẩm)
+        self.kept = {}
+
+    @classmethod
+    def from_worksheet(cls, worksheet, chunk_rows=CHUNK_ROWS):
+        """
+        Đọc sheet openpyxl như light_convert.read_sheet_rows (bỏ ô trống cuối dòng, dòng trống cuối sheet)
+        nhưng chỉ giữ trong bộ nhớ 1 lô dòng
+        """
+        raw_rows = SpillFile()
+        typers = []
+        chunk = []
+        blank_rows = 0
+
+        def flush():
+            # Cột mới xuất hiện: các dòng trước đó là ô trống
+            for _ in range(len(typers), max(len(values) for values in chunk)):
+                typer = ColumnTyper()
+                typer.update_empty(len(raw_rows))
+                typers.append(typer)
+            for i, typer in enumerate(typers):
+                typer.update([values[i] if i < len(values) else '' for values in chunk])
+            raw_rows.extend(chunk)
+            chunk.clear()
+
+        for row in worksheet.rows:
+            values = [convert_cell(cell) for cell in row]
+            while values and values[-1] == '':
+                values.pop()
+            if not values:
+                # Dòng trống chỉ được giữ nếu sau nó còn dòng có dữ liệu
+                blank_rows += 1
+                continue
+            for _ in range(blank_rows):
+                chunk.append([])
+                if len(chunk) >= chunk_rows:
+                    flush()
+            blank_rows = 0
+            chunk.append(values)
+            if len(chunk) >= chunk_rows:
+                flush()
+        if chunk:
+            flush()
+
+        for typer in typers:
+            typer.finish()
+        return cls(raw_rows, [typer.kind for typer in typers], [typer.convert for typer in typers],
+                   len(raw_rows))
+
+    @classmethod
+    def from_grid(cls, grid, chunk_rows=CHUNK_ROWS):
+        """Sheet từ lưới thô đã đọc cả sheet (file .xls)"""
+        raw_rows = SpillFile()
+        for start in range(0, len(grid), chunk_rows):
+            raw_rows.extend([grid.cells(i) for i in range(start, min(start + chunk_rows, len(grid)))])
+        return cls(raw_rows, grid.kinds, None, len(grid))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def rows(self, start=0):
+        """Các dòng từ dòng start, đủ số cột, giá trị đã có kiểu"""
+        if self.converters is None:
+            for chunk in self.raw_rows.iter_chunks(start):
+                yield from chunk
+            return
+        converters = self.converters
+        width = self.shape[1]
+        empty = [convert('') for convert in converters]
+        for chunk in self.raw_rows.iter_chunks(start):
+            for values in chunk:
+                row = [convert(value) for convert, value in zip(converters, values)]
+                if len(values) < width:
+                    row.extend(empty[len(values):])
+                yield row
+
+    def head(self, count):
+        """Lưới thô (SheetGrid) của count dòng đầu; len() của lưới vẫn là số dòng cả sheet"""
+        if self.head_grid is None or self.head_rows < count:
+            rows = list(islice(self.rows(), count))
+            columns = [list(values) for values in zip(*rows)] if rows else [[] for _ in self.kinds]
+            self.head_grid = SheetGrid(columns, self.kinds, self.shape[0])
+            self.head_rows = count
+        return self.head_grid
+
+    def kept_columns(self, start, product_position):
+        """
+        Thống kê các cột trên các dòng được giữ (filter_rows) từ dòng start, xem profile_rows
+        Chỉ giữ kết quả gần nhất: dò bố cục và lấy dữ liệu ngay sau đó dùng chung 1 lần đọc
+        """
+        key = (start, product_position)
+        if key not in self.kept:
+            rows = (row for row in self.rows(start) if keep_row(row, product_position))
+            self.kept = {key: profile_rows(rows, self.shape[1])}
+        return self.kept[key]
+
+def profile_rows(rows, width, sample_size=PROFILE_SAMPLE_SIZE):
+    """
+    Thống kê các cột khi đọc lần lượt từng dòng (như light_convert.profile_columns)
+    Returns: (list ColumnProfile, cờ cột thời lượng tròn ngày của từng cột - xem materialize_values)
+    """
+    counts = [0] * width
+    samples = [[] for _ in range(width)]
+    whole_days = [True] * width
+    for row in rows:
+        for i, value in enumerate(row):
+            if value is not None:
+                counts[i] += 1
+                if len(samples[i]) < sample_size:
+                    samples[i].append(value)
+                if whole_days[i] and not is_whole_days(value):
+                    whole_days[i] = False
+    return ([ColumnProfile(count, values) for count, values in zip(counts, samples)],
+            [flag and count > 0 for flag, count in zip(whole_days, counts)])
+
+def read_workbook_sheets(excel_file):
+    """
+    Đọc workbook một lần (openpyxl read-only) và trả về từng sheet dạng StreamSheet
+    File .xls: đọc bằng pandas qua light_convert rồi chuyển sang StreamSheet
+
+    Yields: (sheet_name, sheet, parse_seconds)
+    """
+    if not str(excel_file).lower().endswith(OPENPYXL_EXTENSIONS):
+        for sheet_name, grid, parse_seconds in light_convert.read_workbook_sheets(excel_file):
+            started = time.perf_counter()
+            sheet = StreamSheet.from_grid(grid)
+            yield sheet_name, sheet, parse_seconds + time.perf_counter() - started
+        return
+
+    workbook = load_workbook(excel_file, read_only=True, data_only=True, keep_links=False)
+    try:
+        for worksheet in workbook.worksheets:
+            started = time.perf_counter()
+            worksheet.reset_dimensions()
+            sheet = StreamSheet.from_worksheet(worksheet)
+            yield worksheet.title, sheet, time.perf_counter() - started
+    finally:
+        workbook.close()
+
+def find_data_start_row(sheet):
+    """Dòng header (xem light_convert.find_data_start_row), chỉ đọc lại các dòng đầu của sheet"""
+    return light_convert.find_data_start_row(sheet.head(HEADER_SCAN_ROWS))
+
+def layout_fingerprint(sheet, sheet_name, start_row, header_rows):
+    """Dấu vân tay bố cục (xem light_convert.layout_fingerprint)"""
+    return light_convert.layout_fingerprint(sheet.head(start_row + header_rows), sheet_name,
+                                            start_row, header_rows)
+
+def detect_sheet_layout(sheet, start_row, sheet_name=None):
+    """
+    Xác định bố cục của sheet - cùng các bước với light_convert.detect_sheet_layout,
+    thống kê cột được tính khi đọc lại lần lượt các dòng dữ liệu
+    """
+    head = sheet.head(start_row + 2)
+    first_header = head.row(start_row)
+    second_row = head.row(start_row + 1) if start_row + 1 < len(sheet) else []
+    headers, header_rows = merge_header_rows(first_header, second_row)
+    start = start_row + header_rows
+
+    # BƯỚC 1: Tìm cột "Tên sản phẩm" hoặc "Products"
+    product_col = find_product_column(headers, lambda: profile_rows(sheet.rows(start), sheet.shape[1])[0])
+    product_position = headers.index(product_col) if product_col else None
+
+    # BƯỚC 2-3: Chỉ thống kê các hàng được giữ, xóa các cột hoàn toàn trống (giữ vị trí gốc)
+    column_profiles, _ = sheet.kept_columns(start, product_position)
+    positions = [i for i, profile in enumerate(column_profiles) if profile.non_null > 0]
+    column_profiles = [column_profiles[i] for i in positions]
+    headers = [headers[i] for i in positions]
+
+    # BƯỚC 4: Tự động xác định và đặt tên cho cột LOT và Units nếu thiếu tiêu đề
+    headers = name_unlabeled_columns(headers, column_profiles)
+
+    # BƯỚC 5: Lọc và sắp xếp các cột theo logic
+    return build_layout(start_row, header_rows, product_position, headers, positions, column_profiles, sheet_name)
+
+def extract_sheet_chunks(sheet, layout, chunk_rows=CHUNK_ROWS):
+    """
+    Lấy dữ liệu sản phẩm theo bố cục đã xác định, lần lượt từng lô chunk_rows dòng
+    Returns: (generator các list products, display_columns)
+    """
+    start = layout['start_row'] + layout['header_rows']
+    product_position = layout['product_column']
+    column_profiles, whole_days = sheet.kept_columns(start, product_position)
+
+    # Chỉ giữ các cột đã chọn còn dữ liệu
+    positions = []
+    display_columns = []
+    for new_name, _, position in layout['columns']:
+        if column_profiles[position].non_null > 0:
+            positions.append(position)
+            display_columns.append(new_name)
+    flags = [whole_days[position] for position in positions]
+    names = list(display_columns)
+
+    def chunks():
+        batch = []
+        for row in sheet.rows(start):
+            if keep_row(row, product_position):
+                batch.append([row[position] for position in positions])
+                if len(batch) >= chunk_rows:
+                    yield build_product_records([list(values) for values in zip(*batch)], names, flags)
+                    batch = []
+        if batch:
+            yield build_product_records([list(values) for values in zip(*batch)], names, flags)
+
+    return chunks(), display_columns
+
+def extract_sheet_data(sheet, layout):
+    """
+    Lấy dữ liệu sản phẩm theo bố cục đã xác định (cả sheet trong bộ nhớ)
+    Returns: (products, display_columns)
+    """
+    chunks, display_columns = extract_sheet_chunks(sheet, layout)
+    return [product for chunk in chunks for product in chunk], display_columns
+
+def store_products(chunks):
+    """Ghi tạm các lô sản phẩm của 1 sheet ra đĩa; kết quả duyệt lại được nhiều lần như list"""
+    products = SpillFile()
+    for chunk in chunks:
+        products.extend(chunk)
+    return products
+
+def convert_excel_to_json(excel_file=None, output_file='inventory_data.json', compact=False,
+                          history_dir=history_store.HISTORY_DIR, db_path=None,
+                          layout_cache_file=LAYOUT_CACHE_FILE,
+                          metrics_file=conversion_metrics.METRICS_FILE, trace_memory=False, split=None,
+                          source_name=None):
+    """
+    Chuyển đổi file Excel sang JSON (tất cả các sheet) theo luồng, bộ nhớ không tăng theo số dòng
+    Tham số: xem convert_core.convert_workbook; products trong kết quả trả về là SpillFile (đọc lại từ đĩa)
+    """
+    return convert_core.convert_workbook(ENGINE, excel_file, output_file, compact=compact,
+                                         history_dir=history_dir, db_path=db_path,
+                                         layout_cache_file=layout_cache_file,
+                                         metrics_file=metrics_file, trace_memory=trace_memory, split=split,
+                                         source_name=source_name)
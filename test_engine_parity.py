@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+import convert_to_json
+import light_convert
+import stream_convert
+from generate_workbook import generate_workbook
+
+ENGINES = {'pandas': convert_to_json, 'openpyxl': light_convert, 'stream': stream_convert}
+
+@pytest.fixture(scope='module')
+def workbook(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('workbook') / '22.12.xlsx')
+    generate_workbook(path, rows_per_sheet=300, seed=7)
+    return path
+
+def convert(engine, workbook, output_file):
+    # Thời hạn sử dụng lấy từ product_config.json của repo, giống khi chạy thật
+    cwd = os.getcwd()
+    os.chdir(ROOT_DIR)
+    try:
+        data = engine.convert_excel_to_json(excel_file=workbook, output_file=output_file, history_dir=None,
+                                            layout_cache_file=None, metrics_file=None)
+    finally:
+        os.chdir(cwd)
+    metadata = {key: value for key, value in data['metadata'].items() if key not in ('metrics', 'last_updated')}
+    # Engine theo luồng trả products dạng SpillFile
+    sheets = [dict(sheet, products=list(sheet['products'])) for sheet in data['sheets']]
+    return metadata, sheets
+
+@pytest.mark.parametrize('name', ['openpyxl', 'stream'])
+def test_engine_matches_pandas(name, workbook, tmp_path):
+    expected_metadata, expected_sheets = convert(ENGINES['pandas'], workbook, str(tmp_path / 'pandas.json'))
+    metadata, sheets = convert(ENGINES[name], workbook, str(tmp_path / f'{name}.json'))
+
+    assert expected_metadata['total_products'] > 0
+    # Có ít nhất 1 sheet có hạn sử dụng để so cả phần tính % còn lại
+    assert any('% Còn lại' in sheet['columns'] for sheet in expected_sheets)
+    assert metadata == expected_metadata
+    assert [sheet['sheet_name'] for sheet in sheets] == [sheet['sheet_name'] for sheet in expected_sheets]
+    for sheet, expected in zip(sheets, expected_sheets):
+        assert sheet == expected, sheet['sheet_name']
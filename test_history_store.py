@@ -0,0 +1,56 @@
+import os
+
+from history_store import HistoryStore
+
+COLUMNS = ['Mã', 'Tên', 'LOT', 'Số lượng tồn', 'Thời hạn (tháng)', '% Còn lại', 'Ngày hết hạn']
+
+def product(code, lot, quantity, percent, expiry):
+    return {'Mã': code, 'Tên': f'Sản phẩm {code}', 'LOT': lot, 'Số lượng tồn': quantity,
+            'Thời hạn (tháng)': 24, '% Còn lại': percent, 'Ngày hết hạn': expiry}
+
+def inventory(date_ton_kho, source_file, products):
+    return {
+        'metadata': {'date_ton_kho': date_ton_kho, 'source_file': source_file, 'total_products': len(products)},
+        'sheets': [{'sheet_name': 'KHO', 'columns': COLUMNS, 'products': products}]
+    }
+
+def test_snapshots_share_rows_and_diff(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history'))
+    first = store.save_snapshot(inventory('22/12/2026', '22.12.xlsx', [
+        product('A1', '2805', 10, 50.0, '28/05/2027'),
+        product('A2', '2806', 5, 40.0, '28/06/2027'),
+        product('A3', '2807', 7, 30.0, '28/07/2027'),
+    ]))
+    # Ngày sau: % Còn lại đổi cho mọi dòng, A1 không đổi số lượng, A2 đổi, A3 hết, A4 mới
+    second = store.save_snapshot(inventory('23/12/2026', '23.12.xlsx', [
+        product('A1', '2805', 10, 49.9, '28/05/2027'),
+        product('A2', '2806', 3, 39.9, '28/06/2027'),
+        product('A4', '2808', 1, 20.0, '28/08/2027'),
+    ]))
+
+    assert first['new_rows'] == 3
+    # Cột tính theo ngày không nằm trong kho dòng: A1 dùng lại dòng cũ
+    assert second['new_rows'] == 2
+
+    result = store.diff('22/12/2026', '23/12/2026')
+    assert result['summary'] == {'added': 1, 'removed': 1, 'changed': 1}
+    sheet = result['sheets']['KHO']
+    assert sheet['changed'] == [{'code': 'A2', 'lot': '2806', 'old_quantity': 5, 'new_quantity': 3, 'delta': -2}]
+    # Dòng được ghép lại đúng như lúc lưu, kèm giá trị tính theo ngày của chính snapshot đó
+    assert sheet['added'] == [{'code': 'A4', 'lot': '2808', 'quantity': 1,
+                               'rows': [product('A4', '2808', 1, 20.0, '28/08/2027')]}]
+    assert sheet['removed'] == [{'code': 'A3', 'lot': '2807', 'quantity': 7,
+                                 'rows': [product('A3', '2807', 7, 30.0, '28/07/2027')]}]
+
+    summary_only = store.diff('22/12/2026', '23/12/2026', include_rows=False)
+    assert 'rows' not in summary_only['sheets']['KHO']['added'][0]
+
+def test_same_date_and_source_overwrites(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history'))
+    data = inventory('22/12/2026', '22.12.xlsx', [product('A1', '2805', 10, 50.0, '28/05/2027')])
+    store.save_snapshot(data)
+    again = store.save_snapshot(data)
+
+    assert again['new_rows'] == 0
+    assert [entry['id'] for entry in store.list_snapshots()] == ['2026-12-22_22.12.xlsx']
+    assert os.listdir(store.snapshots_dir) == ['2026-12-22_22.12.xlsx.json.gz']
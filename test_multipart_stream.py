@@ -0,0 +1,112 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from multipart_stream import parse_multipart
+
+BOUNDARY = 'testboundary123'
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+# 1 byte, nhỏ hơn độ dài boundary, vừa bằng boundary, lớn hơn cả body
+CHUNK_SIZES = [1, 7, len(BOUNDARY) + 4, 64, 64 * 1024]
+
+def build_body(parts, closing=True):
+    """parts: list (name, filename hoặc None, bytes)"""
+    body = b'preamble\r\n'
+    for name, filename, data in parts:
+        body += f'--{BOUNDARY}\r\n'.encode()
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += f'Content-Disposition: {disposition}\r\n'.encode()
+        if filename is not None:
+            body += b'Content-Type: application/octet-stream\r\n'
+        body += b'\r\n' + data + b'\r\n'
+    if closing:
+        body += f'--{BOUNDARY}--\r\nepilogue'.encode()
+    return body
+
+def parse(body, chunk_size, upload_dir=None, content_length=None, **kwargs):
+    rfile = io.BytesIO(body)
+    return rfile, parse_multipart(rfile, CONTENT_TYPE, len(body) if content_length is None else content_length,
+                                  upload_dir=upload_dir, chunk_size=chunk_size, **kwargs)
+
+def part_files(directory):
+    return [name for name in os.listdir(directory) if name.endswith('.part')]
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_file_and_fields(chunk_size, tmp_path):
+    # Nội dung file chứa các đoạn giống boundary để boundary dễ bị cắt ngang giữa 2 chunk
+    data = os.urandom(3000) + f'\r\n--{BOUNDARY[:-1]}'.encode() + b'\r\n--' + os.urandom(500)
+    body = build_body([('note', None, 'ghi chú'.encode()), ('file', 'C:\\Users\\a\\22.12.xlsx', data),
+                       ('empty', None, b'')])
+    rfile, (fields, files) = parse(body, chunk_size, upload_dir=str(tmp_path))
+
+    assert fields == {'note': 'ghi chú', 'empty': ''}
+    uploaded = files['file']
+    assert uploaded.filename == '22.12.xlsx'
+    assert uploaded.size == len(data)
+    assert uploaded.sha256 == hashlib.sha256(data).hexdigest()
+    assert uploaded.file.read() == data
+    # Epilogue đã được đọc hết khỏi kết nối
+    assert rfile.read() == b''
+
+    destination = str(tmp_path / 'saved.xlsx')
+    uploaded.save_as(destination)
+    with open(destination, 'rb') as f:
+        assert f.read() == data
+    assert part_files(tmp_path) == []
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_spooled_file_without_upload_dir(chunk_size):
+    data = b'x' * 5000
+    _, (_, files) = parse(build_body([('file', 'a.xlsx', data)]), chunk_size)
+    assert files['file'].path is None
+    assert files['file'].file.read() == data
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_max_files_drops_extra_parts(chunk_size, tmp_path):
+    body = build_body([('file', 'a.xlsx', b'first'), ('other', 'b.xlsx', b'second'),
+                       ('note', None, b'after')])
+    _, (fields, files) = parse(body, chunk_size, upload_dir=str(tmp_path), max_files=1)
+
+    assert list(files) == ['file']
+    assert files['file'].file.read() == b'first'
+    assert fields == {'note': 'after'}
+    files['file'].discard()
+    assert part_files(tmp_path) == []
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_duplicate_field_name_keeps_first_file(chunk_size, tmp_path):
+    body = build_body([('file', 'a.xlsx', b'first'), ('file', 'b.xlsx', b'second')])
+    _, (_, files) = parse(body, chunk_size, upload_dir=str(tmp_path))
+
+    assert files['file'].filename == 'a.xlsx'
+    assert files['file'].file.read() == b'first'
+    files['file'].discard()
+    assert part_files(tmp_path) == []
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_truncated_body_removes_partial_file(chunk_size, tmp_path):
+    body = build_body([('file', 'a.xlsx', b'y' * 4000)])
+    truncated = body[:len(body) // 2]
+    # Client ngắt kết nối: Content-Length lớn hơn số byte nhận được
+    with pytest.raises(ValueError):
+        parse(truncated, chunk_size, upload_dir=str(tmp_path), content_length=len(body))
+    assert part_files(tmp_path) == []
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_missing_closing_boundary(chunk_size, tmp_path):
+    body = build_body([('file', 'a.xlsx', b'z' * 1000)], closing=False)
+    with pytest.raises(ValueError):
+        parse(body, chunk_size, upload_dir=str(tmp_path))
+    assert part_files(tmp_path) == []
+
+def test_body_without_boundary():
+    with pytest.raises(ValueError):
+        parse(b'no multipart here', 16)
+
+def test_invalid_content_type():
+    with pytest.raises(ValueError):
+        parse_multipart(io.BytesIO(b''), 'application/json', 0)
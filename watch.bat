@@ -0,0 +1,4 @@
+@echo off
+echo Watching for new Excel files...
+python convert_to_json.py --watch
+pause
@@ -0,0 +1,197 @@
+"""
+Theo dõi thư mục dữ liệu và tự chuyển đổi khi có file Excel mới (convert_to_json.py --watch)
+- Linux: inotify (qua ctypes, không cần thư viện ngoài), nhận sự kiện ngay khi file được ghi xong / đổi tên vào
+- Nơi khác (Windows, macOS, thư mục mạng) hoặc --poll: quét thư mục định kỳ, so sánh (mtime, size)
+File đang ghi dở được chờ đến khi không đổi trong SETTLE_SECONDS giây; file khóa ~$ của Excel và file ẩn bị bỏ qua
+Chỉ file vừa đến được chuyển đổi (không glob lại cả thư mục như find_excel_file); kết quả được ghi nguyên tử
+nên website / server không bao giờ đọc phải file ghi dở
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+import zipfile
+
+EXCEL_SUFFIXES = ('.xlsx', '.xls')
+SETTLE_SECONDS = 2.0  # File không đổi trong chừng này giây mới được coi là ghi xong
+POLL_INTERVAL = 1.0  # giây giữa 2 lần quét thư mục (khi không dùng được inotify)
+
+# Hằng số trong <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len (tên file theo sau, đệm \0)
+
+def is_workbook(name):
+    """File Excel cần chuyển đổi: bỏ file khóa ~$ (Excel đang mở file) và file ẩn / file tạm"""
+    return name.lower().endswith(EXCEL_SUFFIXES) and not name.startswith(('~$', '.'))
+
+def file_signature(path):
+    """(mtime, size) của file, None nếu file không còn"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def is_complete(path):
+    """
+    .xlsx là file zip, mục lục nằm ở cuối file -> đọc được mục lục nghĩa là đã ghi xong
+    .xls không kiểm tra được, chỉ dựa vào thời gian chờ
+    """
+    if path.lower().endswith('.xlsx'):
+        return zipfile.is_zipfile(path)
+    return True
+
+class PollingWatcher:
+    """Quét thư mục mỗi interval giây, báo các file mới hoặc có (mtime, size) thay đổi"""
+    def __init__(self, directory, interval=POLL_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    pass
+        return snapshot
+
+    def changes(self, timeout=None):
+        """Chờ tối đa timeout giây (None: đến lần quét sau), trả về tên các file đã thay đổi"""
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        snapshot = self.scan()
+        changed = {name for name, signature in snapshot.items() if self.snapshot.get(name) != signature}
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """
+    Nhận sự kiện inotify của thư mục (Linux); OSError nếu hệ thống không hỗ trợ
+    Tràn hàng đợi sự kiện (IN_Q_OVERFLOW) -> báo mọi file trong thư mục để kiểm tra lại
+    """
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+
+    def __init__(self, directory):
+        self.directory = directory
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify không có trên hệ thống này')
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 thất bại')
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'Không theo dõi được thư mục {directory}')
+
+    def changes(self, timeout=None):
+        """Chờ sự kiện tối đa timeout giây (None: chờ đến khi có), trả về tên các file có sự kiện"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(buffer):
+            _, mask, _, length = _EVENT.unpack_from(buffer, offset)
+            offset += _EVENT.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                changed.update(os.listdir(self.directory))
+            elif name:
+                changed.add(os.fsdecode(name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+def open_watcher(directory, poll=False, interval=POLL_INTERVAL):
+    """inotify nếu được, không thì quét định kỳ"""
+    if not poll:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            print(f"⚠ Không dùng được inotify ({e}), chuyển sang quét thư mục mỗi {interval:g}s")
+    return PollingWatcher(directory, interval)
+
+def watch_folder(convert, directory='.', settle=SETTLE_SECONDS, poll=False, interval=POLL_INTERVAL):
+    """
+    Theo dõi directory (không gồm thư mục con), gọi convert(đường dẫn file) cho mỗi file Excel mới đến
+    hoặc được ghi đè, sau khi file không đổi trong settle giây
+    Các file đã có lúc bắt đầu không được chuyển đổi lại; lỗi chuyển đổi chỉ được in ra, vẫn tiếp tục theo dõi
+    Chạy đến khi bị dừng (Ctrl+C)
+    """
+    watcher = open_watcher(directory, poll, interval)
+    mode = 'inotify' if isinstance(watcher, InotifyWatcher) else f'quét mỗi {interval:g}s'
+    print(f"👀 Đang theo dõi {os.path.abspath(directory)} ({mode}), nhấn Ctrl+C để dừng")
+
+    # File -> (mtime, size) đã xử lý; file đang chờ ghi xong -> ((mtime, size), thời điểm đổi gần nhất)
+    processed = {}
+    for name in os.listdir(directory):
+        if is_workbook(name):
+            processed[name] = file_signature(os.path.join(directory, name))
+    pending = {}
+
+    try:
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(0.1, min(since for _, since in pending.values()) + settle - time.monotonic())
+            changed = watcher.changes(timeout)
+            now = time.monotonic()
+            for name in changed:
+                if is_workbook(name):
+                    pending[name] = (file_signature(os.path.join(directory, name)), now)
+
+            ready = []
+            for name, (signature, since) in list(pending.items()):
+                path = os.path.normpath(os.path.join(directory, name))
+                current = file_signature(path)
+                if current is None:
+                    # Bị xóa hoặc đổi tên đi trước khi ghi xong
+                    del pending[name]
+                elif current != signature:
+                    pending[name] = (current, now)
+                elif now - since >= settle:
+                    del pending[name]
+                    if processed.get(name) == current:
+                        continue
+                    processed[name] = current
+                    if is_complete(path):
+                        ready.append((current, name))
+                    else:
+                        # Ghi tiếp thì sẽ có sự kiện mới (mtime, size khác) và được kiểm tra lại
+                        print(f"⚠ Bỏ qua {name}: file chưa hoàn chỉnh hoặc bị hỏng")
+
+            # Nhiều file cùng lúc: file mới nhất chuyển đổi sau cùng (như find_excel_file chọn file mới nhất)
+            for _, name in sorted(ready):
+                print(f"\n📥 File mới: {name}")
+                try:
+                    convert(os.path.normpath(os.path.join(directory, name)))
+                except Exception as e:
+                    print(f"✗ Chuyển đổi {name} thất bại: {e}")
+    except KeyboardInterrupt:
+        print("\n👋 Đã dừng theo dõi")
+    finally:
+        watcher.close()